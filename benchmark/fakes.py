@@ -0,0 +1,295 @@
+# fakes.py
+"""Contains lightweight stand-ins for the discord objects the detection cogs use, so recorded messages can be replayed
+without a connection to Discord.
+
+The objects only provide the attributes and methods the cogs actually use. Everything that would talk to Discord
+(sending, replying, reacting, editing) is counted instead. Embeds are real discord.Embed objects, they don't need a
+connection and are created from the same dicts the Discord API sends.
+"""
+
+import asyncio
+from collections import deque
+from datetime import datetime, timezone
+import sys
+from typing import Any, Deque, Dict, List, NamedTuple, Optional
+
+import discord
+
+
+MESSAGES_PER_CHANNEL = 50
+
+
+class FakeAsset(NamedTuple):
+    """Avatar of a user"""
+    url: str
+
+
+class FakeUser():
+    """User or member. The same object is used as member in every guild."""
+    def __init__(self, user_id: int, name: str, global_name: Optional[str] = None, bot: bool = False) -> None:
+        self.id = user_id
+        self.name = name
+        self.global_name = global_name
+        self.bot = bot
+        self.display_avatar = self.avatar = FakeAsset(f'https://cdn.discordapp.com/embed/avatars/{user_id % 5}.png')
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, FakeUser) and other.id == self.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    @property
+    def display_name(self) -> str:
+        return self.global_name if self.global_name is not None else self.name
+
+    @property
+    def mention(self) -> str:
+        return f'<@{self.id}>'
+
+
+class FakeButton(NamedTuple):
+    """Button in an action row"""
+    custom_id: Optional[str]
+    label: Optional[str]
+    emoji: Optional[str]
+    disabled: bool
+    url: Optional[str]
+
+
+class FakeActionRow(NamedTuple):
+    """Action row of a message"""
+    children: tuple
+
+
+class FakeReference(NamedTuple):
+    """Reference to the message a message replies to"""
+    message_id: int
+    cached_message: Optional['FakeMessage']
+
+
+class FakeInteraction(NamedTuple):
+    """Interaction of a message that was sent in response to a slash command"""
+    user: FakeUser
+    name: str
+
+
+class FakeHistory():
+    """Result of channel.history(). Supports both flatten() and async iteration."""
+    def __init__(self, messages: List['FakeMessage']) -> None:
+        self.messages = messages
+
+    async def flatten(self) -> List['FakeMessage']:
+        return self.messages
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for message in self.messages:
+            yield message
+
+
+class Counters():
+    """Counts everything the cogs would have sent to Discord"""
+    def __init__(self) -> None:
+        self.sends = 0
+        self.reactions = 0
+        self.edits = 0
+        self.deletes = 0
+
+
+class FakeGuild():
+    """Guild with all members loaded"""
+    def __init__(self, guild_id: int, bot_user: FakeUser) -> None:
+        self.id = guild_id
+        self.name = f'Guild {guild_id}'
+        self.me = bot_user
+        self.chunked = True
+        self.system_channel = None
+        self._members: Dict[int, FakeUser] = {}
+
+    @property
+    def members(self) -> List[FakeUser]:
+        return list(self._members.values())
+
+    def add_member(self, user: FakeUser) -> None:
+        self._members[user.id] = user
+
+    def get_member(self, user_id: int) -> Optional[FakeUser]:
+        return self._members.get(user_id, None)
+
+
+class FakeChannel():
+    """Text channel that keeps the last messages for history() and fetch_message()"""
+    def __init__(self, channel_id: int, guild: FakeGuild, bot_user: FakeUser, counters: Counters) -> None:
+        self.id = channel_id
+        self.name = f'channel-{channel_id}'
+        self.guild = guild
+        self.type = discord.ChannelType.text
+        self.bot_user = bot_user
+        self.counters = counters
+        self.messages: Deque['FakeMessage'] = deque(maxlen=MESSAGES_PER_CHANNEL)
+        self._message_ids = iter(range(channel_id * 1_000_000, channel_id * 1_000_000 + 1_000_000))
+
+    @property
+    def mention(self) -> str:
+        return f'<#{self.id}>'
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> 'FakeMessage':
+        self.counters.sends += 1
+        embeds = kwargs.get('embeds') or ([kwargs['embed']] if kwargs.get('embed') is not None else [])
+        message = FakeMessage(next(self._message_ids), self, self.bot_user, content or '', embeds=embeds)
+        self.messages.append(message)
+        return message
+
+    async def fetch_message(self, message_id: int) -> Optional['FakeMessage']:
+        for message in self.messages:
+            if message.id == message_id: return message
+        return None
+
+    def history(self, limit: int = 100) -> FakeHistory:
+        return FakeHistory(list(reversed(self.messages))[:limit])
+
+    async def trigger_typing(self) -> None:
+        return
+
+
+class FakeMessage():
+    """Message in a channel"""
+    def __init__(self, message_id: int, channel: FakeChannel, author: FakeUser, content: str,
+                 embeds: Optional[List[discord.Embed]] = None, components: Optional[List[FakeActionRow]] = None,
+                 mentions: Optional[List[FakeUser]] = None, reference: Optional[FakeReference] = None,
+                 interaction: Optional[FakeInteraction] = None) -> None:
+        self.id = message_id
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.embeds = embeds if embeds is not None else []
+        self.components = components if components is not None else []
+        self.mentions = mentions if mentions is not None else []
+        self.reference = reference
+        self.interaction = interaction
+        self.created_at = datetime.now(timezone.utc)
+        self.edited_at = None
+        self.pinned = False
+        self.attachments = []
+        self.stickers = []
+        self.reactions = []
+
+    @property
+    def jump_url(self) -> str:
+        return f'https://discord.com/channels/{self.guild.id}/{self.channel.id}/{self.id}'
+
+    async def add_reaction(self, emoji: Any) -> None:
+        self.channel.counters.reactions += 1
+
+    async def remove_reaction(self, emoji: Any, member: Any) -> None:
+        return
+
+    async def clear_reactions(self) -> None:
+        return
+
+    async def reply(self, content: Optional[str] = None, **kwargs) -> 'FakeMessage':
+        return await self.channel.send(content, **kwargs)
+
+    async def edit(self, **kwargs) -> 'FakeMessage':
+        self.channel.counters.edits += 1
+        if 'content' in kwargs: self.content = kwargs['content']
+        if kwargs.get('embed') is not None: self.embeds = [kwargs['embed']]
+        return self
+
+    async def delete(self, **kwargs) -> None:
+        self.channel.counters.deletes += 1
+
+
+class FakeBot():
+    """Bot with the attributes the cogs and the dispatcher use. Holds the loaded cogs, all guilds, channels and users
+    and the tasks the cogs started."""
+    def __init__(self, bot_user: FakeUser) -> None:
+        self.user = bot_user
+        self.counters = Counters()
+        self.cogs: Dict[str, discord.Cog] = {}
+        self.application_commands = []
+        self.users: Dict[int, FakeUser] = {bot_user.id: bot_user}
+        self.guilds_by_id: Dict[int, FakeGuild] = {}
+        self.channels: Dict[int, FakeChannel] = {}
+        self.tasks: List[asyncio.Task] = []
+        self.handler_errors: List[BaseException] = []
+
+    @property
+    def loop(self) -> 'FakeBot':
+        """The cogs only use bot.loop.create_task, so the bot tracks the tasks itself"""
+        return self
+
+    @property
+    def guilds(self) -> List[FakeGuild]:
+        return list(self.guilds_by_id.values())
+
+    def create_task(self, coroutine) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self.tasks.append(task)
+        return task
+
+    def add_cog(self, cog: discord.Cog) -> None:
+        self.cogs[cog.qualified_name] = cog
+
+    def get_cog(self, name: str) -> Optional[discord.Cog]:
+        return self.cogs.get(name, None)
+
+    def dispatch(self, event_name: str, *args) -> None:
+        """Starts all listeners of an event the same way the bot does"""
+        for cog in self.cogs.values():
+            for listener_name, listener in cog.get_listeners():
+                if listener_name == f'on_{event_name}': self.create_task(listener(*args))
+
+    async def on_error(self, event: str, *args, **kwargs) -> None:
+        self.handler_errors.append(sys.exc_info()[1])
+
+    async def wait_for(self, *args, **kwargs) -> None:
+        raise asyncio.TimeoutError
+
+    async def wait_until_ready(self) -> None:
+        return
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return self.guilds_by_id.get(guild_id, None)
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return self.channels.get(channel_id, None)
+
+    async def fetch_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return self.channels.get(channel_id, None)
+
+    def get_user(self, user_id: int) -> Optional[FakeUser]:
+        return self.users.get(user_id, None)
+
+    async def fetch_user(self, user_id: int) -> Optional[FakeUser]:
+        return self.users.get(user_id, None)
+
+    def get_emoji(self, emoji_id: int) -> None:
+        return None
+
+    def get_application_command(self, *args, **kwargs) -> None:
+        return None
+
+    def get_or_create_user(self, user_id: int, name: str, global_name: Optional[str] = None,
+                           bot: bool = False) -> FakeUser:
+        user = self.users.get(user_id, None)
+        if user is None: user = self.users[user_id] = FakeUser(user_id, name, global_name, bot)
+        return user
+
+    def get_or_create_guild(self, guild_id: int) -> FakeGuild:
+        guild = self.guilds_by_id.get(guild_id, None)
+        if guild is None:
+            guild = self.guilds_by_id[guild_id] = FakeGuild(guild_id, self.user)
+            guild.add_member(self.user)
+        return guild
+
+    def get_or_create_channel(self, channel_id: int, guild_id: int) -> FakeChannel:
+        channel = self.channels.get(channel_id, None)
+        if channel is None:
+            channel = self.channels[channel_id] = FakeChannel(channel_id, self.get_or_create_guild(guild_id),
+                                                              self.user, self.counters)
+        return channel
@@ -0,0 +1,448 @@
+# replay.py
+"""Replays a corpus of recorded EPIC RPG messages through the detection cogs and reports how fast they are handled.
+
+Usage: python -m benchmark.replay CORPUS [--allocations] [--json FILE] [--baseline FILE] [--max-regression PERCENT]
+
+The replay runs without a connection to Discord on a temporary copy of database/default_db.db, so it can be run
+anywhere and never touches navi_db.db. The log is written to logs/replay.log instead of logs/discord.log.
+All cogs bot.py loads are loaded into a fake bot and every message is sent through the same listeners a real message
+would go through, including the dispatcher and the message cache. Messages are replayed one after another; the next
+message is sent when all handlers of the previous one are done. Work the handlers leave to run later on purpose
+(delayed ready commands, the delivery queue and writing errors) is not waited for after every message, as it
+sleeps for AUTO_READY_DELAY, DELIVERY_COALESCE_WINDOW or ERROR_FLUSH_DELAY first. It is waited for once after the
+last message instead, so its database statements are counted, but its time is not part of the throughput and latency.
+
+Reported are messages per second for the whole replay and per cog, database statements per message and, with
+--allocations, the memory allocated during the replay. --allocations traces every allocation, which makes the replay
+a lot slower, so don't compare its throughput with a normal run.
+With --json, the results are written to a file. With --baseline, the results are compared to such a file and the
+exit code is 1 if messages per second dropped or statements per message rose by more than --max-regression percent.
+
+The corpus is a JSONL file with one record per line, replayed in order:
+{"type": "user", "user_id": 1, "name": "miriel", "guild_id": 2, "settings": {"reactions_enabled": true}}
+    Registers a user in the database, updates the given user settings and adds the user to the guild.
+{"type": "guild", "guild_id": 2, "settings": {"auto_flex_enabled": true}}
+    Updates the settings of a guild.
+{"type": "message", "id": 10, "channel_id": 3, "guild_id": 2, "author": {"id": 1, "name": "miriel"},
+ "content": "rpg hunt", "embeds": [], "components": [], "mentions": [], "reference": null, "interaction": null}
+    A new message. author can have global_name and bot, mentions is a list of user ids. embeds are embed dicts in the
+    format of the Discord API. components is a list of action rows, every row a list of buttons with custom_id,
+    label, emoji, disabled and url. reference is the id of the message this replies to. interaction is the slash
+    command that triggered the message: {"user_id": 1, "name": "hunt"}.
+{"type": "edit", "id": 10, "content": "...", "embeds": [...], "components": [...]}
+    Edits a message that was replayed before. Only the given keys are changed.
+Users that are only mentioned by id have to be defined by a user record or as the author of an earlier message.
+User and guild records are applied before the replay starts and are not measured.
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+import discord
+
+from benchmark.fakes import (FakeActionRow, FakeBot, FakeButton, FakeInteraction, FakeMessage, FakeReference,
+                             FakeUser)
+
+
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB_FILE = os.path.join(BOT_DIR, 'database/default_db.db')
+LOG_FILE = os.path.join(BOT_DIR, 'logs/replay.log')
+EXCLUDED_COGS = ('feedback', 'horse_festival') # Not loaded by bot.py by default
+NAVI_USER_ID = 1
+ENV_DEFAULTS = {
+    'DISCORD_TOKEN': 'replay',
+    'OWNER_ID': '0',
+    'DEV_GUILDS': '0',
+}
+
+
+def load_corpus(file_name: str) -> List[Dict[str, Any]]:
+    """Reads all records of a corpus file. Empty lines are ignored."""
+    records = []
+    with open(file_name, encoding='utf-8') as corpus_file:
+        for line_number, line in enumerate(corpus_file, start=1):
+            if not line.strip(): continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as error:
+                raise ValueError(f'Line {line_number} of {file_name} is not valid JSON: {error}') from error
+            if record.get('type') not in ('user', 'guild', 'message', 'edit'):
+                raise ValueError(f'Line {line_number} of {file_name} has an unknown type: {record.get("type")}')
+            records.append(record)
+    return records
+
+
+def prepare_database(temp_dir: str) -> str:
+    """Copies the default database to the temp dir and points resources.settings to it. Has to run before anything
+    imports resources.settings.
+
+    Returns
+    -------
+    Name of the database file.
+    """
+    db_file = os.path.join(temp_dir, 'navi_db.db')
+    shutil.copyfile(DEFAULT_DB_FILE, db_file)
+    os.environ['NAVI_DB_FILE'] = db_file
+    for name, value in ENV_DEFAULTS.items():
+        if not os.getenv(name): os.environ[name] = value
+    return db_file
+
+
+def load_cogs(bot: FakeBot) -> None:
+    """Loads all cogs bot.py loads by default"""
+    cog_names = sorted(file_name[:-3] for file_name in os.listdir(os.path.join(BOT_DIR, 'cogs'))
+                       if file_name.endswith('.py') and file_name != '__init__.py')
+    for cog_name in cog_names:
+        if cog_name in EXCLUDED_COGS: continue
+        importlib.import_module(f'cogs.{cog_name}').setup(bot)
+
+
+class Replay():
+    """Turns corpus records into fake messages and sends them to the cogs"""
+    def __init__(self, bot: FakeBot) -> None:
+        self.bot = bot
+        self.messages: Dict[int, FakeMessage] = {}
+        self.message_count = 0
+        self.edit_count = 0
+        self.durations: List[float] = []
+
+    def get_user(self, author: Dict[str, Any], guild_id: Optional[int] = None) -> FakeUser:
+        user = self.bot.get_or_create_user(int(author['id']), author.get('name', str(author['id'])),
+                                           author.get('global_name', None), author.get('bot', False))
+        if guild_id is not None and not user.bot: self.bot.get_or_create_guild(guild_id).add_member(user)
+        return user
+
+    def apply_message_data(self, message: FakeMessage, record: Dict[str, Any]) -> None:
+        """Sets content, embeds and components from a record"""
+        if 'content' in record: message.content = record['content'] or ''
+        if 'embeds' in record: message.embeds = [discord.Embed.from_dict(embed) for embed in record['embeds'] or []]
+        if 'components' in record:
+            message.components = [
+                FakeActionRow(tuple(FakeButton(button.get('custom_id'), button.get('label'), button.get('emoji'),
+                                               button.get('disabled', False), button.get('url'))
+                                    for button in row))
+                for row in record['components'] or []
+            ]
+
+    async def setup(self, records: List[Dict[str, Any]]) -> None:
+        """Applies all user and guild records"""
+        from database import guilds, users
+        from resources import exceptions
+        for record in records:
+            if record['type'] == 'user':
+                user_id = int(record['user_id'])
+                guild_id = int(record['guild_id']) if record.get('guild_id') is not None else None
+                self.get_user({'id': user_id, 'name': record.get('name', str(user_id))}, guild_id)
+                try:
+                    user_settings = await users.get_user(user_id)
+                except exceptions.FirstTimeUserError:
+                    user_settings = await users.insert_user(user_id)
+                if record.get('settings'): await user_settings.update(**record['settings'])
+            elif record['type'] == 'guild':
+                self.bot.get_or_create_guild(int(record['guild_id']))
+                if record.get('settings'):
+                    guild_settings = await guilds.get_guild(int(record['guild_id']))
+                    await guild_settings.update(**record['settings'])
+
+    def build_message(self, record: Dict[str, Any]) -> FakeMessage:
+        guild_id = int(record['guild_id'])
+        channel = self.bot.get_or_create_channel(int(record['channel_id']), guild_id)
+        author = self.get_user(record['author'], guild_id)
+        reference = None
+        if record.get('reference') is not None:
+            reference = FakeReference(int(record['reference']), self.messages.get(int(record['reference']), None))
+        interaction = None
+        if record.get('interaction') is not None:
+            interaction_user = self.bot.get_user(int(record['interaction']['user_id']))
+            interaction = FakeInteraction(interaction_user, record['interaction'].get('name', ''))
+        mentions = [self.bot.get_user(int(user_id)) for user_id in record.get('mentions') or []]
+        message = FakeMessage(int(record['id']), channel, author, '', mentions=[user for user in mentions if user],
+                              reference=reference, interaction=interaction)
+        self.apply_message_data(message, record)
+        return message
+
+    def build_edit(self, record: Dict[str, Any]) -> Optional[FakeMessage]:
+        message_before = self.messages.get(int(record['id']), None)
+        if message_before is None: return None
+        message_after = FakeMessage(message_before.id, message_before.channel, message_before.author,
+                                    message_before.content, list(message_before.embeds),
+                                    list(message_before.components), message_before.mentions,
+                                    message_before.reference, message_before.interaction)
+        message_after.created_at = message_before.created_at
+        self.apply_message_data(message_after, record)
+        return message_after
+
+    async def wait_for_handlers(self) -> None:
+        """Waits until all tasks the listeners and handlers started are done"""
+        while self.bot.tasks:
+            tasks = self.bot.tasks
+            self.bot.tasks = []
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def wait_for_background_tasks(self) -> None:
+        """Waits until all other tasks on the loop are done, including the ones that weren't started by the bot"""
+        current_task = asyncio.current_task()
+        while True:
+            tasks = [task for task in asyncio.all_tasks() if task is not current_task]
+            if not tasks: break
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def run(self, records: List[Dict[str, Any]]) -> float:
+        """Replays all message and edit records.
+
+        Returns
+        -------
+        Seconds the replay took.
+        """
+        start_time = time.perf_counter()
+        for record in records:
+            message_start_time = time.perf_counter()
+            if record['type'] == 'message':
+                message = self.build_message(record)
+                message.channel.messages.append(message)
+                self.messages[message.id] = message
+                self.message_count += 1
+                self.bot.dispatch('message', message)
+            elif record['type'] == 'edit':
+                message_after = self.build_edit(record)
+                if message_after is None: continue
+                message_before = self.messages[message_after.id]
+                self.messages[message_after.id] = message_after
+                self.edit_count += 1
+                self.bot.dispatch('message_edit', message_before, message_after)
+            else:
+                continue
+            await self.wait_for_handlers()
+            self.durations.append(time.perf_counter() - message_start_time)
+        return time.perf_counter() - start_time
+
+
+class StatementCounter():
+    """Counts the statements executed on a database connection. Used as trace callback."""
+    def __init__(self) -> None:
+        self.reads = 0
+        self.writes = 0
+        self.other = 0
+
+    def __call__(self, sql: str) -> None:
+        statement = sql.lstrip()[:6].upper()
+        if statement == 'SELECT':
+            self.reads += 1
+        elif statement in ('INSERT', 'UPDATE', 'DELETE', 'REPLAC'):
+            self.writes += 1
+        else:
+            self.other += 1
+
+    @property
+    def total(self) -> int:
+        return self.reads + self.writes + self.other
+
+
+def get_quantile(values: List[float], quantile: float) -> float:
+    if not values: return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(quantile * len(values)))]
+
+
+async def replay(records: List[Dict[str, Any]], trace_allocations: bool) -> Dict[str, Any]:
+    """Loads the cogs, replays the corpus and returns the results"""
+    from database import errors
+    from resources import metrics, settings
+
+    bot = FakeBot(FakeUser(NAVI_USER_ID, 'Navi', bot=True))
+    asyncio.get_running_loop().set_exception_handler(
+        lambda loop, context: bot.handler_errors.append(context.get('exception', context.get('message')))
+    )
+    load_cogs(bot)
+    replay_run = Replay(bot)
+    await replay_run.setup(records)
+
+    statement_counter = StatementCounter()
+    connections = [settings.NAVI_DB]
+    if settings.NAVI_DB.read_connection is not None: connections.append(settings.NAVI_DB.read_connection)
+    for connection in connections:
+        connection.set_trace_callback(statement_counter)
+    metrics.reset()
+    if trace_allocations:
+        tracemalloc.start(10)
+        snapshot_before = tracemalloc.take_snapshot()
+    elapsed_time = await replay_run.run(records)
+    await replay_run.wait_for_background_tasks()
+    if trace_allocations:
+        snapshot_after = tracemalloc.take_snapshot()
+        current_size, peak_size = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    for connection in connections:
+        connection.set_trace_callback(None)
+
+    await errors.flush_errors()
+
+    event_count = replay_run.message_count + replay_run.edit_count
+    results = {
+        'messages': replay_run.message_count,
+        'edits': replay_run.edit_count,
+        'seconds': elapsed_time,
+        'messages_per_second': event_count / elapsed_time if elapsed_time > 0 else 0.0,
+        'latency_p50': get_quantile(replay_run.durations, 0.5),
+        'latency_p95': get_quantile(replay_run.durations, 0.95),
+        'latency_max': max(replay_run.durations, default=0.0),
+        'statements': statement_counter.total,
+        'statements_per_message': statement_counter.total / event_count if event_count else 0.0,
+        'reads_per_message': statement_counter.reads / event_count if event_count else 0.0,
+        'writes_per_message': statement_counter.writes / event_count if event_count else 0.0,
+        'sends': bot.counters.sends,
+        'reactions': bot.counters.reactions,
+        'edits_sent': bot.counters.edits,
+        'handler_errors': len(bot.handler_errors),
+        'message_cache_lookups': dict(metrics.get_counters(metrics.MESSAGE_CACHE_LOOKUPS)),
+        'cogs': {},
+    }
+    for cog_name, histogram in sorted(metrics.get_histograms(metrics.HANDLER_DURATION).items()):
+        results['cogs'][cog_name] = {
+            'calls': histogram.count,
+            'seconds': histogram.sum,
+            'messages_per_second': histogram.count / histogram.sum if histogram.sum > 0 else 0.0,
+            'average': histogram.average,
+            'p95': histogram.quantile(0.95),
+        }
+    if trace_allocations:
+        statistics = snapshot_after.compare_to(snapshot_before, 'lineno')
+        results['allocations'] = {
+            'peak_bytes': peak_size,
+            'net_bytes': current_size,
+            'net_blocks': sum(statistic.count_diff for statistic in statistics),
+            'net_bytes_per_message': current_size / event_count if event_count else 0.0,
+            'top': [
+                {'location': str(statistic.traceback[0]), 'size_diff': statistic.size_diff,
+                 'count_diff': statistic.count_diff}
+                for statistic in statistics[:10]
+            ],
+        }
+    return results
+
+
+def format_results(results: Dict[str, Any]) -> str:
+    """Returns the results as text for the console"""
+    lines = [
+        f'Messages: {results["messages"]:,}, edits: {results["edits"]:,}, took {results["seconds"]:,.3f} s',
+        f'Throughput: {results["messages_per_second"]:,.1f} messages/s',
+        f'Latency: p50 {results["latency_p50"] * 1000:,.2f} ms, p95 {results["latency_p95"] * 1000:,.2f} ms, '
+        f'max {results["latency_max"] * 1000:,.2f} ms',
+        f'Database: {results["statements"]:,} statements, {results["statements_per_message"]:,.2f} per message '
+        f'({results["reads_per_message"]:,.2f} reads, {results["writes_per_message"]:,.2f} writes)',
+        f'Output: {results["sends"]:,} sends, {results["reactions"]:,} reactions, {results["edits_sent"]:,} edits',
+        f'Handler errors: {results["handler_errors"]:,}',
+        f'Message cache lookups: '
+        + (', '.join(f'{count:,} {result}' for result, count in sorted(results['message_cache_lookups'].items()))
+           or '-'),
+        '',
+        f'{"Cog":<28}{"Calls":>8}{"Total ms":>12}{"Avg ms":>10}{"p95 ms":>10}{"Msg/s":>12}',
+    ]
+    cogs = sorted(results['cogs'].items(), key=lambda item: item[1]['seconds'], reverse=True)
+    for cog_name, cog_results in cogs:
+        lines.append(
+            f'{cog_name:<28}{cog_results["calls"]:>8,}{cog_results["seconds"] * 1000:>12,.2f}'
+            f'{cog_results["average"] * 1000:>10,.3f}{cog_results["p95"] * 1000:>10,.3f}'
+            f'{cog_results["messages_per_second"]:>12,.1f}'
+        )
+    allocations = results.get('allocations', None)
+    if allocations is not None:
+        lines += [
+            '',
+            f'Allocations: peak {allocations["peak_bytes"] / 1024:,.1f} KB, '
+            f'retained {allocations["net_bytes"] / 1024:,.1f} KB in {allocations["net_blocks"]:,} blocks '
+            f'({allocations["net_bytes_per_message"]:,.0f} bytes per message)',
+        ]
+        for allocation in allocations['top']:
+            lines.append(
+                f'  {allocation["size_diff"] / 1024:>10,.1f} KB {allocation["count_diff"]:>8,} blocks  '
+                f'{allocation["location"]}'
+            )
+    return '\n'.join(lines)
+
+
+def compare_results(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Compares the results to a baseline.
+
+    Returns
+    -------
+    List with a description of every regression. Empty if there is none.
+    """
+    regressions = []
+    factor = max_regression / 100
+    if results['messages_per_second'] < baseline['messages_per_second'] * (1 - factor):
+        regressions.append(
+            f'Throughput dropped from {baseline["messages_per_second"]:,.1f} to '
+            f'{results["messages_per_second"]:,.1f} messages/s'
+        )
+    if results['statements_per_message'] > baseline['statements_per_message'] * (1 + factor):
+        regressions.append(
+            f'Statements per message rose from {baseline["statements_per_message"]:,.2f} to '
+            f'{results["statements_per_message"]:,.2f}'
+        )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Replays recorded messages through the detection cogs.')
+    parser.add_argument('corpus', help='JSONL file with the recorded messages')
+    parser.add_argument('--allocations', action='store_true', help='Trace memory allocations (slow)')
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--baseline', help='Compare the results to this results file')
+    parser.add_argument('--max-regression', type=float, default=10,
+                        help='Percent throughput and statements per message may regress. Defaults to 10.')
+    arguments = parser.parse_args()
+    records = load_corpus(arguments.corpus)
+
+    temp_dir = tempfile.mkdtemp(prefix='navi_replay_')
+    try:
+        prepare_database(temp_dir)
+        from database import update_database
+        from resources import logs, settings
+        logs.logger.removeHandler(logs.handler)
+        logs.handler.close()
+        replay_handler = logging.FileHandler(LOG_FILE, mode='w', encoding='utf-8')
+        replay_handler.setFormatter(logs.handler.formatter)
+        logs.logger.addHandler(replay_handler)
+        try:
+            if not update_database.update_database():
+                print('Database update of the temporary database failed.')
+                return 1
+        except sqlite3.Error as error:
+            print(f'Database update of the temporary database failed: {error}')
+            return 1
+        try:
+            results = asyncio.run(replay(records, arguments.allocations))
+        finally:
+            settings.NAVI_DB.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    print(format_results(results))
+    if arguments.json:
+        with open(arguments.json, 'w', encoding='utf-8') as results_file:
+            json.dump(results, results_file, indent=2)
+    if arguments.baseline:
+        with open(arguments.baseline, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_results(results, baseline, arguments.max_regression)
+        if regressions:
+            print('\nRegressions:\n' + '\n'.join(regressions))
+            return 1
+        print('\nNo regressions.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,6 @@
 # bot.py
 
+import asyncio
 from datetime import datetime
 import sqlite3
 import sys
@@ -114,6 +115,7 @@ EXTENSIONS = [
         'cogs.current_area',
         'cogs.daily',
         'cogs.dev',
+        'cogs.dispatcher',
         'cogs.duel',
         'cogs.dungeon_miniboss',
         'cogs.epic_items',
@@ -169,4 +171,7 @@ if __name__ == '__main__':
         bot.load_extension(extension)
 
 
-bot.run(settings.TOKEN)
\ No newline at end of file
+bot.run(settings.TOKEN)
+# Errors are written with a delay, write the ones that are still pending
+asyncio.run(errors.flush_errors())
+settings.NAVI_DB.close()
\ No newline at end of file
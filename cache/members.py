@@ -0,0 +1,81 @@
+# members.py
+"""Contains an index of guild member names and access to it. Index is updated by cogs.cache.
+
+Every guild gets an index from the encoded member name to the ids of all members with that name. The index of a
+guild is built from guild.members on the first lookup and then kept up to date by the member join, remove and user
+update events, so lookups don't need to go through all members of a guild.
+Bots are not indexed. The index of a guild whose member list isn't loaded completely yet is not stored.
+"""
+
+from typing import Dict, List, Set
+
+import discord
+
+from resources import functions
+
+
+# Member ids by encoded member name, by guild id
+_MEMBER_NAMES: Dict[int, Dict[str, Set[int]]] = {}
+
+
+def _build_guild_index(guild: discord.Guild) -> Dict[str, Set[int]]:
+    """Returns the name index of all members of a guild"""
+    member_names = {}
+    for member in guild.members:
+        if member.bot: continue
+        member_names.setdefault(functions.encode_text_non_async(member.name), set()).add(member.id)
+    return member_names
+
+
+def _add_name(member_names: Dict[str, Set[int]], name: str, member_id: int) -> None:
+    member_names.setdefault(functions.encode_text_non_async(name), set()).add(member_id)
+
+
+def _remove_name(member_names: Dict[str, Set[int]], name: str, member_id: int) -> None:
+    encoded_name = functions.encode_text_non_async(name)
+    member_ids = member_names.get(encoded_name, None)
+    if member_ids is None: return
+    member_ids.discard(member_id)
+    if not member_ids: del member_names[encoded_name]
+
+
+def get_members_by_name(guild: discord.Guild, user_name: str) -> List[discord.Member]:
+    """Returns all members of a guild with the given name that are not bots"""
+    member_names = _MEMBER_NAMES.get(guild.id, None)
+    if member_names is None:
+        member_names = _build_guild_index(guild)
+        if guild.chunked: _MEMBER_NAMES[guild.id] = member_names
+    members = []
+    for member_id in member_names.get(functions.encode_text_non_async(user_name), ()):
+        member = guild.get_member(member_id)
+        if member is not None: members.append(member)
+    return members
+
+
+def add_member(member: discord.Member) -> None:
+    """Adds a member that joined a guild"""
+    member_names = _MEMBER_NAMES.get(member.guild.id, None)
+    if member_names is None or member.bot: return
+    _add_name(member_names, member.name, member.id)
+
+
+def remove_member(member: discord.Member) -> None:
+    """Removes a member that left a guild"""
+    member_names = _MEMBER_NAMES.get(member.guild.id, None)
+    if member_names is None: return
+    _remove_name(member_names, member.name, member.id)
+
+
+def rename_user(user_before: discord.User, user_after: discord.User) -> None:
+    """Updates the name of a user in all guilds that are indexed"""
+    if user_before.name == user_after.name or user_after.bot: return
+    for guild in user_after.mutual_guilds:
+        member_names = _MEMBER_NAMES.get(guild.id, None)
+        if member_names is None: continue
+        _remove_name(member_names, user_before.name, user_after.id)
+        _add_name(member_names, user_after.name, user_after.id)
+
+
+def remove_guild(guild_id: int) -> None:
+    """Removes the index of a guild the bot left"""
+    _MEMBER_NAMES.pop(guild_id, None)
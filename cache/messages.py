@@ -1,24 +1,123 @@
 # messages.py
-"""Contains the message cache and access to it. Cache is populated by cogs.cache."""
+"""Contains the message cache and access to it. Cache is populated by cogs.cache.
+
+Every channel keeps the last 50 messages in a deque, together with an index by author id and by author name, so
+lookups for a user only look at the messages of that user. Content and author name are normalized once when a message
+is stored.
+If find_message doesn't find a message, it waits for a matching message to be stored instead of polling the cache.
+Lookups are counted in resources.metrics as hit, wait (found after waiting) or miss.
+
+Messages expire after 5 minutes. All messages are also kept in one global queue in the order they arrived. Every
+store and lookup removes expired messages from the front of that queue, which also removes the oldest messages if the
+cache grows larger than settings.MESSAGE_CACHE_MAX_SIZE.
+"""
 
 import asyncio
 from argparse import ArgumentError
+from collections import deque
 from datetime import datetime, timedelta
+from enum import Enum
 import re
-from typing import Optional, Union
+import sys
+from types import FunctionType, MethodType, ModuleType
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Tuple, Union
 
 import discord
 
-from resources import functions, logs, settings
+from resources import functions, logs, metrics, settings
+
+
+MESSAGES_PER_CHANNEL = 50
+WAIT_TIMEOUT = 0.5 # Seconds find_message waits for a matching message if none is cached yet
+MESSAGE_MAX_AGE = timedelta(minutes=5)
+EPIC_RPG_MENTION = re.compile(rf'<@!?{settings.EPIC_RPG_ID}>')
+# Objects messages share with the rest of the bot. They are not counted in the size of a cached message.
+SHARED_TYPES = (
+    discord.abc.User, discord.abc.GuildChannel, discord.abc.PrivateChannel, discord.Emoji, discord.Guild,
+    discord.Message, discord.Role, discord.Thread, bool, Enum, type, FunctionType, MethodType, ModuleType,
+)
+SHARED_ATTRIBUTES = ('_state', 'author', 'channel', 'guild')
+
+
+class CachedMessage(NamedTuple):
+    """Message in the cache with the values needed for lookups"""
+    message: discord.Message
+    author_id: int
+    author_name: str # Encoded with encode_text
+    content: str # Lowercase, without EPIC RPG mentions
+    created_at: datetime # Naive UTC
+    size: int # Bytes the message and this record use
+
+
+class ChannelCache():
+    """The cached messages of a channel, oldest first, with indexes by author id and author name"""
+    def __init__(self) -> None:
+        self.messages: Deque[CachedMessage] = deque()
+        self.by_author_id: Dict[int, Deque[CachedMessage]] = {}
+        self.by_author_name: Dict[str, Deque[CachedMessage]] = {}
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def append(self, cached_message: CachedMessage) -> None:
+        """Adds a message. Use _pop_oldest_message to remove messages if the channel is full."""
+        self.messages.append(cached_message)
+        self.by_author_id.setdefault(cached_message.author_id, deque()).append(cached_message)
+        self.by_author_name.setdefault(cached_message.author_name, deque()).append(cached_message)
 
+    def pop_oldest(self) -> CachedMessage:
+        """Removes and returns the oldest message. Messages are stored in order, so the oldest message is also the
+        oldest message in both indexes."""
+        cached_message = self.messages.popleft()
+        for index, key in ((self.by_author_id, cached_message.author_id),
+                           (self.by_author_name, cached_message.author_name)):
+            index_messages = index[key]
+            index_messages.popleft()
+            if not index_messages: del index[key]
+        return cached_message
 
-_MESSAGE_CACHE = {}
+
+_MESSAGE_CACHE: Dict[int, ChannelCache] = {}
+# Channel id, message id and creation time of all stored messages in the order they arrived. Entries of messages that
+# were already removed because their channel was full are skipped when they reach the front.
+_EXPIRY_QUEUE: Deque[Tuple[datetime, int, int]] = deque()
+_MESSAGE_CACHE_STATS = {'messages': 0, 'size': 0, 'expired': 0, 'evicted': 0}
+# Lookups that are waiting for a message, by channel id
+_WAITERS: Dict[int, List[Tuple['_MessageFilter', asyncio.Future]]] = {}
+
+
+class _MessageFilter(NamedTuple):
+    """Conditions a cached message has to match in find_message"""
+    regex: Optional[re.Pattern]
+    user_id: Optional[int]
+    user_name: Optional[str] # Encoded with encode_text
+
+    def matches(self, cached_message: CachedMessage) -> bool:
+        if self.user_id is not None and cached_message.author_id != self.user_id: return False
+        if self.user_name is not None and cached_message.author_name != self.user_name: return False
+        return self.regex is None or self.regex.search(cached_message.content) is not None
+
+
+def _find_cached_message(channel_id: int, message_filter: _MessageFilter) -> Optional[discord.Message]:
+    """Returns the newest cached message in a channel that matches the filter"""
+    channel_cache = _MESSAGE_CACHE.get(channel_id, None)
+    if channel_cache is None: return None
+    if message_filter.user_id is not None:
+        cached_messages = channel_cache.by_author_id.get(message_filter.user_id, ())
+    elif message_filter.user_name is not None:
+        cached_messages = channel_cache.by_author_name.get(message_filter.user_name, ())
+    else:
+        cached_messages = channel_cache.messages
+    for cached_message in reversed(cached_messages):
+        if message_filter.matches(cached_message): return cached_message.message
+    return None
 
 
 async def find_message(channel_id: int, regex: Union[str, re.Pattern] = None,
                       user: Optional[discord.User] = None, user_name: Optional[str] = None) -> discord.Message:
     """Looks through the last 50 messages in the channel history. If a message that matches regex is found, it returns
     the message. If user and/or user_name are defined, only messages from that user are returned.
+    If no message is found, this waits up to 0.5 seconds for a matching message to arrive.
 
     Arguments
     ---------
@@ -37,40 +136,161 @@ async def find_message(channel_id: int, regex: Union[str, re.Pattern] = None,
     ------
     ArgumentError if regex, user AND user_name are None.
     """
-    attempts = 1
-    while attempts <= 2:
-        if regex is None and user is None and user_name is None:
-            raise ArgumentError('At least one of these arguments has to be defined: regex, user, user_name.')
-        channel_messages = _MESSAGE_CACHE.get(channel_id, None)
-        if channel_messages is None: return None
-        for message in channel_messages:
-            if user is not None and message.author != user: continue
-            if (user_name is not None
-                and await functions.encode_text(user_name) != await functions.encode_text(message.author.name)):
-                continue
-            if regex is None:
-                return message
-            else:
-                message_content = re.sub(rf'<@!?{settings.EPIC_RPG_ID}>', '', message.content.lower())
-                match = re.search(regex, message_content)
-                if match: return message
-        await asyncio.sleep(0.5)
-        logs.logger.info('Required a second attempt for getting a message from the message cache.')
-        attempts += 1
-    return None
+    if regex is None and user is None and user_name is None:
+        raise ArgumentError('At least one of these arguments has to be defined: regex, user, user_name.')
+    if isinstance(regex, str): regex = re.compile(regex)
+    _expire_messages(datetime.utcnow() - MESSAGE_MAX_AGE)
+    message_filter = _MessageFilter(
+        regex=regex,
+        user_id=user.id if user is not None else None,
+        user_name=await functions.encode_text(user_name) if user_name is not None else None,
+    )
+    message = _find_cached_message(channel_id, message_filter)
+    if message is not None:
+        metrics.increase(metrics.MESSAGE_CACHE_LOOKUPS, 'hit')
+        return message
+    future = asyncio.get_running_loop().create_future()
+    waiter = (message_filter, future)
+    _WAITERS.setdefault(channel_id, []).append(waiter)
+    try:
+        message = await asyncio.wait_for(future, WAIT_TIMEOUT)
+        logs.logger.info('Had to wait for a message to arrive in the message cache.')
+        metrics.increase(metrics.MESSAGE_CACHE_LOOKUPS, 'wait')
+    except asyncio.TimeoutError:
+        message = None
+        metrics.increase(metrics.MESSAGE_CACHE_LOOKUPS, 'miss')
+    finally:
+        channel_waiters = _WAITERS.get(channel_id, [])
+        if waiter in channel_waiters: channel_waiters.remove(waiter)
+        if not channel_waiters: _WAITERS.pop(channel_id, None)
+    return message
 
 
-async def store_message(message: discord.Message) -> discord.Message:
-    """Adds a message to the message cache.
-    Also keeps the maximum amount of messages stored per channel at 50."""
-    channel_message_list = _MESSAGE_CACHE.get(message.channel.id, None)
-    if channel_message_list is None:
-        channel_message_list = [message,]
-    else:
-        channel_message_list.insert(0, message)
-    if len(channel_message_list) > 50:
-        channel_message_list = channel_message_list[:50]
-    _MESSAGE_CACHE[message.channel.id] = channel_message_list
+def _get_attribute_values(obj: Any) -> List[Any]:
+    """Returns the values of all attributes of an object that are not in SHARED_ATTRIBUTES"""
+    values = []
+    attributes = getattr(obj, '__dict__', None)
+    if attributes is not None:
+        values.extend(value for name, value in attributes.items() if name not in SHARED_ATTRIBUTES)
+    for cls in type(obj).__mro__:
+        slots = cls.__dict__.get('__slots__', ())
+        for slot in (slots,) if isinstance(slots, str) else slots:
+            if slot in SHARED_ATTRIBUTES or slot in ('__dict__', '__weakref__'): continue
+            values.append(getattr(obj, slot, None))
+    return values
+
+
+def _get_object_size(obj: Any, seen: set) -> int:
+    """Returns the bytes an object and everything it references use. Objects in seen and objects that are shared with
+    the rest of the bot are not counted. Every counted object is added to seen."""
+    if id(obj) in seen or obj is None or isinstance(obj, SHARED_TYPES): return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, datetime)): return size
+    if isinstance(obj, dict):
+        return size + sum(_get_object_size(key, seen) + _get_object_size(value, seen) for key, value in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset, deque)):
+        return size + sum(_get_object_size(item, seen) for item in obj)
+    attributes = getattr(obj, '__dict__', None)
+    if attributes is not None: size += sys.getsizeof(attributes)
+    return size + sum(_get_object_size(value, seen) for value in _get_attribute_values(obj))
+
+
+def _get_message_size(message: discord.Message) -> int:
+    """Returns the bytes a message uses, including nested objects like embeds, components and attachments, but
+    without the objects it shares with the rest of the bot (author, channel, guild, mentioned users, referenced
+    messages etc.)"""
+    seen = {id(message)}
+    size = sys.getsizeof(message)
+    attributes = getattr(message, '__dict__', None)
+    if attributes is not None: size += sys.getsizeof(attributes)
+    return size + sum(_get_object_size(value, seen) for value in _get_attribute_values(message))
+
+
+def _pop_oldest_message(channel_id: int) -> None:
+    """Removes the oldest message of a channel and removes the channel if it is empty"""
+    channel_cache = _MESSAGE_CACHE[channel_id]
+    cached_message = channel_cache.pop_oldest()
+    _MESSAGE_CACHE_STATS['messages'] -= 1
+    _MESSAGE_CACHE_STATS['size'] -= cached_message.size
+    if not channel_cache: del _MESSAGE_CACHE[channel_id]
+
+
+def _expire_messages(min_created_at: datetime) -> int:
+    """Removes all messages created before min_created_at. If the cache is still larger than the maximum size, the
+    oldest messages are removed until it fits.
+    Only looks at the front of the expiry queue, so this is O(1) if nothing needs to be removed.
+
+    Returns
+    -------
+    Amount of messages removed: int
+    """
+    message_count = 0
+    while _EXPIRY_QUEUE:
+        created_at, channel_id, message_id = _EXPIRY_QUEUE[0]
+        expired = created_at < min_created_at
+        if not expired and _MESSAGE_CACHE_STATS['size'] <= settings.MESSAGE_CACHE_MAX_SIZE: break
+        _EXPIRY_QUEUE.popleft()
+        channel_cache = _MESSAGE_CACHE.get(channel_id, None)
+        if channel_cache is None or channel_cache.messages[0].message.id != message_id: continue
+        _pop_oldest_message(channel_id)
+        _MESSAGE_CACHE_STATS['expired' if expired else 'evicted'] += 1
+        message_count += 1
+    return message_count
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Returns channel count, message count, size in bytes, maximum size and the amount of expired and evicted
+    messages of the message cache.
+    The size contains the cached messages with all nested objects (embeds, components etc.), the records and the
+    indexes, but not the objects messages share with the rest of the bot. The size of a message is measured once
+    when it is stored."""
+    size = _MESSAGE_CACHE_STATS['size'] + sys.getsizeof(_MESSAGE_CACHE) + sys.getsizeof(_EXPIRY_QUEUE)
+    for entry in _EXPIRY_QUEUE:
+        size += sys.getsizeof(entry)
+    for channel_cache in _MESSAGE_CACHE.values():
+        size += sys.getsizeof(channel_cache) + sys.getsizeof(channel_cache.messages)
+        for index in (channel_cache.by_author_id, channel_cache.by_author_name):
+            size += sys.getsizeof(index) + sum(sys.getsizeof(index_messages) for index_messages in index.values())
+    return {
+        'channels': len(_MESSAGE_CACHE),
+        'messages': _MESSAGE_CACHE_STATS['messages'],
+        'size': size,
+        'max_size': settings.MESSAGE_CACHE_MAX_SIZE,
+        'expired': _MESSAGE_CACHE_STATS['expired'],
+        'evicted': _MESSAGE_CACHE_STATS['evicted'],
+    }
+
+
+async def store_message(message: discord.Message) -> None:
+    """Adds a message to the message cache and hands it to all lookups that are waiting for it.
+    Also keeps the maximum amount of messages stored per channel at 50 and removes expired messages."""
+    author_name = await functions.encode_text(message.author.name)
+    content = EPIC_RPG_MENTION.sub('', message.content.lower())
+    cached_message = CachedMessage(
+        message=message,
+        author_id=message.author.id,
+        author_name=author_name,
+        content=content,
+        created_at=message.created_at.replace(tzinfo=None),
+        size=0,
+    )
+    cached_message = cached_message._replace(
+        size=(sys.getsizeof(cached_message) + sys.getsizeof(author_name) + sys.getsizeof(content)
+              + _get_message_size(message))
+    )
+    channel_cache = _MESSAGE_CACHE.get(message.channel.id, None)
+    if channel_cache is None:
+        channel_cache = _MESSAGE_CACHE[message.channel.id] = ChannelCache()
+    channel_cache.append(cached_message)
+    _EXPIRY_QUEUE.append((cached_message.created_at, message.channel.id, message.id))
+    _MESSAGE_CACHE_STATS['messages'] += 1
+    _MESSAGE_CACHE_STATS['size'] += cached_message.size
+    if len(channel_cache) > MESSAGES_PER_CHANNEL: _pop_oldest_message(message.channel.id)
+    _expire_messages(datetime.utcnow() - MESSAGE_MAX_AGE)
+    for message_filter, future in _WAITERS.get(message.channel.id, ()):
+        if future.done(): continue
+        if message_filter.matches(cached_message): future.set_result(message)
 
 
 async def delete_old_messages(timespan: timedelta) -> int:
@@ -80,14 +300,4 @@ async def delete_old_messages(timespan: timedelta) -> int:
     -------
     Amount of messages deleted: int
     """
-    current_time = datetime.utcnow()
-    message_count = 0
-    for channel_id, channel_messages in _MESSAGE_CACHE.items():
-        for message in channel_messages:
-            if message.created_at.replace(tzinfo=None) < (current_time - timespan):
-                _MESSAGE_CACHE[channel_id].remove(message)
-                message_count += 1
-    if message_count > 0:
-        for key in list(_MESSAGE_CACHE.keys()):
-            if not _MESSAGE_CACHE[key]: del _MESSAGE_CACHE[key]
-    return message_count
\ No newline at end of file
+    return _expire_messages(datetime.utcnow() - timespan)
@@ -13,24 +13,11 @@ from resources import exceptions, functions, regex, settings
 
 class ArenaCog(commands.Cog):
     """Cog that contains the arena detection commands"""
+    dispatch_edits = True
+
     def __init__(self, bot):
         self.bot = bot
 
-    @commands.Cog.listener()
-    async def on_message_edit(self, message_before: discord.Message, message_after: discord.Message) -> None:
-        """Runs when a message is edited in a channel."""
-        if message_before.pinned != message_after.pinned: return
-        embed_data_before = await functions.parse_embed(message_before)
-        embed_data_after = await functions.parse_embed(message_after)
-        if (message_before.content == message_after.content and embed_data_before == embed_data_after
-            and message_before.components == message_after.components): return
-        for row in message_after.components:
-            for component in row.children:
-                if component.disabled:
-                    return
-        await self.on_message(message_after)
-
-    @commands.Cog.listener()
     async def on_message(self, message: discord.Message) -> None:
         """Runs when a message is sent in a channel."""
         if message.author.id not in [settings.EPIC_RPG_ID, settings.TESTY_ID]: return
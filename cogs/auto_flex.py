@@ -9,7 +9,7 @@ from discord.ext import commands
 
 from cache import messages
 from database import errors, guilds, users
-from resources import emojis, exceptions, functions, regex, settings, strings
+from resources import delivery, emojis, exceptions, functions, regex, settings, strings
 
 
 FLEX_TITLES = {
@@ -207,6 +207,8 @@ FLEX_COLUMNS = {
 
 class AutoFlexCog(commands.Cog):
     """Cog that contains the auto flex detection"""
+    dispatch_edits = True
+
     def __init__(self, bot):
         self.bot = bot
 
@@ -252,38 +254,25 @@ class AutoFlexCog(commands.Cog):
             await functions.add_warning_reaction(message)
             await errors.log_error('Couldn\'t find auto flex channel.', message)
             return
-        await auto_flex_channel.send(content=content, embed=embed)
+        delivery.delivery_queue.enqueue(auto_flex_channel, content, embed, priority=delivery.PRIORITY_AUTO_FLEX)
         if user_settings.reactions_enabled: await message.add_reaction(emojis.PANDA_LUCKY)
         if not user_settings.auto_flex_tip_read:
-            await message.channel.send(
+            tip_delivered = delivery.delivery_queue.enqueue(
+                message.channel,
                 f'{user.mention} Nice! You just did something flex worthy. Because you have auto flex enabled, '
                 f'this was automatically posted to the channel <#{guild_settings.auto_flex_channel_id}>.\n'
                 f'If you don\'t like this, you can disable auto flex and/or auto flex pings in '
-                f'{await functions.get_navi_slash_command(self.bot, "settings user")}.'
+                f'{await functions.get_navi_slash_command(self.bot, "settings user")}.',
+                priority=delivery.PRIORITY_TIP
             )
-            await user_settings.update(auto_flex_tip_read=True)
-
-    @commands.Cog.listener()
-    async def on_message_edit(self, message_before: discord.Message, message_after: discord.Message) -> None:
-        """Runs when a message is edited in a channel."""
-        if message_before.pinned != message_after.pinned: return
-        allow_disabled_components = False
-        embed_data_before = await functions.parse_embed(message_before)
-        embed_data_after = await functions.parse_embed(message_after)
-        if (message_before.content == message_after.content and embed_data_before == embed_data_after
-            and message_before.components == message_after.components): return
-        if message_after.embeds:
-            if message_after.embeds[0].author is not None:
-                if 'card hand' in message_after.embeds[0].author.name.lower():
-                    allow_disabled_components = True
-        if not allow_disabled_components:
-            for row in message_after.components:
-                for component in row.children:
-                    if component.disabled:
-                        return
-        await self.on_message(message_after)
+            if await tip_delivered: await user_settings.update(auto_flex_tip_read=True)
+
+    def allows_disabled_components(self, message: discord.Message) -> bool:
+        """Card hand messages are flexed after their buttons got disabled"""
+        if message.embeds and message.embeds[0].author is not None:
+            return 'card hand' in message.embeds[0].author.name.lower()
+        return False
 
-    @commands.Cog.listener()
     async def on_message(self, message: discord.Message) -> None:
         """Runs when a message is sent in a channel."""
         if message.author.id not in [settings.EPIC_RPG_ID, settings.TESTY_ID]: return
@@ -1,10 +1,11 @@
 # cache.py
-"""Collects messages containing rpg and mention commands for the local cache"""
+"""Collects messages containing rpg and mention commands for the local cache and keeps the member name index up to
+date"""
 
 import discord
 from discord.ext import commands
 
-from cache import messages
+from cache import members, messages
 from resources import settings
 
 
@@ -13,7 +14,6 @@ class CacheCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
-    @commands.Cog.listener()
     async def on_message(self, message: discord.Message) -> None:
         """Runs when a message is sent in a channel."""
         if message.author.bot: return
@@ -30,6 +30,26 @@ class CacheCog(commands.Cog):
             if correct_mention:
                 await messages.store_message(message)
 
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member) -> None:
+        """Runs when a member joins a guild."""
+        members.add_member(member)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member) -> None:
+        """Runs when a member leaves a guild."""
+        members.remove_member(member)
+
+    @commands.Cog.listener()
+    async def on_user_update(self, user_before: discord.User, user_after: discord.User) -> None:
+        """Runs when a user changes their name or avatar."""
+        members.rename_user(user_before, user_after)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        """Runs when the bot leaves a guild."""
+        members.remove_guild(guild.id)
+
 # Initialization
 def setup(bot):
     bot.add_cog(CacheCog(bot))
\ No newline at end of file
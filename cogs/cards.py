@@ -14,20 +14,15 @@ from resources import exceptions, functions, regex, settings
 
 class CardsCog(commands.Cog):
     """Cog that contains the card detection commands"""
+    dispatch_edits = True
+
     def __init__(self, bot):
         self.bot = bot
 
-    @commands.Cog.listener()
-    async def on_message_edit(self, message_before: discord.Message, message_after: discord.Message) -> None:
-        """Runs when a message is edited in a channel."""
-        if message_before.pinned != message_after.pinned: return
-        embed_data_before = await functions.parse_embed(message_before)
-        embed_data_after = await functions.parse_embed(message_after)
-        if (message_before.content == message_after.content and embed_data_before == embed_data_after
-            and message_before.components == message_after.components): return
-        await self.on_message(message_after)
-
-    @commands.Cog.listener()
+    def allows_disabled_components(self, message: discord.Message) -> bool:
+        """Card messages are also detected after their buttons got disabled"""
+        return True
+
     async def on_message(self, message: discord.Message) -> None:
         """Runs when a message is sent in a channel."""
         if message.author.id not in [settings.EPIC_RPG_ID, settings.TESTY_ID]: return
@@ -14,8 +14,8 @@ from discord.commands import SlashCommandGroup, Option
 from discord.ext import commands
 from humanfriendly import format_timespan
 
-from database import cooldowns
-from resources import emojis, exceptions, functions, logs, settings, views
+from database import cooldowns, errors, users
+from resources import delivery, emojis, functions, logs, metrics, settings, views
 
 
 EVENT_REDUCTION_TYPES = [
@@ -163,8 +163,8 @@ class DevCog(commands.Cog):
             start_time = datetime.utcnow()
             interaction = await ctx.respond('Starting backup...')
             backup_db_file = os.path.join(settings.BOT_DIR, 'database/navi_db_backup.db')
-            navi_backup_db = sqlite3.connect(backup_db_file)
-            settings.NAVI_DB.backup(navi_backup_db)
+            navi_backup_db = sqlite3.connect(backup_db_file, check_same_thread=False)
+            await settings.NAVI_DB.run_async(settings.NAVI_DB.backup, navi_backup_db)
             navi_backup_db.close()
             time_taken = datetime.utcnow() - start_time
             await functions.edit_interaction(interaction, content=f'Backup finished after {format_timespan(time_taken)}')
@@ -267,20 +267,125 @@ class DevCog(commands.Cog):
             await ctx.respond(MSG_NOT_DEV, ephemeral=True)
             return
         from cache import messages
-        cache_size = sys.getsizeof(messages._MESSAGE_CACHE)
-        channel_count = len(messages._MESSAGE_CACHE)
-        message_count = 0
-        for channel_messages in messages._MESSAGE_CACHE.values():
-            message_count += len(channel_messages)
-            cache_size += sys.getsizeof(channel_messages)
-            for message in channel_messages:
-                cache_size += sys.getsizeof(message)
+        message_cache_stats = messages.get_cache_stats()
+        user_cache_stats = users.get_cache_stats()
+        user_cache_requests = user_cache_stats['hits'] + user_cache_stats['misses']
+        user_cache_hit_rate = user_cache_stats['hits'] / user_cache_requests * 100 if user_cache_requests > 0 else 0
         await ctx.respond(
-            f'Cache size: {cache_size / 1024:,.2f} KB\n'
-            f'Channel count: {channel_count:,}\n'
-            f'Message count: {message_count:,}\n'
+            f'Cache size: {message_cache_stats["size"] / 1024:,.2f} / '
+            f'{message_cache_stats["max_size"] / 1024:,.2f} KB\n'
+            f'Channel count: {message_cache_stats["channels"]:,}\n'
+            f'Message count: {message_cache_stats["messages"]:,}\n'
+            f'Expired messages: {message_cache_stats["expired"]:,}\n'
+            f'Evicted messages: {message_cache_stats["evicted"]:,}\n'
+            f'User cache: {user_cache_stats["size"]:,} / {user_cache_stats["capacity"]:,} users\n'
+            f'User cache hits: {user_cache_stats["hits"]:,}\n'
+            f'User cache misses: {user_cache_stats["misses"]:,}\n'
+            f'User cache hit rate: {user_cache_hit_rate:,.2f}%\n'
         )
 
+    @dev.command()
+    async def database(self, ctx: discord.ApplicationContext):
+        """Shows WAL size and checkpoint stats"""
+        if ctx.author.id not in settings.DEV_IDS:
+            await ctx.respond(MSG_NOT_DEV, ephemeral=True)
+            return
+        wal_file = f'{settings.DB_FILE}-wal'
+        wal_size = os.path.getsize(wal_file) if os.path.isfile(wal_file) else 0
+        checkpoint_stats = settings.NAVI_DB.checkpoint_stats
+        if checkpoint_stats['last_time'] is None:
+            last_checkpoint = 'Never'
+        else:
+            last_checkpoint = (
+                f'{format_timespan(datetime.utcnow().replace(microsecond=0) - checkpoint_stats["last_time"])} ago, '
+                f'took {checkpoint_stats["last_duration"] * 1000:,.2f} ms, '
+                f'{checkpoint_stats["last_checkpointed_frames"]:,} / {checkpoint_stats["last_log_frames"]:,} frames'
+            )
+        read_connection = 'Open' if settings.NAVI_DB.read_connection is not None else 'Closed'
+        await ctx.respond(
+            f'Journal mode: {settings.NAVI_DB.journal_mode}\n'
+            f'WAL size: {wal_size / 1024:,.2f} KB\n'
+            f'Checkpoints: {checkpoint_stats["count"]:,} (busy: {checkpoint_stats["busy"]:,})\n'
+            f'Last checkpoint: {last_checkpoint}\n'
+            f'Read connection: {read_connection} ({settings.NAVI_DB.reads_on_read_connection:,} reads)\n'
+            f'Write-behind: {settings.NAVI_DB.flushed_writes:,} writes in '
+            f'{settings.NAVI_DB.flushed_transactions:,} transactions\n'
+        )
+
+    @dev.command()
+    async def delivery(self, ctx: discord.ApplicationContext):
+        """Shows delivery queue stats"""
+        if ctx.author.id not in settings.DEV_IDS:
+            await ctx.respond(MSG_NOT_DEV, ephemeral=True)
+            return
+        delivery_stats = delivery.delivery_queue.get_stats()
+        await ctx.respond(
+            f'Queued messages: {delivery_stats["depth"]:,} in {delivery_stats["channels"]:,} channels\n'
+            f'Total queued: {delivery_stats["queued"]:,}\n'
+            f'Delivered: {delivery_stats["delivered"]:,} in {delivery_stats["sends"]:,} sends\n'
+            f'Failed: {delivery_stats["failed"]:,}\n'
+            f'Lag: {delivery_stats["lag_last"]:,.2f} s last, {delivery_stats["lag_average"]:,.2f} s average, '
+            f'{delivery_stats["lag_max"]:,.2f} s max\n'
+        )
+
+    @dev.command(name='errors')
+    async def errors_summary(self, ctx: discord.ApplicationContext):
+        """Shows the errors that were seen last"""
+        if ctx.author.id not in settings.DEV_IDS:
+            await ctx.respond(MSG_NOT_DEV, ephemeral=True)
+            return
+        error_summaries = await errors.get_error_summaries(10)
+        if not error_summaries:
+            await ctx.respond('No errors logged.')
+            return
+        current_time = datetime.utcnow().replace(microsecond=0)
+        lines = ['**Last seen errors**']
+        for error_summary in error_summaries:
+            last_seen = format_timespan(current_time - error_summary.last_seen.replace(microsecond=0))
+            first_seen = format_timespan(current_time - error_summary.first_seen.replace(microsecond=0))
+            lines.append(
+                f'{emojis.BP} `{error_summary.fingerprint}` {error_summary.error_type} at {error_summary.location}\n'
+                f'{error_summary.count:,}x ({error_summary.count - error_summary.logged:,} suppressed), '
+                f'last seen {last_seen} ago, first seen {first_seen} ago\n'
+                f'{error_summary.sample[:100]}'
+            )
+        await ctx.respond('\n'.join(lines)[:2000])
+
+    @dev.command()
+    async def stats(self, ctx: discord.ApplicationContext):
+        """Shows handler, database, reminder and event loop timings"""
+        if ctx.author.id not in settings.DEV_IDS:
+            await ctx.respond(MSG_NOT_DEV, ephemeral=True)
+            return
+
+        def format_histogram(label: str, histogram: metrics.Histogram) -> str:
+            return (
+                f'{label}: {histogram.count:,}x, avg {histogram.average * 1000:,.1f} ms, '
+                f'p95 {histogram.quantile(0.95) * 1000:,.1f} ms, max {histogram.max * 1000:,.1f} ms'
+            )
+
+        lines = ['**Slowest handlers (total time)**']
+        for cog_name, histogram in metrics.get_top_histograms(metrics.HANDLER_DURATION, 5):
+            lines.append(f'{emojis.BP} {format_histogram(cog_name, histogram)}')
+        lines.append('**Slowest database functions (total time)**')
+        for function_name, histogram in metrics.get_top_histograms(metrics.SQL_DURATION, 5):
+            lines.append(f'{emojis.BP} {format_histogram(function_name, histogram)}')
+        lines.append('**Reminder delay**')
+        for reminder_type, histogram in sorted(metrics.get_histograms(metrics.REMINDER_DELAY).items()):
+            lines.append(f'{emojis.BP} {format_histogram(reminder_type, histogram)}')
+        lines.append('**Event loop lag**')
+        for loop_name, histogram in metrics.get_histograms(metrics.EVENT_LOOP_LAG).items():
+            lines.append(f'{emojis.BP} {format_histogram(loop_name, histogram)}')
+        lookups = metrics.get_counters(metrics.MESSAGE_CACHE_LOOKUPS)
+        lookup_count = sum(lookups.values())
+        hit_rate = lookups.get('hit', 0) / lookup_count * 100 if lookup_count > 0 else 0
+        lines.append('**Message cache**')
+        lines.append(
+            f'{emojis.BP} {lookups.get("hit", 0):,} hits, {lookups.get("wait", 0):,} waits, '
+            f'{lookups.get("miss", 0):,} misses, hit rate {hit_rate:,.2f}%'
+        )
+        await ctx.respond('\n'.join(lines)[:2000])
+
     @dev.command(name='server-list')
     async def server_list(self, ctx: discord.ApplicationContext):
         """Lists the servers the bot is in by name"""
@@ -311,32 +416,14 @@ class DevCog(commands.Cog):
             return
         await ctx.defer()
         from datetime import datetime
-        import asyncio
         from humanfriendly import format_timespan
-        from database import tracking, users
+        from database import tracking
         start_time = datetime.utcnow().replace(microsecond=0)
-        log_entry_count = 0
-        try:
-            old_log_entries = await tracking.get_old_log_entries(28)
-        except exceptions.NoDataFoundError:
+        log_entry_count = await tracking.consolidate_log_entries(28)
+        if log_entry_count == 0:
             await ctx.respond('Nothing to do.')
             return
-        entries = {}
-        for log_entry in old_log_entries:
-            date_time = log_entry.date_time.replace(hour=23, minute=59, second=59, microsecond=999999)
-            key = (log_entry.user_id, log_entry.guild_id, log_entry.command, date_time)
-            amount = entries.get(key, 0)
-            entries[key] = amount + 1
-            log_entry_count += 1
-        for key, amount in entries.items():
-            user_id, guild_id, command, date_time = key
-            summary_log_entry = await tracking.insert_log_summary(user_id, guild_id, command, date_time, amount)
-            date_time_min = date_time.replace(hour=0, minute=0, second=0, microsecond=0)
-            date_time_max = date_time.replace(hour=23, minute=59, second=59, microsecond=999999)
-            await tracking.delete_log_entries(user_id, guild_id, command, date_time_min, date_time_max)
-            await asyncio.sleep(0.01)
-        cur = settings.NAVI_DB.cursor()
-        cur.execute('VACUUM')
+        await settings.NAVI_DB.incremental_vacuum_async(settings.DB_VACUUM_STEP_PAGES)
         end_time = datetime.utcnow().replace(microsecond=0)
         time_passed = end_time - start_time
         logs.logger.info(f'Consolidated {log_entry_count:,} log entries in {format_timespan(time_passed)} manually.')
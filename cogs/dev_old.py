@@ -223,18 +223,11 @@ class DevOldCog(commands.Cog):
         """Shows cache size"""
         if ctx.author.id not in settings.DEV_IDS: return
         from cache import messages
-        cache_size = sys.getsizeof(messages._MESSAGE_CACHE)
-        channel_count = len(messages._MESSAGE_CACHE)
-        message_count = 0
-        for channel_messages in messages._MESSAGE_CACHE.values():
-            message_count += len(channel_messages)
-            cache_size += sys.getsizeof(channel_messages)
-            for message in channel_messages:
-                cache_size += sys.getsizeof(message)
+        message_cache_stats = messages.get_cache_stats()
         await ctx.reply(
-            f'Cache size: {cache_size / 1024:,.2f} KB\n'
-            f'Channel count: {channel_count:,}\n'
-            f'Message count: {message_count:,}\n'
+            f'Cache size: {message_cache_stats["size"] / 1024:,.2f} KB\n'
+            f'Channel count: {message_cache_stats["channels"]:,}\n'
+            f'Message count: {message_cache_stats["messages"]:,}\n'
         )
 
     @dev.command()
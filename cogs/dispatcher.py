@@ -0,0 +1,392 @@
+# dispatcher.py
+"""Contains the central message dispatcher that routes new and edited messages to the detection cogs"""
+
+import ast
+import asyncio
+import inspect
+import re
+import textwrap
+import time
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+
+import discord
+from discord.ext import commands
+
+from resources import functions, logs, metrics, settings
+
+
+RPG_IDS = (settings.EPIC_RPG_ID, settings.TESTY_ID)
+LIST_MUTATORS = ('append', 'extend', 'insert', 'add', 'update')
+MESSAGE_TEXT_NAMES = re.compile(
+    r'^((message|embed)_(author|autor|content|description|field|fields|footer|title)\w*|message\.content'
+    r'|field\.name|field\.value|line)$'
+)
+
+
+# --- Trigger extraction ---
+def _get_string_constants(node: ast.AST) -> Optional[Set[str]]:
+    """Returns the lowercased strings of a list, tuple or set literal that only contains strings.
+    For f-strings the longest constant part is used. Returns None if the node is anything else."""
+    if not isinstance(node, (ast.List, ast.Tuple, ast.Set)): return None
+    strings = set()
+    for element in node.elts:
+        if isinstance(element, ast.JoinedStr):
+            parts = [value.value for value in element.values if isinstance(value, ast.Constant)]
+            element = ast.Constant(max(parts, key=len, default=''))
+        if not isinstance(element, ast.Constant) or not isinstance(element.value, str) or not element.value:
+            return None
+        strings.add(element.value.lower())
+    return strings
+
+
+def _get_string_lists(function: ast.AST) -> Dict[str, Optional[Set[str]]]:
+    """Collects every string list that is assigned to a local name within a handler.
+    If the same name is assigned multiple times, the union of all lists is returned, so the result is always a
+    superset of the value the name has at runtime. Names that are assigned anything else or are mutated in place
+    are set to None."""
+    string_lists = {}
+    for node in ast.walk(function):
+        if isinstance(node, ast.Assign):
+            for target in node.targets:
+                if not isinstance(target, ast.Name): continue
+                strings = _get_string_constants(node.value)
+                if strings is None or string_lists.get(target.id, set()) is None:
+                    string_lists[target.id] = None
+                else:
+                    string_lists[target.id] = string_lists.get(target.id, set()) | strings
+        elif isinstance(node, (ast.AugAssign, ast.AnnAssign)) and isinstance(node.target, ast.Name):
+            string_lists[node.target.id] = None
+        elif isinstance(node, (ast.For, ast.comprehension, ast.NamedExpr)) and isinstance(node.target, ast.Name):
+            string_lists[node.target.id] = None
+        elif (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+              and isinstance(node.func.value, ast.Name) and node.func.attr in LIST_MUTATORS):
+            string_lists[node.func.value.id] = None
+    return string_lists
+
+
+def _get_dotted_name(node: ast.AST) -> Optional[str]:
+    """Returns the dotted name of a name or attribute node, e.g. message.author.id. Returns None for anything else."""
+    if isinstance(node, ast.Name): return node.id
+    if isinstance(node, ast.Attribute):
+        value_name = _get_dotted_name(node.value)
+        return f'{value_name}.{node.attr}' if value_name is not None else None
+    return None
+
+
+def _is_message_text(node: ast.AST) -> bool:
+    """Checks if a node is one of the variables the handlers use to store text parts of the message"""
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'lower'
+        and not node.args):
+        node = node.func.value
+    name = _get_dotted_name(node)
+    return name is not None and bool(MESSAGE_TEXT_NAMES.match(name))
+
+
+def _get_condition_triggers(test: ast.AST, string_lists: Dict[str, Optional[Set[str]]]) -> Optional[Set[str]]:
+    """Returns a set of strings of which at least one has to be part of the message if the condition is true.
+    Returns None if no such set can be derived from the condition."""
+    if isinstance(test, ast.BoolOp) and isinstance(test.op, ast.And):
+        for value in test.values:
+            triggers = _get_condition_triggers(value, string_lists)
+            if triggers is not None: return triggers
+        return None
+    if isinstance(test, ast.BoolOp) and isinstance(test.op, ast.Or):
+        triggers = set()
+        for value in test.values:
+            value_triggers = _get_condition_triggers(value, string_lists)
+            if value_triggers is None: return None
+            triggers |= value_triggers
+        return triggers
+    if isinstance(test, ast.Compare) and len(test.ops) == 1:
+        left, operator, right = test.left, test.ops[0], test.comparators[0]
+        # 'string' in text
+        if (isinstance(operator, ast.In) and isinstance(left, ast.Constant) and isinstance(left.value, str)
+            and _is_message_text(right)):
+            return {left.value.lower()}
+        # text == 'string' / 'string' == text
+        if isinstance(operator, ast.Eq):
+            if isinstance(right, ast.Constant) and isinstance(right.value, str) and _is_message_text(left):
+                return {right.value.lower()}
+            if isinstance(left, ast.Constant) and isinstance(left.value, str) and _is_message_text(right):
+                return {left.value.lower()}
+        # text in ['string', 'string']
+        if isinstance(operator, ast.In) and _is_message_text(left): return _get_string_constants(right)
+        return None
+    # text.startswith('string')
+    if (isinstance(test, ast.Call) and isinstance(test.func, ast.Attribute) and test.func.attr == 'startswith'
+        and len(test.args) == 1 and not test.keywords and _is_message_text(test.func.value)):
+        if isinstance(test.args[0], ast.Constant) and isinstance(test.args[0].value, str):
+            return {test.args[0].value.lower()}
+        return _get_string_constants(test.args[0])
+    # any(search_string in text for search_string in search_strings)
+    if (isinstance(test, ast.Call) and isinstance(test.func, ast.Name) and test.func.id == 'any'
+        and len(test.args) == 1 and not test.keywords and isinstance(test.args[0], ast.GeneratorExp)):
+        generator = test.args[0]
+        if len(generator.generators) != 1: return None
+        comprehension = generator.generators[0]
+        if (comprehension.ifs or not isinstance(comprehension.target, ast.Name)
+            or not isinstance(comprehension.iter, ast.Name)):
+            return None
+        element = generator.elt
+        if not isinstance(element, ast.Compare) or len(element.ops) != 1: return None
+        if not isinstance(element.ops[0], (ast.In, ast.Eq)) or not _is_message_text(element.comparators[0]):
+            return None
+        searched = element.left
+        if (isinstance(searched, ast.Call) and isinstance(searched.func, ast.Attribute)
+            and searched.func.attr == 'lower' and not searched.args):
+            searched = searched.func.value
+        if not isinstance(searched, ast.Name) or searched.id != comprehension.target.id: return None
+        return string_lists.get(comprehension.iter.id)
+    return None
+
+
+def _contains_await(node: ast.AST) -> bool:
+    """Checks if a node awaits anything"""
+    return any(isinstance(child, (ast.Await, ast.AsyncFor, ast.AsyncWith)) for child in ast.walk(node))
+
+
+def _get_block_triggers(statements: List[ast.stmt],
+                        string_lists: Dict[str, Optional[Set[str]]]) -> Optional[Set[str]]:
+    """Returns the triggers of a block of statements.
+    Statements that don't await anything only prepare data and are ignored. Every statement that awaits something
+    has to be inside an if statement with a condition that yields triggers. Returns None if that is not the case."""
+    triggers = set()
+    for statement in statements:
+        if not _contains_await(statement): continue
+        if isinstance(statement, ast.For) and not _contains_await(statement.iter):
+            for block in (statement.body, statement.orelse):
+                block_triggers = _get_block_triggers(block, string_lists)
+                if block_triggers is None: return None
+                triggers |= block_triggers
+            continue
+        if not isinstance(statement, ast.If) or _contains_await(statement.test): return None
+        condition_triggers = _get_condition_triggers(statement.test, string_lists)
+        if condition_triggers is None:
+            condition_triggers = _get_block_triggers(statement.body, string_lists)
+            if condition_triggers is None: return None
+        triggers |= condition_triggers
+        else_triggers = _get_block_triggers(statement.orelse, string_lists)
+        if else_triggers is None: return None
+        triggers |= else_triggers
+    return triggers
+
+
+def _is_rpg_guard(statement: ast.stmt) -> bool:
+    """Checks if a statement is the 'if message.author.id not in [settings.EPIC_RPG_ID, settings.TESTY_ID]: return'
+    check at the start of most handlers."""
+    if not isinstance(statement, ast.If) or statement.orelse: return False
+    if len(statement.body) != 1 or not isinstance(statement.body[0], ast.Return): return False
+    test = statement.test
+    if not isinstance(test, ast.Compare) or len(test.ops) != 1 or not isinstance(test.ops[0], ast.NotIn): return False
+    if _get_dotted_name(test.left) != 'message.author.id': return False
+    ids = test.comparators[0]
+    if not isinstance(ids, (ast.List, ast.Tuple)): return False
+    return (sorted(str(_get_dotted_name(element)) for element in ids.elts)
+            == ['settings.EPIC_RPG_ID', 'settings.TESTY_ID'])
+
+
+def get_handler_triggers(handler) -> Tuple[bool, Optional[FrozenSet[str]]]:
+    """Analyzes the source of an on_message handler.
+
+    Returns
+    -------
+    Tuple with the following values:
+    - rpg_only (bool): True if the handler returns on every message that wasn't sent by EPIC RPG
+    - triggers (frozenset or None): Strings of which at least one has to be part of a message for the handler to
+    do anything. None if the handler has to be called on every message.
+    If the analysis fails for any reason, the handler is called on every message.
+    """
+    try:
+        source = textwrap.dedent(inspect.getsource(handler))
+        function = ast.parse(source).body[0]
+        statements = function.body
+        if (statements and isinstance(statements[0], ast.Expr) and isinstance(statements[0].value, ast.Constant)):
+            statements = statements[1:]
+        rpg_only = bool(statements) and _is_rpg_guard(statements[0])
+        triggers = _get_block_triggers(statements, _get_string_lists(function))
+    except Exception as error:
+        logs.logger.error(f'Dispatcher: Couldn\'t analyze handler {getattr(handler, "__qualname__", handler)}: {error}')
+        return (False, None)
+    return (rpg_only, frozenset(triggers) if triggers else None)
+
+
+# --- Trigger table ---
+def _compile_trie(strings: List[str]) -> str:
+    """Compiles a list of strings into a regex pattern that matches the longest string starting at a position"""
+    trie = {}
+    for string in strings:
+        node = trie
+        for character in string:
+            node = node.setdefault(character, {})
+        node[''] = {}
+
+    def compile_node(node: dict) -> str:
+        alternatives = [f'{re.escape(character)}{compile_node(child)}'
+                        for character, child in sorted(node.items()) if character]
+        if not alternatives: return ''
+        pattern = alternatives[0] if len(alternatives) == 1 else f'(?:{"|".join(alternatives)})'
+        return f'(?:{pattern})?' if '' in node else pattern
+
+    return compile_node(trie)
+
+
+class TriggerTable():
+    """Precompiled lookup of all handler triggers.
+    All triggers are combined into one trie shaped regex. Every match resolves to the handlers of the matched trigger
+    and of all triggers contained in it, so one scan over the message finds every handler with a matching trigger."""
+    def __init__(self, handler_triggers: Dict[str, FrozenSet[str]]) -> None:
+        handlers_by_trigger = {}
+        for handler_name, triggers in handler_triggers.items():
+            for trigger in triggers:
+                handlers_by_trigger.setdefault(trigger, set()).add(handler_name)
+        self.handlers: Dict[str, FrozenSet[str]] = {}
+        for trigger in handlers_by_trigger:
+            handler_names = set()
+            for other_trigger, other_handler_names in handlers_by_trigger.items():
+                if other_trigger in trigger: handler_names |= other_handler_names
+            self.handlers[trigger] = frozenset(handler_names)
+        pattern = _compile_trie(sorted(self.handlers))
+        self.pattern = re.compile(f'(?=({pattern}))', re.DOTALL) if pattern else None
+
+    def match(self, text: str) -> Set[str]:
+        """Returns the names of all handlers with a trigger that is part of the text"""
+        handler_names = set()
+        if self.pattern is None: return handler_names
+        for match in self.pattern.finditer(text):
+            handler_names |= self.handlers[match.group(1)]
+        return handler_names
+
+
+def get_message_text(message: discord.Message) -> str:
+    """Returns the lowercased content of a message and all text parts of its first embed"""
+    parts = [message.content]
+    if message.embeds:
+        embed: discord.Embed = message.embeds[0]
+        if embed.author is not None: parts.append(str(embed.author.name))
+        if embed.title is not None: parts.append(str(embed.title))
+        if embed.description is not None: parts.append(str(embed.description))
+        for field in embed.fields:
+            parts.append(str(field.name))
+            parts.append(str(field.value))
+        if embed.footer is not None: parts.append(str(embed.footer.text))
+    return '\n'.join(str(part) for part in parts if part).lower()
+
+
+# --- Edits ---
+class MessageEdit(NamedTuple):
+    """What changed in an edited message. Computed once per edit for all handlers."""
+    changed: bool # False if only the pinned state changed or nothing that handlers look at changed
+    disabled_components: bool # True if the edited message has a disabled component
+
+
+async def get_message_edit(message_before: discord.Message, message_after: discord.Message) -> MessageEdit:
+    """Compares both versions of an edited message. Embeds are only parsed if content and components are equal."""
+    if message_before.pinned != message_after.pinned: return MessageEdit(False, False)
+    changed = (message_before.content != message_after.content
+               or message_before.components != message_after.components
+               or await functions.parse_embed(message_before) != await functions.parse_embed(message_after))
+    disabled_components = any(component.disabled for row in message_after.components for component in row.children)
+    return MessageEdit(changed, disabled_components)
+
+
+class DispatcherCog(commands.Cog):
+    """Cog that routes every message to the on_message handlers of the other cogs.
+    Cogs provide an on_message method without registering it as a listener. Handlers that are only triggered by
+    certain strings are only called if one of those strings is part of the message.
+
+    Cogs that set dispatch_edits to True also get edited messages if the edit changed the content, the embed or the
+    components. Edited messages with disabled components are skipped unless the cog has an
+    allows_disabled_components(message) method that returns True."""
+    def __init__(self, bot):
+        self.bot = bot
+        self.cogs_key: Optional[Tuple[int]] = None
+        self.handler_cogs: List[commands.Cog] = []
+        self.edit_handler_cogs: List[commands.Cog] = []
+        self.handlers: Dict[str, Tuple[bool, Optional[FrozenSet[str]]]] = {}
+        self.trigger_table: Optional[TriggerTable] = None
+
+    def get_handler_cogs(self) -> List[commands.Cog]:
+        """Returns all cogs that have an on_message handler that isn't a listener itself"""
+        handler_cogs = []
+        for cog in self.bot.cogs.values():
+            if cog is self or not hasattr(cog, 'on_message'): continue
+            if any(event_name == 'on_message' for event_name, _ in cog.get_listeners()): continue
+            handler_cogs.append(cog)
+        return handler_cogs
+
+    def build_trigger_table(self, handler_cogs: List[commands.Cog]) -> None:
+        """Analyzes all handlers and compiles the trigger table"""
+        self.handlers = {}
+        for cog in handler_cogs:
+            self.handlers[cog.qualified_name] = get_handler_triggers(cog.on_message)
+        self.trigger_table = TriggerTable(
+            {cog_name: triggers for cog_name, (_, triggers) in self.handlers.items() if triggers is not None}
+        )
+        always_called = [cog_name for cog_name, (_, triggers) in self.handlers.items() if triggers is None]
+        logs.logger.info(
+            f'Dispatcher: Compiled {len(self.trigger_table.handlers)} triggers for {len(self.handlers)} handlers. '
+            f'Always called: {", ".join(always_called) if always_called else "-"}'
+        )
+
+    async def run_handler(self, cog: commands.Cog, message: discord.Message) -> None:
+        """Runs a single handler, records its duration and reports errors the same way a listener would"""
+        start_time = time.perf_counter()
+        try:
+            await cog.on_message(message)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            try:
+                await self.bot.on_error('on_message', message)
+            except asyncio.CancelledError:
+                pass
+        finally:
+            metrics.observe(metrics.HANDLER_DURATION, cog.qualified_name, time.perf_counter() - start_time)
+
+    def update_handler_cogs(self) -> None:
+        """Rebuilds the handler cog lists and the trigger table if cogs were loaded, unloaded or reloaded.
+        Only the identity of the loaded cogs is compared, so this is cheap if nothing changed."""
+        cogs_key = tuple(map(id, self.bot.cogs.values()))
+        if cogs_key == self.cogs_key: return
+        self.handler_cogs = self.get_handler_cogs()
+        self.edit_handler_cogs = [cog for cog in self.handler_cogs if getattr(cog, 'dispatch_edits', False)]
+        self.build_trigger_table(self.handler_cogs)
+        self.cogs_key = cogs_key
+
+    def dispatch(self, message: discord.Message, handler_cogs: List[commands.Cog]) -> None:
+        """Starts the handlers of all cogs the message could trigger"""
+        rpg_message = message.author.id in RPG_IDS
+        matched_handlers = None
+        for cog in handler_cogs:
+            rpg_only, triggers = self.handlers[cog.qualified_name]
+            if rpg_only and not rpg_message: continue
+            if triggers is not None:
+                if matched_handlers is None:
+                    matched_handlers = self.trigger_table.match(get_message_text(message))
+                if cog.qualified_name not in matched_handlers: continue
+            self.bot.loop.create_task(self.run_handler(cog, message))
+
+    # Events
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message) -> None:
+        """Runs when a message is sent in a channel."""
+        self.update_handler_cogs()
+        self.dispatch(message, self.handler_cogs)
+
+    @commands.Cog.listener()
+    async def on_message_edit(self, message_before: discord.Message, message_after: discord.Message) -> None:
+        """Runs when a message is edited in a channel."""
+        self.update_handler_cogs()
+        handler_cogs = self.edit_handler_cogs
+        if not handler_cogs: return
+        message_edit = await get_message_edit(message_before, message_after)
+        if not message_edit.changed: return
+        if message_edit.disabled_components:
+            handler_cogs = [cog for cog in handler_cogs if hasattr(cog, 'allows_disabled_components')
+                            and cog.allows_disabled_components(message_after)]
+        self.dispatch(message_after, handler_cogs)
+
+
+# Initialization
+def setup(bot):
+    bot.add_cog(DispatcherCog(bot))
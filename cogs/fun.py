@@ -14,23 +14,11 @@ from resources import emojis, exceptions, functions, regex, settings
 
 class FunCog(commands.Cog):
     """Cog with events and help and about commands"""
+    dispatch_edits = True
+
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
-    @commands.Cog.listener()
-    async def on_message_edit(self, message_before: discord.Message, message_after: discord.Message) -> None:
-        """Runs when a message is edited in a channel."""
-        if message_before.pinned != message_after.pinned: return
-        embed_data_before = await functions.parse_embed(message_before)
-        embed_data_after = await functions.parse_embed(message_after)
-        if (message_before.content == message_after.content and embed_data_before == embed_data_after
-            and message_before.components == message_after.components): return
-        for row in message_after.components:
-            for component in row.children:
-                if component.disabled:
-                    return
-        await self.on_message(message_after)
-
     @commands.command(aliases=('listen',))
     @commands.bot_has_permissions(send_messages=True, embed_links=True, read_message_history=True)
     async def hey(self, ctx: commands.Context) -> None:
@@ -66,7 +54,6 @@ class FunCog(commands.Cog):
             return
         await ctx.reply('I said no appeal.')
 
-    @commands.Cog.listener()
     async def on_message(self, message: discord.Message) -> None:
         """Runs when a message is sent in a channel."""
 
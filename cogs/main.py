@@ -172,7 +172,6 @@ class MainCog(commands.Cog):
             await errors.log_error(error, ctx)
             if settings.DEBUG_MODE or ctx.guild.id in settings.DEV_GUILDS: await send_error()
 
-    @commands.Cog.listener()
     async def on_message(self, message: discord.Message) -> None:
         """Runs when a message is sent in a channel."""
         if message.author.bot: return
@@ -190,6 +189,7 @@ class MainCog(commands.Cog):
         startup_info = f'{self.bot.user.name} has connected to Discord!'
         print(startup_info)
         logs.logger.info(startup_info)
+        functions.build_navi_command_ids(self.bot)
         await self.bot.change_presence(activity=discord.Activity(type=discord.ActivityType.watching,
                                                                   name='your commands'))
     @commands.Cog.listener()
@@ -6,17 +6,17 @@ from datetime import datetime, timedelta
 from humanfriendly import format_timespan
 import re
 import sqlite3
+import time
 from typing import List
 
-import discord
 from discord.ext import commands, tasks
 
 from cache import messages
 from database import clans, errors, reminders, tracking, users
-from resources import emojis, exceptions, functions, logs, settings, strings
+from resources import delivery, emojis, exceptions, functions, logs, metrics, settings, strings
 
 
-running_tasks = {}
+USER_MENTION = re.compile(r'<@!?(\d{16,20})>')
 
 
 class TasksCog(commands.Cog):
@@ -24,16 +24,10 @@ class TasksCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
-    # Task management
-    async def background_task(self, reminders_list: List[reminders.Reminder]) -> None:
-        """Background task for scheduling reminders"""
+    # Reminder management
+    async def send_reminders(self, reminders_list: List[reminders.Reminder]) -> None:
+        """Sends reminders that are due"""
         first_reminder = reminders_list[0]
-        current_time = datetime.utcnow().replace(microsecond=0)
-        def get_time_left() -> timedelta:
-            time_left = first_reminder.end_time - current_time
-            if time_left.total_seconds() < 0: time_left = timedelta(seconds=0)
-            return time_left
-
         try:
             if first_reminder.reminder_type == 'user':
                 user = await functions.get_discord_user(self.bot, first_reminder.user_id)
@@ -94,26 +88,20 @@ class TasksCog(commands.Cog):
                             f"➜ {command_pets_claim} - {pets_left} left. Next pet (`{next_pet_id}`) "
                             f'in **{timestring}**.'
                         )
-                time_left = get_time_left()
-                try:
-                    await asyncio.sleep(time_left.total_seconds())
-                    if user_settings.ready_pets_claim_after_every_pet and reminder.activity.startswith('pets'):
-                        await user_settings.update(ready_pets_claim_active=True)
-                    if reminder.activity == 'dragon-breath-potion':
-                        await user_settings.update(potion_dragon_breath_active=False)
-                    elif reminder.activity == 'round-card':
-                        await reminders.increase_reminder_time_percentage(user.id, 95, strings.ROUND_CARD_AFFECTED_ACTIVITIES,
-                                                                          user_settings)
-                        await user_settings.update(round_card_active=False)
-                    for message in messages.values():
-                        for found_id in re.findall(r'<@!?(\d{16,20})>', message):
-                            if int(found_id) not in user_settings.alts and int(found_id) != user_settings.user_id:
-                                message = re.sub(rf'<@!?{found_id}>', '-Removed alt-', message)
-                        await channel.send(message.strip())
-                except asyncio.CancelledError:
-                    return
-                except discord.errors.Forbidden:
-                    return
+                if user_settings.ready_pets_claim_after_every_pet and reminder.activity.startswith('pets'):
+                    await user_settings.update(ready_pets_claim_active=True)
+                if reminder.activity == 'dragon-breath-potion':
+                    await user_settings.update(potion_dragon_breath_active=False)
+                elif reminder.activity == 'round-card':
+                    await reminders.increase_reminder_time_percentage(user.id, 95, strings.ROUND_CARD_AFFECTED_ACTIVITIES,
+                                                                      user_settings)
+                    await user_settings.update(round_card_active=False)
+                allowed_ids = {str(user_settings.user_id), *(str(alt_id) for alt_id in user_settings.alts)}
+                for message in messages.values():
+                    message = USER_MENTION.sub(
+                        lambda match: match.group(0) if match.group(1) in allowed_ids else '-Removed alt-', message
+                    )
+                    delivery.delivery_queue.enqueue(channel, message.strip(), priority=delivery.PRIORITY_REMINDER)
 
             if first_reminder.reminder_type == 'clan':
                 channel = await functions.get_discord_channel(self.bot, first_reminder.channel_id)
@@ -127,116 +115,78 @@ class TasksCog(commands.Cog):
                         alert_message = strings.SLASH_COMMANDS["guild raid"]
                     else:
                         alert_message = strings.SLASH_COMMANDS["guild upgrade"]
-                    time_left = get_time_left()
-                    try:
-                        await asyncio.sleep(time_left.total_seconds())
-                        await channel.send(
-                            f'<@{quest_user_id}> Hey! It\'s time for your raid quest. '
-                            f'You have 5 minutes, chop chop.'
-                        )
-                        reminder: reminders.Reminder = (
-                            await reminders.insert_clan_reminder(clan.clan_name, time_left_all_members,
-                                                                 clan.channel_id, alert_message)
-                        )
-                        return
-                    except asyncio.CancelledError:
-                        return
+                    delivery.delivery_queue.enqueue(
+                        channel,
+                        f'<@{quest_user_id}> Hey! It\'s time for your raid quest. You have 5 minutes, chop chop.',
+                        priority=delivery.PRIORITY_REMINDER
+                    )
+                    reminder: reminders.Reminder = (
+                        await reminders.insert_clan_reminder(clan.clan_name, time_left_all_members,
+                                                             clan.channel_id, alert_message)
+                    )
+                    return
                 message_mentions = ''
                 for member_id in clan.member_ids:
                     if member_id is not None:
                         message_mentions = f'{message_mentions}<@{member_id}> '
-                time_left = get_time_left()
-                try:
-                    await asyncio.sleep(time_left.total_seconds())
-                    await channel.send(f'It\'s time for {first_reminder.message}!\n\n{message_mentions}')
-                except asyncio.CancelledError:
-                    return
-                except discord.errors.Forbidden:
-                    return
-            running_tasks.pop(first_reminder.task_name, None)
-        except discord.errors.Forbidden:
-            return
+                delivery.delivery_queue.enqueue(
+                    channel, f'It\'s time for {first_reminder.message}!\n\n{message_mentions}',
+                    priority=delivery.PRIORITY_REMINDER
+                )
         except Exception as error:
             await errors.log_error(error)
 
-    async def create_task(self, reminders_list: List[reminders.Reminder]) -> None:
-        """Creates a new background task"""
-        await self.delete_task(reminders_list[0].task_name)
-        task = self.bot.loop.create_task(self.background_task(reminders_list))
-        running_tasks[reminders_list[0].task_name] = task
-
-    async def delete_task(self, task_name: str) -> None:
-        """Stops and deletes a running task if it exists"""
-        if task_name in running_tasks:
-            running_tasks[task_name].cancel()
-            running_tasks.pop(task_name, None)
-        return
+    async def fire_reminders(self, due_reminders: List[reminders.Reminder]) -> None:
+        """Gets called by the reminder scheduler with all reminders that are due.
+        Reminders that fire at the same second for the same user in the same channel are combined into one task.
+        """
+        user_reminders = {}
+        current_time = datetime.utcnow()
+        for reminder in due_reminders:
+            metrics.observe(metrics.REMINDER_DELAY, reminder.reminder_type,
+                            max((current_time - reminder.end_time).total_seconds(), 0))
+            if reminder.reminder_type == 'user':
+                reminder_user_channel = f'{reminder.user_id}-{reminder.channel_id}-{reminder.end_time}'
+                if reminder_user_channel in user_reminders:
+                    user_reminders[reminder_user_channel].append(reminder)
+                else:
+                    user_reminders[reminder_user_channel] = [reminder,]
+            else:
+                self.bot.loop.create_task(self.send_reminders([reminder,]))
+        for reminders_list in user_reminders.values():
+            reminders_list.sort(key=lambda reminder: reminder.activity)
+            pet_reminders = []
+            other_reminders = []
+            for reminder in reminders_list:
+                if reminder.activity.startswith('pets'):
+                    pet_reminders.append(reminder)
+                else:
+                    other_reminders.append(reminder)
+            self.bot.loop.create_task(self.send_reminders(other_reminders + pet_reminders))
 
     # Events
     @commands.Cog.listener()
     async def on_ready(self) -> None:
         """Fires when bot has finished starting"""
         reminders.schedule_reminders.start()
+        reminders.reminder_scheduler.start(self.fire_reminders)
         self.delete_old_reminders.start()
         self.reset_clans.start()
-        self.schedule_tasks.start()
         self.consolidate_tracking_log.start()
         self.delete_old_messages_from_cache.start()
         self.reset_trade_daily_done.start()
+        self.measure_event_loop_lag.start()
+        self.write_metrics_file.start()
+        if settings.NAVI_DB.journal_mode == 'wal': self.checkpoint_database.start()
 
     # Tasks
-    @tasks.loop(seconds=0.5)
-    async def schedule_tasks(self):
-        """Task that creates or deletes tasks from scheduled reminders.
-        Reminders that fire at the same second for the same user in the same channel are combined into one task.
-        """
-        user_reminders = {}
-        for reminder in reminders.scheduled_for_tasks.copy().values():
-            reminders.scheduled_for_tasks.pop(reminder.task_name, None)
-            if reminder.reminder_type == 'user':
-                reminder_user_channel = f'{reminder.user_id}-{reminder.channel_id}-{reminder.end_time}'
-                if reminder_user_channel in user_reminders:
-                    user_reminders[reminder_user_channel].append(reminder)
-                else:
-                    user_reminders[reminder_user_channel] = [reminder,]
-            else:
-                await self.create_task([reminder,])
-        for reminder in reminders.scheduled_for_deletion.copy().values():
-            reminders.scheduled_for_deletion.pop(reminder.task_name, None)
-            await self.delete_task(reminder.task_name)
-        if user_reminders:
-            for reminders_list in user_reminders.values():
-                reminders_list.sort(key=lambda reminder: reminder.activity)
-                pet_reminders = []
-                other_reminders = []
-                for reminder in reminders_list:
-                    if reminder.activity.startswith('pets'):
-                        pet_reminders.append(reminder)
-                    else:
-                        other_reminders.append(reminder)
-                await self.create_task(other_reminders + pet_reminders)
-
     @tasks.loop(minutes=2.0)
     async def delete_old_reminders(self) -> None:
         """Task that deletes all old reminders"""
         try:
-            old_user_reminders = await reminders.get_old_user_reminders()
-        except:
-            old_user_reminders = ()
-        try:
-            old_clan_reminders = await reminders.get_old_clan_reminders()
-        except:
-            old_clan_reminders = ()
-        old_reminders = list(old_user_reminders) + list(old_clan_reminders)
-
-        for reminder in old_reminders:
-            try:
-                await reminder.delete()
-            except Exception as error:
-                await errors.log_error(
-                    f'Error deleting old reminder.\nFunction: delete_old_reminders\n'
-                    f'Reminder: {reminder}\nError: {error}'
-            )
+            await reminders.delete_old_reminders()
+        except sqlite3.Error:
+            pass
 
     @tasks.loop(seconds=60)
     async def reset_clans(self) -> None:
@@ -308,36 +258,19 @@ class TasksCog(commands.Cog):
         start_time = datetime.utcnow().replace(microsecond=0)
         if start_time.hour == 0 and start_time.minute == 15:
             start_time = datetime.utcnow().replace(microsecond=0)
-            log_entry_count = 0
-            try:
-                old_log_entries = await tracking.get_old_log_entries(28)
-            except exceptions.NoDataFoundError:
-                logs.logger.info('Didn\'t find any log entries to consolidate.')
-                return
-            entries = {}
-            for log_entry in old_log_entries:
-                date_time = log_entry.date_time.replace(hour=23, minute=59, second=59, microsecond=999999)
-                key = (log_entry.user_id, log_entry.guild_id, log_entry.command, date_time)
-                amount = entries.get(key, 0)
-                entries[key] = amount + 1
-                log_entry_count += 1
-            for key, amount in entries.items():
-                user_id, guild_id, command, date_time = key
-                summary_log_entry = await tracking.insert_log_summary(user_id, guild_id, command, date_time, amount)
-                date_time_min = date_time.replace(hour=0, minute=0, second=0, microsecond=0)
-                date_time_max = date_time.replace(hour=23, minute=59, second=59, microsecond=999999)
-                await tracking.delete_log_entries(user_id, guild_id, command, date_time_min, date_time_max)
-                await asyncio.sleep(0.01)
-            cur = settings.NAVI_DB.cursor()
             date_time = datetime.utcnow() - timedelta(days=366)
             date_time = date_time.replace(hour=0, minute=0, second=0)
             sql = 'DELETE FROM tracking_log WHERE date_time<?'
             try:
-                cur.execute(sql, (date_time,))
-                cur.execute('VACUUM')
+                log_entry_count = await tracking.consolidate_log_entries(28)
+                await settings.NAVI_DB.execute_async(sql, (date_time,))
+                await settings.NAVI_DB.incremental_vacuum_async(settings.DB_VACUUM_STEP_PAGES)
             except sqlite3.Error as error:
                 logs.logger.error(f'Error while consolidating: {error}')
                 raise
+            if log_entry_count == 0:
+                logs.logger.info('Didn\'t find any log entries to consolidate.')
+                return
             end_time = datetime.utcnow().replace(microsecond=0)
             time_passed = end_time - start_time
             logs.logger.info(f'Consolidated {log_entry_count:,} log entries in {format_timespan(time_passed)}.')
@@ -347,9 +280,10 @@ class TasksCog(commands.Cog):
         """Task that resets the daily trade amounts to 0"""
         current_time = datetime.utcnow().replace(microsecond=0)
         if current_time.hour == 0 and current_time.minute == 0:
-            all_user_settings = await users.get_all_users()
-            for user_settings in all_user_settings:
-                if user_settings.trade_daily_done != 0: await user_settings.update(trade_daily_done=0)
+            try:
+                await users.reset_trade_daily_done()
+            except sqlite3.Error:
+                pass
 
     @tasks.loop(minutes=5)
     async def delete_old_messages_from_cache(self) -> None:
@@ -358,6 +292,37 @@ class TasksCog(commands.Cog):
         if settings.DEBUG_MODE:
             logs.logger.debug(f'Deleted {deleted_messages_count} messages from message cache.')
 
+    @tasks.loop(seconds=settings.METRICS_LOOP_LAG_INTERVAL)
+    async def measure_event_loop_lag(self) -> None:
+        """Measures how long a callback waits until the event loop runs it"""
+        start_time = time.perf_counter()
+        await asyncio.sleep(0)
+        metrics.observe(metrics.EVENT_LOOP_LAG, 'main', time.perf_counter() - start_time)
+
+    @tasks.loop(seconds=settings.METRICS_FILE_INTERVAL)
+    async def write_metrics_file(self) -> None:
+        """Writes all metrics to the metrics file in the Prometheus text format"""
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, metrics.write_file, settings.METRICS_FILE, metrics.render_prometheus()
+            )
+        except OSError as error:
+            logs.logger.error(f'Couldn\'t write metrics file: {error}')
+
+    @tasks.loop(seconds=settings.DB_CHECKPOINT_INTERVAL)
+    async def checkpoint_database(self) -> None:
+        """Task that copies the WAL file back into the database"""
+        try:
+            busy, log_frames, checkpointed_frames = await settings.NAVI_DB.run_async(settings.NAVI_DB.checkpoint)
+        except sqlite3.Error as error:
+            logs.logger.error(f'Database: Error while running WAL checkpoint: {error}')
+            return
+        if settings.DEBUG_MODE:
+            logs.logger.debug(
+                f'Database: WAL checkpoint done. Busy: {busy}, WAL frames: {log_frames}, '
+                f'checkpointed frames: {checkpointed_frames}'
+            )
+
 # Initialization
 def setup(bot):
     bot.add_cog(TasksCog(bot))
\ No newline at end of file
@@ -16,6 +16,8 @@ from resources import emojis, functions, exceptions, regex, settings
 
 class TrackingCog(commands.Cog):
     """Cog with command tracking commands"""
+    dispatch_edits = True
+
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
@@ -50,21 +52,6 @@ class TrackingCog(commands.Cog):
         await tracking_cmd.command_stats(self.bot, ctx, timestring, user)
 
     # Events
-    @commands.Cog.listener()
-    async def on_message_edit(self, message_before: discord.Message, message_after: discord.Message) -> None:
-        """Runs when a message is edited in a channel."""
-        if message_before.pinned != message_after.pinned: return
-        embed_data_before = await functions.parse_embed(message_before)
-        embed_data_after = await functions.parse_embed(message_after)
-        if (message_before.content == message_after.content and embed_data_before == embed_data_after
-            and message_before.components == message_after.components): return
-        for row in message_after.components:
-            for component in row.children:
-                if component.disabled:
-                    return
-        await self.on_message(message_after)
-
-    @commands.Cog.listener()
     async def on_message(self, message: discord.Message) -> None:
         """Fires when a message is sent"""
         if message.author.id in [settings.EPIC_RPG_ID, settings.TESTY_ID]:
@@ -9,7 +9,7 @@ from typing import List, Optional, Union
 import discord
 from discord.ext import commands
 
-from database import clans, guilds, portals, reminders, tracking, users
+from database import alts, clans, guilds, portals, reminders, tracking, users
 from resources import emojis, exceptions, functions, settings, strings, views
 
 
@@ -266,7 +266,6 @@ async def command_purge_data(bot: discord.Bot, ctx: discord.ApplicationContext)
                 interaction, content=answer_timeout, view=None
             )
         elif view.value == 'confirm':
-            cur = settings.NAVI_DB.cursor()
             await functions.edit_interaction(
                 interaction, content='Purging user settings...',
                 view=None
@@ -277,31 +276,34 @@ async def command_purge_data(bot: discord.Bot, ctx: discord.ApplicationContext)
                     await partner_settings.update(partner_id=None)
                 except exceptions.FirstTimeUserError:
                     pass
-            cur.execute('DELETE FROM users WHERE user_id=?', (ctx.author.id,))
+            await users.delete_user(ctx.author.id)
             await asyncio.sleep(1)
             await functions.edit_interaction(
                 interaction, content='Purging alts...',
                 view=None
             )
-            cur.execute('DELETE FROM alts WHERE user1_id=? OR user2_id=?', (ctx.author.id, ctx.author.id))
+            await alts.delete_all_alts(ctx.author.id)
+            for alt_id in user_settings.alts:
+                users.remove_user_from_cache(alt_id)
             await asyncio.sleep(1)
             await functions.edit_interaction(
                 interaction, content='Purging reminders...',
                 view=None
             )
-            cur.execute('DELETE FROM reminders_users WHERE user_id=?', (ctx.author.id,))
+            await settings.NAVI_DB.execute_async('DELETE FROM reminders_users WHERE user_id=?', (ctx.author.id,))
+            reminders.remove_user_reminders_from_cache(ctx.author.id)
             await asyncio.sleep(1)
             await functions.edit_interaction(
                 interaction, content='Purging raid data...',
                 view=None
             )
-            cur.execute('DELETE FROM clans_raids WHERE user_id=?', (ctx.author.id,))
+            await settings.NAVI_DB.execute_async('DELETE FROM clans_raids WHERE user_id=?', (ctx.author.id,))
             await asyncio.sleep(1)
             await functions.edit_interaction(
                 interaction, content='Purging portals...',
                 view=None
             )
-            cur.execute('DELETE FROM users_portals WHERE user_id=?', (ctx.author.id,))
+            await settings.NAVI_DB.execute_async('DELETE FROM users_portals WHERE user_id=?', (ctx.author.id,))
             await asyncio.sleep(1)
             await functions.edit_interaction(
                 interaction, content='Purging tracking data... (this can take a while)',
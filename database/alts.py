@@ -1,45 +1,86 @@
 # alts.py
-"""Provides access to the table "alts" in the database"""
+"""Provides access to the table "alts" in the database.
+
+The whole table is kept in memory as an adjacency map that contains the alts of every user in both directions. It is
+loaded on first use and updated by insert_alt, delete_alt and delete_all_alts.
+"""
 
 
 import sqlite3
-from typing import Tuple
+from typing import Dict, List, Optional, Tuple
 
 from database import errors
 from resources import settings, strings
 
 
-# Read data
-async def get_alts(user_id: int) -> Tuple[int]:
-    """Gets all alts of a user
+# Alts of every user that has alts, in the order they were added. None until it is loaded.
+_ALTS: Optional[Dict[int, List[int]]] = None
+# Counts alt writes. The map is not stored if alts were changed while it was loading.
+_ALT_WRITES = {'count': 0}
 
-    Returns
-    -------
-    Tuple with all alts or an empty tuple if no alts were found.
+
+# Miscellaneous functions
+def _add_to_map(alts_map: Dict[int, List[int]], user_id: int, alt_id: int) -> None:
+    """Adds an alt to the adjacency map in both directions"""
+    for first_id, second_id in ((user_id, alt_id), (alt_id, user_id)):
+        user_alts = alts_map.setdefault(first_id, [])
+        if second_id not in user_alts: user_alts.append(second_id)
+
+
+def _remove_from_map(alts_map: Dict[int, List[int]], user_id: int, alt_id: int) -> None:
+    """Removes an alt from the adjacency map in both directions"""
+    for first_id, second_id in ((user_id, alt_id), (alt_id, user_id)):
+        user_alts = alts_map.get(first_id, None)
+        if user_alts is None: continue
+        if second_id in user_alts: user_alts.remove(second_id)
+        if not user_alts: del alts_map[first_id]
+
+
+async def _get_alts_map() -> Dict[int, List[int]]:
+    """Returns the adjacency map. Loads it if it isn't loaded yet.
 
     Raises
     ------
     sqlite3.Error if something happened within the database.
     Also logs all errors to the database.
     """
+    global _ALTS
+    if _ALTS is not None: return _ALTS
+    alt_writes = _ALT_WRITES['count']
     table = 'alts'
-    function_name = 'get_alts'
-    sql = f'SELECT user1_id, user2_id FROM {table} WHERE user1_id=? OR user2_id=? ORDER BY sort_index ASC'
+    function_name = '_get_alts_map'
+    sql = f'SELECT user1_id, user2_id FROM {table} ORDER BY sort_index ASC'
     try:
-        cur=settings.NAVI_DB.cursor()
-        cur.execute(sql, (user_id, user_id))
-        records = cur.fetchall()
+        records = await settings.NAVI_DB.fetchall_async(sql)
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
         )
-    alts = []
+        raise
+    alts_map = {}
     for record in records:
-        record = dict(record)
-        alt = record['user1_id'] if int(record['user2_id']) == user_id else record['user2_id']
-        alts.append(int(alt))
-        
-    return tuple(alts)
+        _add_to_map(alts_map, int(record['user1_id']), int(record['user2_id']))
+    if alt_writes == _ALT_WRITES['count'] and _ALTS is None: _ALTS = alts_map
+
+    return alts_map
+
+
+# Read data
+async def get_alts(user_id: int) -> Tuple[int]:
+    """Gets all alts of a user
+
+    Returns
+    -------
+    Tuple with all alts or an empty tuple if no alts were found.
+
+    Raises
+    ------
+    sqlite3.Error if something happened within the database.
+    Also logs all errors to the database.
+    """
+    alts_map = await _get_alts_map()
+
+    return tuple(alts_map.get(user_id, ()))
 
 
 # Write data
@@ -55,13 +96,14 @@ async def insert_alt(user_id: int, alt_id: int) -> None:
     table = 'alts'
     sql = f'INSERT INTO {table} (user1_id, user2_id) VALUES (?, ?)'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (user_id, alt_id))
+        await settings.NAVI_DB.execute_async(sql, (user_id, alt_id))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
         )
         raise
+    _ALT_WRITES['count'] += 1
+    if _ALTS is not None: _add_to_map(_ALTS, user_id, alt_id)
 
 
 async def delete_alt(user_id: int, alt_id: int) -> None:
@@ -76,10 +118,35 @@ async def delete_alt(user_id: int, alt_id: int) -> None:
     function_name = 'delete_alt'
     sql = f'DELETE FROM {table} WHERE (user1_id=? AND user2_id=?) OR (user1_id=? AND user2_id=?)'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (user_id, alt_id, alt_id, user_id))
+        await settings.NAVI_DB.execute_async(sql, (user_id, alt_id, alt_id, user_id))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
         )
-        raise
\ No newline at end of file
+        raise
+    _ALT_WRITES['count'] += 1
+    if _ALTS is not None: _remove_from_map(_ALTS, user_id, alt_id)
+
+
+async def delete_all_alts(user_id: int) -> None:
+    """Deletes all alt records of a user.
+
+    Raises
+    ------
+    sqlite3.Error if something happened within the database.
+    Also logs all errors to the database.
+    """
+    table = 'alts'
+    function_name = 'delete_all_alts'
+    sql = f'DELETE FROM {table} WHERE user1_id=? OR user2_id=?'
+    try:
+        await settings.NAVI_DB.execute_async(sql, (user_id, user_id))
+    except sqlite3.Error as error:
+        await errors.log_error(
+            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
+        )
+        raise
+    _ALT_WRITES['count'] += 1
+    if _ALTS is not None:
+        for alt_id in tuple(_ALTS.get(user_id, ())):
+            _remove_from_map(_ALTS, user_id, alt_id)
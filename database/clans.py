@@ -1,7 +1,17 @@
 # clans.py
-"""Provides access to the table "clans" in the database"""
+"""Provides access to the tables "clans", "clans_raids" and "clan_members" in the database.
 
+"clan_members" maps every leader and member id of a clan to the clan name, so a clan can be found by user id with one
+indexed lookup. Users in more than one clan are mapped to the clan that was created first. It is kept in sync by
+insert_clan, _update_clan and _delete_clan.
 
+The most recently used clans are cached by clan name. Clans that are changed by _update_clan or _delete_clan are
+removed from the cache.
+"""
+
+
+from collections import OrderedDict
+import copy
 from dataclasses import dataclass
 from datetime import datetime
 import sqlite3
@@ -11,6 +21,15 @@ from database import errors
 from resources import exceptions, settings, strings
 
 
+# Columns of table "clans" that contain the ids of the clan members
+CLAN_MEMBER_COLUMNS = ('leader_id',) + tuple(f'member{number}_id' for number in range(1, 11))
+
+# Most recently used clans, by clan name
+_CLANS: OrderedDict = OrderedDict()
+# Counts clan writes. Clans read during a write are not cached.
+_CLAN_WRITES = {'count': 0}
+
+
 # Containers
 @dataclass()
 class Clan():
@@ -64,7 +83,7 @@ class Clan():
         self.upgrade_quests_enabled = new_settings.upgrade_quests_enabled
 
     async def update(self, **kwargs) -> None:
-        """Updates the clan record in the database. Also calls refresh().
+        """Updates the clan record in the database and applies the changes to this object.
 
         Arguments
         ---------
@@ -88,7 +107,9 @@ class Clan():
         Also logs all errors to the database.
         """
         await _update_clan(self.clan_name, **kwargs)
-        await self.refresh()
+        for column, value in kwargs.items():
+            if column == 'member_ids': value = tuple(value) + (None,) * (10 - len(value))
+            setattr(self, column, value)
 
 
 class ClanRaid(NamedTuple):
@@ -112,6 +133,21 @@ class ClanWeeklyReport(NamedTuple):
     worst_raid: ClanRaid
 
 # Miscellaneous functions
+def _cache_clan(clan: Clan) -> None:
+    """Adds a copy of a clan to the clan cache. If the cache is full, the least recently used clans are removed."""
+    _CLANS[clan.clan_name] = copy.copy(clan)
+    _CLANS.move_to_end(clan.clan_name)
+    while len(_CLANS) > settings.USER_CACHE_SIZE:
+        _CLANS.popitem(last=False)
+
+
+def _remove_clan_from_cache(*clan_names: str) -> None:
+    """Removes clans from the clan cache after a write"""
+    _CLAN_WRITES['count'] += 1
+    for clan_name in clan_names:
+        _CLANS.pop(clan_name, None)
+
+
 async def _dict_to_clan(record: dict) -> Clan:
     """Creates a Clan object from a database record
 
@@ -212,13 +248,11 @@ async def get_clan_by_user_id(user_id: int) -> Clan:
     table = 'clans'
     function_name = 'get_clan_by_user_id'
     sql = (
-        f'SELECT * FROM {table} WHERE leader_id=? or member1_id=? or member2_id=? or member3_id=? or member4_id=? '
-        f'or member5_id=? or member6_id=? or member7_id=? or member8_id=? or member9_id=? or member10_id=?'
+        f'SELECT {table}.* FROM clan_members INNER JOIN {table} ON {table}.clan_name = clan_members.clan_name '
+        f'WHERE clan_members.user_id=?'
     )
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (user_id,) * 11)
-        record = cur.fetchone()
+        record = await settings.NAVI_DB.fetchone_async(sql, (user_id,))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -245,13 +279,16 @@ async def get_clan_by_clan_name(clan_name: str) -> Clan:
     LookupError if something goes wrong reading the dict.
     Also logs all errors to the database.
     """
+    cached_clan = _CLANS.get(clan_name, None)
+    if cached_clan is not None:
+        _CLANS.move_to_end(clan_name)
+        return copy.copy(cached_clan)
+    clan_writes = _CLAN_WRITES['count']
     table = 'clans'
     function_name = 'get_clan_by_clan_name'
     sql = f'SELECT * FROM {table} WHERE clan_name=?'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (clan_name,))
-        record = cur.fetchone()
+        record = await settings.NAVI_DB.fetchone_async(sql, (clan_name,))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -260,6 +297,7 @@ async def get_clan_by_clan_name(clan_name: str) -> Clan:
     if not record:
         raise exceptions.NoDataFoundError(f'No clan data found in database with clan name "{clan_name}".')
     clan = await _dict_to_clan(dict(record))
+    if clan_writes == _CLAN_WRITES['count']: _cache_clan(clan)
 
     return clan
 
@@ -282,9 +320,7 @@ async def get_all_clans() -> Tuple[Clan]:
     function_name = 'get_all_clans'
     sql = f'SELECT * FROM {table}'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql)
-        records = cur.fetchall()
+        records = await settings.NAVI_DB.fetchall_async(sql)
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -320,9 +356,7 @@ async def get_clan_raid(clan_name: str, user_id: str, raid_time: datetime) -> Cl
     function_name = 'get_clan_raid'
     sql = f'SELECT * FROM {table} WHERE clan_name=? AND user_id=? AND raid_time=?'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (clan_name, user_id, raid_time))
-        record = cur.fetchone()
+        record = await settings.NAVI_DB.fetchone_async(sql, (clan_name, user_id, raid_time))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -356,9 +390,7 @@ async def get_leaderboard(clan: Clan) -> ClanLeaderboard:
     stealth_threshold = 1000
     sql = f'SELECT * FROM {table} WHERE clan_name=? AND energy>={stealth_threshold} ORDER BY energy DESC LIMIT 5'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (clan.clan_name,))
-        records_best = cur.fetchall()
+        records_best = await settings.NAVI_DB.fetchall_async(sql, (clan.clan_name,))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -366,9 +398,7 @@ async def get_leaderboard(clan: Clan) -> ClanLeaderboard:
         raise
     sql = f'SELECT * FROM {table} WHERE clan_name=? AND energy<{stealth_threshold} ORDER BY energy ASC LIMIT 5'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (clan.clan_name,))
-        records_worst = cur.fetchall()
+        records_worst = await settings.NAVI_DB.fetchall_async(sql, (clan.clan_name,))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -408,9 +438,7 @@ async def get_weekly_report(clan: Clan) -> ClanWeeklyReport:
     function_name = 'get_weekly_report'
     sql = f'SELECT text FROM {table} ORDER BY RANDOM() LIMIT 1'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql)
-        praise_record = cur.fetchone()
+        praise_record = await settings.NAVI_DB.fetchone_async(sql)
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -419,9 +447,7 @@ async def get_weekly_report(clan: Clan) -> ClanWeeklyReport:
     table = 'clans_leaderboard_roasts'
     sql = f'SELECT text FROM {table} ORDER BY RANDOM() LIMIT 1'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql)
-        roast_record = cur.fetchone()
+        roast_record = await settings.NAVI_DB.fetchone_async(sql)
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -430,9 +456,7 @@ async def get_weekly_report(clan: Clan) -> ClanWeeklyReport:
     table = 'clans_raids'
     sql = f'SELECT energy FROM {table} WHERE clan_name=?'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (clan.clan_name,))
-        all_raids_records = cur.fetchall()
+        all_raids_records = await settings.NAVI_DB.fetchall_async(sql, (clan.clan_name,))
     except:
         raise exceptions.NoDataFoundError(f'No raids found for clan {clan.clan_name}')
     energy_total = 0
@@ -451,6 +475,72 @@ async def get_weekly_report(clan: Clan) -> ClanWeeklyReport:
 
 
 # Write Data
+async def _update_clan_members(clan_name_old: Optional[str], clan_name_new: Optional[str]) -> None:
+    """Updates the records in the table "clan_members" of all users that were or are in a changed clan.
+    The records of these users are rebuilt from all clans in the table "clans", so a user that is in more than one
+    clan keeps a record as long as one of them is left. If a user is in more than one clan, the clan that was created
+    first is used, the same clan a search through "clans" finds first.
+
+    Arguments
+    ---------
+    clan_name_old: Clan name the records are currently stored with. None if the clan is new.
+    clan_name_new: Clan name after the change. None if the clan was deleted.
+
+    Raises
+    ------
+    sqlite3.Error if something happened within the database.
+    Also logs all errors to the database.
+    """
+    table = 'clan_members'
+    function_name = '_update_clan_members'
+    sql_old_members = f'SELECT user_id FROM {table} WHERE clan_name=?'
+    sql_new_members = f'SELECT {", ".join(CLAN_MEMBER_COLUMNS)} FROM clans WHERE clan_name=?'
+    sql_all_members = ' UNION ALL '.join(
+        f'SELECT rowid AS clan_rowid, {column} AS user_id, clan_name FROM clans WHERE {column} IS NOT NULL'
+        for column in CLAN_MEMBER_COLUMNS
+    )
+    sql_delete = f'DELETE FROM {table} WHERE user_id IN ({{user_ids}})'
+    sql_insert = (
+        f'INSERT OR IGNORE INTO {table} (user_id, clan_name) SELECT user_id, clan_name '
+        f'FROM ({sql_all_members}) WHERE user_id IN ({{user_ids}}) ORDER BY clan_rowid'
+    )
+
+    def update_members() -> None:
+        """Runs on the database thread"""
+        cur = settings.NAVI_DB.cursor()
+        cur.execute('BEGIN')
+        try:
+            user_ids = set()
+            if clan_name_old is not None:
+                cur.execute(sql_old_members, (clan_name_old,))
+                user_ids.update(record[0] for record in cur.fetchall())
+            if clan_name_new is not None:
+                cur.execute(sql_new_members, (clan_name_new,))
+                record = cur.fetchone()
+                if record is not None:
+                    user_ids.update(user_id for user_id in record if user_id is not None)
+            if user_ids:
+                user_ids = tuple(user_ids)
+                placeholders = ', '.join('?' * len(user_ids))
+                cur.execute(sql_delete.format(user_ids=placeholders), user_ids)
+                cur.execute(sql_insert.format(user_ids=placeholders), user_ids)
+            cur.execute('COMMIT')
+        except sqlite3.Error:
+            cur.execute('ROLLBACK')
+            raise
+
+    try:
+        await settings.NAVI_DB.run_async(update_members)
+    except sqlite3.Error as error:
+        await errors.log_error(
+            strings.INTERNAL_ERROR_SQLITE3.format(
+                error=error, table=table, function=function_name,
+                sql=f'{sql_old_members}; {sql_new_members}; {sql_delete}; {sql_insert}'
+            )
+        )
+        raise
+
+
 async def _delete_clan(clan_name: str) -> None:
     """Deletes clan record. Use Clan.delete() to trigger this function.
 
@@ -463,13 +553,14 @@ async def _delete_clan(clan_name: str) -> None:
     function_name = '_delete_clan'
     sql = f'DELETE FROM {table} WHERE clan_name=?'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (clan_name,))
+        await settings.NAVI_DB.execute_async(sql, (clan_name,))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
         )
         raise
+    _remove_clan_from_cache(clan_name)
+    await _update_clan_members(clan_name, None)
     await delete_clan_leaderboard()
 
 
@@ -515,19 +606,21 @@ async def _update_clan(current_clan_name: str, **kwargs) -> None:
             kwargs[f'member{index+1}_id'] = member_id
         kwargs.pop('member_ids', None)
     try:
-        cur = settings.NAVI_DB.cursor()
         sql = f'UPDATE {table} SET'
         for kwarg in kwargs:
             sql = f'{sql} {kwarg} = :{kwarg},'
         sql = sql.strip(",")
         kwargs['clan_name_old'] = current_clan_name
         sql = f'{sql} WHERE clan_name = :clan_name_old'
-        cur.execute(sql, kwargs)
+        await settings.NAVI_DB.execute_async(sql, kwargs)
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
         )
         raise
+    _remove_clan_from_cache(current_clan_name, kwargs.get('clan_name', current_clan_name))
+    if 'clan_name' in kwargs or any(column in kwargs for column in CLAN_MEMBER_COLUMNS):
+        await _update_clan_members(current_clan_name, kwargs.get('clan_name', current_clan_name))
 
 
 async def delete_clan_leaderboard(clan_name: Optional[str] = None) -> None:
@@ -542,8 +635,7 @@ async def delete_clan_leaderboard(clan_name: Optional[str] = None) -> None:
     function_name = 'delete_clan_leaderboard'
     sql = f'DELETE FROM {table}' if clan_name is None else f'DELETE FROM {table} WHERE clan_name=?'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql) if clan_name is None else cur.execute(sql, (clan_name,))
+        await settings.NAVI_DB.execute_async(sql, () if clan_name is None else (clan_name,))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -579,15 +671,14 @@ async def insert_clan(clan_name: str, leader_id: int, member_ids: Union[Tuple[in
         f'(clan_name, stealth_current, stealth_threshold, leader_id, '
         f'member1_id, member2_id, member3_id, member4_id, member5_id, '
         f'member6_id, member7_id, member8_id, member9_id, member10_id) '
-        f'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+        f'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) RETURNING *'
     )
     member_ids_all = [None] * 10
     if member_ids is not None:
         for index, member_id in enumerate(member_ids):
             member_ids_all[index] = member_id
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(
+        record = await settings.NAVI_DB.fetchone_async(
             sql,
             (clan_name, 1, settings.CLAN_DEFAULT_STEALTH_THRESHOLD, leader_id,
              member_ids_all[0], member_ids_all[1], member_ids_all[2], member_ids_all[3], member_ids_all[4],
@@ -598,7 +689,10 @@ async def insert_clan(clan_name: str, leader_id: int, member_ids: Union[Tuple[in
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
         )
         raise
-    clan = await get_clan_by_clan_name(clan_name)
+    await _update_clan_members(None, clan_name)
+    clan = await _dict_to_clan(dict(record))
+    _remove_clan_from_cache(clan_name)
+    _cache_clan(clan)
 
     return clan
 
@@ -619,13 +713,12 @@ async def insert_clan_raid(clan_name: str, user_id: int, energy: int, raid_time:
     table = 'clans_raids'
     sql = f'INSERT INTO {table} (clan_name, user_id, energy, raid_time) VALUES (?, ?, ?, ?)'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (clan_name, user_id, energy, raid_time))
+        await settings.NAVI_DB.execute_async(sql, (clan_name, user_id, energy, raid_time))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
         )
         raise
-    clan_raid = await get_clan_raid(clan_name, user_id, raid_time)
+    clan_raid = ClanRaid(clan_name=clan_name, energy=energy, raid_time=raid_time, user_id=user_id)
 
     return clan_raid
\ No newline at end of file
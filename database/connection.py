@@ -0,0 +1,352 @@
+# connection.py
+"""Contains the connection class used for the database, including the database thread, the read connection and the
+optional write-behind queue.
+
+All queries the bot runs while the event loop is running are executed on a dedicated database thread, so a slow query
+never blocks the event loop. Use the awaitable methods execute_async, fetchone_async, fetchall_async and run_async for
+this. Since there is only one database thread, queries are executed in the order they were issued.
+
+If the database runs in WAL mode, a second connection can be opened for reads. It has its own thread, so reads don't
+have to wait for writes. Reads only use it if no write is pending, so they always see all previous writes.
+
+If the write-behind queue is enabled, INSERT, UPDATE, DELETE and REPLACE statements issued with execute_async are not
+executed right away. They are queued and all writes issued within a few milliseconds are committed together in one
+transaction. Every other statement flushes the queue first, so reads always see all previous writes. Statements
+within a transaction on the database thread don't flush the queue, it is flushed when the transaction ended.
+
+The duration of every awaited call is recorded in resources.metrics, labeled with the database function that made
+the call.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import functools
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from resources import metrics
+
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+MAX_QUEUED_WRITES = 1000
+
+logger = logging.getLogger('Navi')
+
+
+def _is_read(sql: str) -> bool:
+    """Checks if a statement only reads data. Writes with RETURNING are fetched like reads but can't use the read
+    connection."""
+    return sql.lstrip().upper().startswith('SELECT')
+
+
+def _is_write(sql: str) -> bool:
+    """Checks if a statement only writes data and doesn't return anything"""
+    sql = sql.lstrip().upper()
+    return sql.startswith(WRITE_STATEMENTS) and 'RETURNING' not in sql
+
+
+def _get_caller_name() -> str:
+    """Returns module and name of the first function outside of this module in the call stack, e.g.
+    users.get_user"""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals.get('__name__') == __name__:
+        frame = frame.f_back
+    if frame is None: return 'unknown'
+    return f'{frame.f_globals.get("__name__", "").rpartition(".")[2]}.{frame.f_code.co_name}'
+
+
+def _ends_transaction(sql: str) -> bool:
+    """Checks if a statement commits or rolls back a transaction"""
+    return sql.lstrip().upper().startswith(('COMMIT', 'END', 'ROLLBACK'))
+
+
+class NaviCursor(sqlite3.Cursor):
+    """Cursor that flushes the write-behind queue of its connection before executing anything. Within a transaction,
+    the queue is flushed after the transaction ended instead."""
+    def execute(self, sql: str, parameters: Any = ()) -> sqlite3.Cursor:
+        self.connection.flush_writes()
+        cursor = super().execute(sql, parameters)
+        if _ends_transaction(sql): self.connection.flush_writes()
+        return cursor
+
+    def executemany(self, sql: str, seq_of_parameters: Any) -> sqlite3.Cursor:
+        self.connection.flush_writes()
+        return super().executemany(sql, seq_of_parameters)
+
+
+class NaviConnection(sqlite3.Connection):
+    """Connection that creates NaviCursor objects and runs queries on the database thread.
+    The connection has to be opened with check_same_thread=False.
+
+    The write-behind queue is disabled by default. Set write_behind_delay to the amount of seconds writes are held
+    back to enable it.
+    """
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.write_behind_delay: Optional[float] = None
+        self.queued_writes: List[Tuple[str, Any]] = []
+        self.flushed_writes = 0
+        self.flushed_transactions = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._queue_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='navi-db')
+        self._pending_jobs = 0
+        self._pending_flushes = 0
+        self.journal_mode: Optional[str] = None
+        self.read_connection: Optional[sqlite3.Connection] = None
+        self.reads_on_read_connection = 0
+        self._read_executor: Optional[ThreadPoolExecutor] = None
+        self.checkpoint_stats: Dict[str, Any] = {
+            'count': 0,
+            'busy': 0,
+            'last_time': None,
+            'last_duration': 0.0,
+            'last_log_frames': 0,
+            'last_checkpointed_frames': 0,
+        }
+
+    def cursor(self, factory=NaviCursor) -> sqlite3.Cursor:
+        return super().cursor(factory)
+
+    # Database thread
+    async def run_async(self, function: Callable, *args, **kwargs) -> Any:
+        """Runs a function on the database thread and returns its result.
+        Use this for everything that needs more than one statement, e.g. transactions. The function can use
+        this connection synchronously.
+        """
+        loop = asyncio.get_running_loop()
+        caller_name = _get_caller_name()
+        start_time = time.perf_counter()
+        self._pending_jobs += 1
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(function, *args, **kwargs))
+        finally:
+            self._pending_jobs -= 1
+            metrics.observe(metrics.SQL_DURATION, caller_name, time.perf_counter() - start_time)
+
+    async def execute_async(self, sql: str, parameters: Any = ()) -> None:
+        """Executes a statement on the database thread. Writes are queued if the write-behind queue is enabled."""
+        if self.write_behind_delay is not None and _is_write(sql):
+            self.queue_write(sql, parameters)
+            return
+        await self.run_async(self._execute, sql, parameters)
+
+    async def fetchone_async(self, sql: str, parameters: Any = ()) -> Optional[sqlite3.Row]:
+        """Executes a query on the read or the database thread and returns the first row"""
+        if self._can_use_read_connection(sql):
+            return await self._run_read(self._fetchone_read, sql, parameters)
+        return await self.run_async(self._fetchone, sql, parameters)
+
+    async def fetchall_async(self, sql: str, parameters: Any = ()) -> List[sqlite3.Row]:
+        """Executes a query on the read or the database thread and returns all rows"""
+        if self._can_use_read_connection(sql):
+            return await self._run_read(self._fetchall_read, sql, parameters)
+        return await self.run_async(self._fetchall, sql, parameters)
+
+    def _execute(self, sql: str, parameters: Any = ()) -> None:
+        self.cursor().execute(sql, parameters)
+
+    def _fetchone(self, sql: str, parameters: Any = ()) -> Optional[sqlite3.Row]:
+        cur = self.cursor().execute(sql, parameters)
+        if _is_read(sql): return cur.fetchone()
+        # A write with RETURNING only finishes and commits after all rows are fetched
+        records = cur.fetchall()
+        return records[0] if records else None
+
+    def _fetchall(self, sql: str, parameters: Any = ()) -> List[sqlite3.Row]:
+        return self.cursor().execute(sql, parameters).fetchall()
+
+    # Read connection
+    def open_read_connection(self, database: str, pragmas: Optional[List[str]] = None, **kwargs) -> None:
+        """Opens the read connection. Does nothing if the database doesn't run in WAL mode, because readers would
+        block the writer otherwise.
+
+        Arguments
+        ---------
+        database: Path of the database file
+        pragmas: List of pragma statements that are run on the read connection
+        kwargs: Passed to sqlite3.connect()
+        """
+        if self.journal_mode != 'wal' or self.read_connection is not None: return
+        self.read_connection = sqlite3.connect(database, isolation_level=None, check_same_thread=False, **kwargs)
+        self.read_connection.row_factory = self.row_factory
+        cur = self.read_connection.cursor()
+        cur.execute('PRAGMA query_only=ON')
+        for pragma in pragmas or []:
+            cur.execute(pragma)
+        self._read_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='navi-db-read')
+
+    def _can_use_read_connection(self, sql: str) -> bool:
+        """Checks if a query can go to the read connection without missing a write that isn't committed yet"""
+        return (
+            self.read_connection is not None and self._pending_jobs == 0 and self._pending_flushes == 0
+            and not self.queued_writes and _is_read(sql)
+        )
+
+    async def _run_read(self, function: Callable, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        caller_name = _get_caller_name()
+        start_time = time.perf_counter()
+        self.reads_on_read_connection += 1
+        try:
+            return await loop.run_in_executor(self._read_executor, functools.partial(function, *args))
+        finally:
+            metrics.observe(metrics.SQL_DURATION, caller_name, time.perf_counter() - start_time)
+
+    def _fetchone_read(self, sql: str, parameters: Any = ()) -> Optional[sqlite3.Row]:
+        return self.read_connection.execute(sql, parameters).fetchone()
+
+    def _fetchall_read(self, sql: str, parameters: Any = ()) -> List[sqlite3.Row]:
+        return self.read_connection.execute(sql, parameters).fetchall()
+
+    # Database profile
+    def apply_profile(self, pragmas: List[str]) -> None:
+        """Switches the database to WAL mode and runs the given pragma statements.
+        If the database can't be switched to WAL mode (e.g. in-memory databases), the journal mode stays unchanged.
+        """
+        cur = sqlite3.Cursor(self)
+        self.journal_mode = cur.execute('PRAGMA journal_mode=WAL').fetchone()[0].lower()
+        if self.journal_mode != 'wal':
+            logger.warning(f'Database: Couldn\'t enable WAL mode, journal mode is {self.journal_mode}.')
+        for pragma in pragmas:
+            cur.execute(pragma)
+
+    def checkpoint(self) -> Tuple[int, int, int]:
+        """Runs a passive WAL checkpoint. This doesn't wait for readers, so it never blocks. Use run_async.
+
+        Returns
+        -------
+        Tuple with busy flag, frames in the WAL and frames checkpointed
+        """
+        self.flush_writes()
+        start_time = time.perf_counter()
+        busy, log_frames, checkpointed_frames = (
+            sqlite3.Cursor(self).execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+        )
+        self.checkpoint_stats['count'] += 1
+        if busy: self.checkpoint_stats['busy'] += 1
+        self.checkpoint_stats['last_time'] = datetime.utcnow().replace(microsecond=0)
+        self.checkpoint_stats['last_duration'] = time.perf_counter() - start_time
+        self.checkpoint_stats['last_log_frames'] = log_frames
+        self.checkpoint_stats['last_checkpointed_frames'] = checkpointed_frames
+
+        return (busy, log_frames, checkpointed_frames)
+
+    def incremental_vacuum(self, max_pages: int) -> Tuple[int, int]:
+        """Frees up to max_pages unused pages of the database file. Use run_async or incremental_vacuum_async.
+        Does nothing if the database doesn't use auto_vacuum=INCREMENTAL.
+
+        Returns
+        -------
+        Tuple with pages freed and free pages left
+        """
+        self.flush_writes()
+        cur = sqlite3.Cursor(self)
+        if cur.execute('PRAGMA auto_vacuum').fetchone()[0] != 2: return (0, 0)
+        free_pages = cur.execute('PRAGMA freelist_count').fetchone()[0]
+        if not free_pages: return (0, 0)
+        # Every step of the pragma only frees one page, so it has to run as a script
+        cur.executescript(f'PRAGMA incremental_vacuum({int(max_pages)})')
+        free_pages_left = cur.execute('PRAGMA freelist_count').fetchone()[0]
+
+        return (free_pages - free_pages_left, free_pages_left)
+
+    async def incremental_vacuum_async(self, step_pages: int) -> int:
+        """Frees all unused pages of the database file in steps of step_pages. Every step is its own job on the
+        database thread, so other queries can run in between.
+
+        Returns
+        -------
+        Amount of pages freed
+        """
+        pages_freed = 0
+        while True:
+            step_pages_freed, free_pages_left = await self.run_async(self.incremental_vacuum, step_pages)
+            pages_freed += step_pages_freed
+            if not step_pages_freed or not free_pages_left: break
+
+        return pages_freed
+
+    # Write-behind queue
+    def queue_write(self, sql: str, parameters: Any = ()) -> None:
+        """Adds a write to the queue and schedules a flush on the database thread. If there is no running event loop,
+        the queue is flushed immediately. If the queue is full, the flush is scheduled right away."""
+        if isinstance(parameters, dict):
+            parameters = dict(parameters)
+        else:
+            parameters = tuple(parameters)
+        with self._queue_lock:
+            self.queued_writes.append((sql, parameters))
+            queue_full = len(self.queued_writes) >= MAX_QUEUED_WRITES
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_writes()
+            return
+        if queue_full:
+            self._submit_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.write_behind_delay, self._submit_flush)
+
+    def _submit_flush(self) -> None:
+        """Schedules a flush of the write-behind queue on the database thread"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        with self._queue_lock:
+            self._pending_flushes += 1
+        self._executor.submit(self._flush_job)
+
+    def _flush_job(self) -> None:
+        try:
+            self.flush_writes()
+        finally:
+            with self._queue_lock:
+                self._pending_flushes -= 1
+
+    def flush_writes(self) -> None:
+        """Commits all queued writes in one transaction.
+        If the transaction fails, it is rolled back and the writes are executed one by one, so only the failing
+        writes are lost. Errors of these writes are logged.
+        Does nothing while a transaction is open, the writes stay queued until it ended.
+        """
+        if self.in_transaction: return
+        with self._queue_lock:
+            if not self.queued_writes: return
+            queued_writes, self.queued_writes = self.queued_writes, []
+        cur = sqlite3.Cursor(self)
+        try:
+            cur.execute('BEGIN')
+            for sql, parameters in queued_writes:
+                cur.execute(sql, parameters)
+            cur.execute('COMMIT')
+            self.flushed_transactions += 1
+            self.flushed_writes += len(queued_writes)
+            return
+        except sqlite3.Error as error:
+            if self.in_transaction: cur.execute('ROLLBACK')
+            logger.error(f'Database: Error committing {len(queued_writes)} queued writes, retrying one by one: {error}')
+        for sql, parameters in queued_writes:
+            try:
+                cur.execute(sql, parameters)
+                self.flushed_transactions += 1
+                self.flushed_writes += 1
+            except sqlite3.Error as error:
+                logger.error(f'Database: Error executing queued write.\nSQL: {sql}\nError: {error}')
+
+    def backup(self, *args, **kwargs) -> None:
+        self.flush_writes()
+        return super().backup(*args, **kwargs)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        if self.read_connection is not None:
+            self._read_executor.shutdown(wait=True)
+            self.read_connection.close()
+        self.flush_writes()
+        return super().close()
@@ -1,17 +1,33 @@
 # cooldowns.py
-"""Provides access to the table "cooldowns" in the database"""
+"""Provides access to the table "cooldowns" in the database.
+
+The whole table is kept in memory in an immutable snapshot, so reading a cooldown doesn't need a query. The snapshot
+is loaded on first use and replaced with a new one whenever a cooldown is updated.
+"""
 
 
 from dataclasses import dataclass
 from math import ceil
 import sqlite3
-from typing import Tuple
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional, Tuple
 
 from database import errors
 from resources import exceptions, settings, strings
 
 
 # Containers
+class CachedCooldown(NamedTuple):
+    """Record from table "cooldowns" in the snapshot, with the actual cooldowns already calculated"""
+    activity: str
+    base_cooldown: int
+    donor_affected: bool
+    event_reduction_mention: float
+    event_reduction_slash: float
+    actual_cooldown_mention: int
+    actual_cooldown_slash: int
+
+
 @dataclass()
 class Cooldown():
     """Object that represents record from table "cooldowns"."""
@@ -23,14 +39,14 @@ class Cooldown():
 
     def actual_cooldown_mention(self) -> int:
         """Returns the actual mention cooldown, factoring in the event_reduction"""
-        return ceil(self.base_cooldown * ((100 - self.event_reduction_mention) / 100))
+        return _calculate_actual_cooldown(self.base_cooldown, self.event_reduction_mention)
 
     def actual_cooldown_slash(self) -> int:
         """Returns the actual slash cooldown, factoring in the event_reduction"""
-        return ceil(self.base_cooldown * ((100 - self.event_reduction_slash) / 100))
+        return _calculate_actual_cooldown(self.base_cooldown, self.event_reduction_slash)
 
     async def refresh(self) -> None:
-        """Refreshes cooldown data from the database."""
+        """Refreshes cooldown data from the cooldown snapshot."""
         new_settings = await get_cooldown(self.activity)
         self.base_cooldown = new_settings.base_cooldown
         self.donor_affected = new_settings.donor_affected
@@ -38,7 +54,7 @@ class Cooldown():
         self.event_reduction_slash = new_settings.event_reduction_slash
 
     async def update(self, **kwargs) -> None:
-        """Updates the cooldown record in the database. Also calls refresh().
+        """Updates the cooldown record in the database and the cooldown snapshot. Also calls refresh().
 
         Arguments
         ---------
@@ -52,78 +68,129 @@ class Cooldown():
         await self.refresh()
 
 
+# Snapshot of the table "cooldowns" by activity. Never changed, only replaced. None until it is loaded.
+_COOLDOWNS: Optional[Mapping[str, CachedCooldown]] = None
+
+
 # Miscellaneous functions
-async def _dict_to_cooldown(record: dict) -> Cooldown:
-    """Creates a Cooldown object from a database record
+def _calculate_actual_cooldown(base_cooldown: int, event_reduction: float) -> int:
+    """Returns the cooldown in seconds after the event reduction"""
+    return ceil(base_cooldown * ((100 - event_reduction) / 100))
 
-    Arguments
-    ---------
-    record: Database record from table "cooldowns" as a dict.
+
+def _record_to_cached_cooldown(record: sqlite3.Row) -> CachedCooldown:
+    """Creates a CachedCooldown object from a database record"""
+    return CachedCooldown(
+        activity = record['activity'],
+        base_cooldown = record['cooldown'],
+        donor_affected = bool(record['donor_affected']),
+        event_reduction_mention = record['event_reduction_mention'],
+        event_reduction_slash = record['event_reduction_slash'],
+        actual_cooldown_mention = _calculate_actual_cooldown(record['cooldown'], record['event_reduction_mention']),
+        actual_cooldown_slash = _calculate_actual_cooldown(record['cooldown'], record['event_reduction_slash']),
+    )
+
+
+def _cached_cooldown_to_cooldown(cached_cooldown: CachedCooldown) -> Cooldown:
+    """Creates a Cooldown object from a snapshot record. Every call returns a new object, so changing it doesn't
+    change the snapshot."""
+    return Cooldown(
+        activity = cached_cooldown.activity,
+        base_cooldown = cached_cooldown.base_cooldown,
+        donor_affected = cached_cooldown.donor_affected,
+        event_reduction_mention = cached_cooldown.event_reduction_mention,
+        event_reduction_slash = cached_cooldown.event_reduction_slash,
+    )
+
+
+async def _load_cooldowns() -> Mapping[str, CachedCooldown]:
+    """Reads the table "cooldowns" and replaces the cooldown snapshot with a new one.
 
     Returns
     -------
-    Cooldown object.
+    The new snapshot
 
     Raises
     ------
-    LookupError if something goes wrong reading the dict. Also logs this error to the database.
+    sqlite3.Error if something happened within the database.
+    LookupError if something goes wrong reading a record.
+    Also logs all errors to the database.
     """
-    function_name = '_dict_to_cooldown'
+    global _COOLDOWNS
+    table = 'cooldowns'
+    function_name = '_load_cooldowns'
+    sql = f'SELECT * FROM {table}'
     try:
-        cooldown = Cooldown(
-            activity = record['activity'],
-            base_cooldown = record['cooldown'],
-            donor_affected = bool(record['donor_affected']),
-            event_reduction_mention = record['event_reduction_mention'],
-            event_reduction_slash = record['event_reduction_slash'],
-        )
-    except Exception as error:
+        records = await settings.NAVI_DB.fetchall_async(sql)
+    except sqlite3.Error as error:
         await errors.log_error(
-            strings.INTERNAL_ERROR_DICT_TO_OBJECT.format(function=function_name, record=record)
+            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
         )
-        raise LookupError(error)
+        raise
+    snapshot = {}
+    for record in records:
+        try:
+            cached_cooldown = _record_to_cached_cooldown(record)
+        except Exception as error:
+            await errors.log_error(
+                strings.INTERNAL_ERROR_DICT_TO_OBJECT.format(function=function_name, record=dict(record))
+            )
+            raise LookupError(error)
+        snapshot[cached_cooldown.activity] = cached_cooldown
+    _COOLDOWNS = MappingProxyType(snapshot)
+
+    return _COOLDOWNS
+
 
-    return cooldown
+async def _get_cooldowns() -> Mapping[str, CachedCooldown]:
+    """Returns the cooldown snapshot. Loads it if it isn't loaded yet."""
+    if _COOLDOWNS is None: return await _load_cooldowns()
+    return _COOLDOWNS
 
 
 # Read Data
-async def get_cooldown(activity: str) -> Cooldown:
-    """Gets the cooldown settings for an activity.
+async def get_cached_cooldown(activity: str) -> CachedCooldown:
+    """Gets the cooldown settings for an activity from the cooldown snapshot. The returned object can't be changed.
 
     Returns
     -------
-    Cooldown object
+    CachedCooldown object
 
     Raises
     ------
-    sqlite3.Error if something happened within the database.
+    sqlite3.Error if something happened within the database while loading the snapshot.
     exceptions.NoDataFoundError if no cooldown was found.
     Also logs all errors to the database.
     """
-    table = 'cooldowns'
-    function_name = 'get_cooldown'
-    sql = f'SELECT * FROM {table} WHERE activity=?'
-    try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (activity,))
-        record = cur.fetchone()
-    except sqlite3.Error as error:
-        await errors.log_error(
-            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
-        )
-        raise
-    if not record:
+    cached_cooldown = (await _get_cooldowns()).get(activity, None)
+    if cached_cooldown is None:
         await errors.log_error(
-            strings.INTERNAL_ERROR_NO_DATA_FOUND.format(table=table, function=function_name, sql=sql)
+            strings.INTERNAL_ERROR_NO_DATA_FOUND.format(table='cooldowns', function='get_cached_cooldown',
+                                                        sql=f'activity={activity}')
         )
         raise exceptions.NoDataFoundError(f'No cooldown data found in database for activity "{activity}".')
-    cooldown = await _dict_to_cooldown(dict(record))
 
-    return cooldown
+    return cached_cooldown
+
+
+async def get_cooldown(activity: str) -> Cooldown:
+    """Gets the cooldown settings for an activity from the cooldown snapshot.
+
+    Returns
+    -------
+    Cooldown object
+
+    Raises
+    ------
+    sqlite3.Error if something happened within the database while loading the snapshot.
+    exceptions.NoDataFoundError if no cooldown was found.
+    Also logs all errors to the database.
+    """
+    return _cached_cooldown_to_cooldown(await get_cached_cooldown(activity))
 
 
 async def get_all_cooldowns() -> Tuple[Cooldown]:
-    """Gets the cooldown settings for all activities.
+    """Gets the cooldown settings for all activities from the cooldown snapshot.
 
     Returns
     -------
@@ -131,40 +198,26 @@ async def get_all_cooldowns() -> Tuple[Cooldown]:
 
     Raises
     ------
-    sqlite3.Error if something happened within the database.
+    sqlite3.Error if something happened within the database while loading the snapshot.
     exceptions.NoDataFoundError if no cooldown was found.
-    LookupError if something goes wrong reading the dict.
+    LookupError if something goes wrong reading a record.
     Also logs all errors to the database.
     """
-    table = f'cooldowns'
-    function_name = 'get_all_cooldowns'
-    sql = f'SELECT * FROM {table} ORDER BY activity ASC'
-    try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql)
-        records = cur.fetchall()
-    except sqlite3.Error as error:
+    snapshot = await _get_cooldowns()
+    if not snapshot:
         await errors.log_error(
-            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
-        )
-        raise
-
-    if not records:
-        await errors.log_error(
-            strings.INTERNAL_ERROR_NO_DATA_FOUND.format(table=table, function=function_name, sql=sql)
+            strings.INTERNAL_ERROR_NO_DATA_FOUND.format(table='cooldowns', function='get_all_cooldowns',
+                                                        sql='all activities')
         )
         raise exceptions.NoDataFoundError('No cooldown data found in database.')
-    cooldowns = []
-    for record in records:
-        cooldown = await _dict_to_cooldown(dict(record))
-        cooldowns.append(cooldown)
+    cooldowns = [_cached_cooldown_to_cooldown(snapshot[activity]) for activity in sorted(snapshot)]
 
     return tuple(cooldowns)
 
 
 # Write Data
 async def _update_cooldown(activity: str, **kwargs) -> None:
-    """Updates cooldown record. Use Cooldown.update() to trigger this function.
+    """Updates cooldown record and replaces the cooldown snapshot. Use Cooldown.update() to trigger this function.
 
     Arguments
     ---------
@@ -189,16 +242,16 @@ async def _update_cooldown(activity: str, **kwargs) -> None:
         )
         raise exceptions.NoArgumentsError('You need to specify at least one keyword argument.')
     try:
-        cur = settings.NAVI_DB.cursor()
         sql = f'UPDATE {table} SET'
         for kwarg in kwargs:
             sql = f'{sql} {kwarg} = :{kwarg},'
         sql = sql.strip(",")
         kwargs['activity'] = activity
         sql = f'{sql} WHERE activity = :activity'
-        cur.execute(sql, kwargs)
+        await settings.NAVI_DB.execute_async(sql, kwargs)
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
         )
-        raise
\ No newline at end of file
+        raise
+    await _load_cooldowns()
\ No newline at end of file
@@ -1,10 +1,26 @@
-# cooldowns.py
-"""Provides access to the table "errors" in the database"""
+# errors.py
+"""Provides access to the tables "errors" and "error_summaries" in the database.
 
+Every error gets a fingerprint from its type and the code location it happened at. Repeats of the same error are
+counted in the summary of the fingerprint, which stores the count and the time the error was first and last seen.
+Only the first few errors of a fingerprint within the rate limit window are formatted in full, logged and stored in
+"errors", the others are only counted. This keeps an outage that raises the same error thousands of times from
+slowing down the bot and filling the table.
+
+Errors and summaries are collected in memory and written to the database together in one transaction a few seconds
+after the first one arrives.
+"""
+
+import asyncio
+from dataclasses import dataclass
 from datetime import datetime
+import hashlib
+import os
 import sqlite3
+import sys
+import time
 import traceback
-from typing import Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import discord
 from discord.ext import commands
@@ -12,22 +28,207 @@ from discord.ext import commands
 from resources import exceptions, logs, settings, strings
 
 
+# Containers
+@dataclass()
+class ErrorSummary():
+    """Object that represents a record from table "error_summaries"."""
+    fingerprint: str
+    error_type: str
+    location: str
+    sample: str
+    count: int
+    logged: int
+    first_seen: datetime
+    last_seen: datetime
+
+
+# Summaries of errors that are not written to the database yet, by fingerprint
+_PENDING_SUMMARIES: Dict[str, ErrorSummary] = {}
+# Error records that are not written to the database yet
+_PENDING_ERRORS: List[Tuple] = []
+# Start of the current rate limit window (time.monotonic()) and errors logged in full within it, by fingerprint
+_RATE_LIMITS: Dict[str, List[Union[float, int]]] = {}
+_FLUSH_TASK: Dict[str, Optional[asyncio.Task]] = {'task': None}
+
+
+# Miscellaneous functions
+def _get_fingerprint(error: Union[Exception, str]) -> Tuple[str, str, str]:
+    """Returns fingerprint, type and location of an error. The location of an exception is the innermost frame of
+    its traceback that is part of the bot, so errors raised inside libraries are grouped by the bot code that called
+    them. If there is no such frame, the innermost frame is used. The location of a simple string is the function
+    that logged it.
+    """
+    if isinstance(error, str):
+        error_type = 'str'
+    else:
+        error_type = f'{error.__class__.__module__}.{error.__class__.__name__}'
+    error_traceback = getattr(error, '__traceback__', None)
+    if error_traceback is not None:
+        bot_traceback = None
+        while True:
+            file_name = os.path.abspath(error_traceback.tb_frame.f_code.co_filename)
+            if file_name.startswith(settings.BOT_DIR + os.sep) and 'site-packages' not in file_name:
+                bot_traceback = error_traceback
+            if error_traceback.tb_next is None: break
+            error_traceback = error_traceback.tb_next
+        if bot_traceback is not None: error_traceback = bot_traceback
+        frame = error_traceback.tb_frame
+        line_number = error_traceback.tb_lineno
+    else:
+        frame = sys._getframe(2)
+        line_number = frame.f_lineno
+    location = f'{os.path.basename(frame.f_code.co_filename)}:{line_number} in {frame.f_code.co_name}'
+    fingerprint = hashlib.sha1(f'{error_type}|{location}'.encode('utf-8')).hexdigest()[:16]
+    return (fingerprint, error_type, location)
+
+
+def _is_rate_limited(fingerprint: str) -> bool:
+    """Counts an error against the rate limit of its fingerprint. Returns True if the limit was already reached in the
+    current window."""
+    current_time = time.monotonic()
+    rate_limit = _RATE_LIMITS.get(fingerprint, None)
+    if rate_limit is None or current_time - rate_limit[0] >= settings.ERROR_RATE_WINDOW:
+        _RATE_LIMITS[fingerprint] = [current_time, 1]
+        return False
+    if rate_limit[1] >= settings.ERROR_RATE_LIMIT: return True
+    rate_limit[1] += 1
+    return False
+
+
+def _schedule_flush() -> None:
+    """Starts the task that writes pending errors if it isn't running yet"""
+    if _FLUSH_TASK['task'] is None:
+        _FLUSH_TASK['task'] = asyncio.ensure_future(_flush_after_delay())
+
+
+async def _flush_after_delay() -> None:
+    """Waits for more errors and writes all pending errors afterwards"""
+    try:
+        await asyncio.sleep(settings.ERROR_FLUSH_DELAY)
+    finally:
+        _FLUSH_TASK['task'] = None
+    await flush_errors()
+
+
+# Read data
+async def get_error_summaries(amount: int) -> Tuple[ErrorSummary]:
+    """Gets the error summaries that were seen last. Writes pending errors first.
+
+    Returns
+    -------
+    Tuple with ErrorSummary objects, newest first.
+
+    Raises
+    ------
+    sqlite3.Error if something happened within the database. Also logs this error to the log file.
+    """
+    table = 'error_summaries'
+    function_name = 'get_error_summaries'
+    sql = f'SELECT * FROM {table} ORDER BY last_seen DESC LIMIT ?'
+    await flush_errors()
+    try:
+        records = await settings.NAVI_DB.fetchall_async(sql, (amount,))
+    except sqlite3.Error as error:
+        logs.logger.error(
+            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
+        )
+        raise
+    error_summaries = []
+    for record in records:
+        error_summaries.append(
+            ErrorSummary(
+                fingerprint = record['fingerprint'],
+                error_type = record['error_type'],
+                location = record['location'],
+                sample = record['sample'],
+                count = record['count'],
+                logged = record['logged'],
+                first_seen = datetime.fromisoformat(str(record['first_seen'])),
+                last_seen = datetime.fromisoformat(str(record['last_seen'])),
+            )
+        )
+
+    return tuple(error_summaries)
+
+
+# Write data
+async def flush_errors() -> None:
+    """Writes all pending errors and summaries to the database in one transaction.
+    Errors while writing are only logged to the log file, the pending errors are dropped.
+    """
+    table = 'errors'
+    function_name = 'flush_errors'
+    sql_error = (
+        f'INSERT INTO {table} (date_time, message_content, error, user_settings, jump_url) VALUES (?, ?, ?, ?, ?)'
+    )
+    sql_summary = (
+        'INSERT INTO error_summaries (fingerprint, error_type, location, sample, count, logged, first_seen, '
+        'last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(fingerprint) DO UPDATE SET '
+        'count=count+excluded.count, logged=logged+excluded.logged, last_seen=excluded.last_seen'
+    )
+    if not _PENDING_SUMMARIES and not _PENDING_ERRORS: return
+    error_records = _PENDING_ERRORS.copy()
+    error_summaries = tuple(_PENDING_SUMMARIES.values())
+    _PENDING_ERRORS.clear()
+    _PENDING_SUMMARIES.clear()
+    summary_records = [
+        (error_summary.fingerprint, error_summary.error_type, error_summary.location, error_summary.sample,
+         error_summary.count, error_summary.logged, error_summary.first_seen, error_summary.last_seen)
+        for error_summary in error_summaries
+    ]
+
+    def write_errors() -> None:
+        """Runs on the database thread"""
+        cur = settings.NAVI_DB.cursor()
+        cur.execute('BEGIN')
+        try:
+            if error_records: cur.executemany(sql_error, error_records)
+            cur.executemany(sql_summary, summary_records)
+            cur.execute('COMMIT')
+        except sqlite3.Error:
+            cur.execute('ROLLBACK')
+            raise
+
+    try:
+        await settings.NAVI_DB.run_async(write_errors)
+    except sqlite3.Error as error:
+        logs.logger.error(
+            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name,
+                                                  sql=f'{sql_error}; {sql_summary}')
+        )
+    for error_summary in error_summaries:
+        suppressed_count = error_summary.count - error_summary.logged
+        if suppressed_count > 0:
+            logs.logger.error(
+                f'Suppressed {suppressed_count:,} more errors of type {error_summary.error_type} at '
+                f'{error_summary.location}: {error_summary.sample}'
+            )
+
+
 async def log_error(error: Union[Exception, str], ctx: Optional[Union[commands.Context, discord.Message]] = None) -> None:
-    """Logs an error to the database and the logfile
+    """Logs an error to the database and the logfile. Repeats are counted in the error summary and only logged in full
+    until the rate limit of the error is reached. The error is written to the database in the background.
 
     Arguments
     ---------
     error: Exception or a simple string.
     ctx: If context or message is available, the function will log the user input, the message timestamp,
     the message jump_url and the user settings. If not, current time is used, settings and input are logged as "N/A".
-
-    Raises
-    ------
-    sqlite3.Error when something goes wrong in the database. Also logs this error to the log file.
     """
-    table = 'errors'
-    function_name = 'log_error'
-    sql = f'INSERT INTO {table} (date_time, message_content, error, user_settings, jump_url) VALUES (?, ?, ?, ?, ?)'
+    fingerprint, error_type, location = _get_fingerprint(error)
+    current_time = datetime.utcnow()
+    error_summary = _PENDING_SUMMARIES.get(fingerprint, None)
+    if error_summary is None:
+        sample = error.message if hasattr(error, 'message') else str(error)
+        sample = sample.strip().split('\n')[0][:200]
+        error_summary = _PENDING_SUMMARIES[fingerprint] = ErrorSummary(
+            fingerprint, error_type, location, sample, 0, 0, current_time, current_time
+        )
+    error_summary.count += 1
+    error_summary.last_seen = current_time
+    _schedule_flush()
+    if _is_rate_limited(fingerprint): return
+    error_summary.logged += 1
     if hasattr(error, 'message'):
         error_message = f'Error: {error.message}'
     else:
@@ -80,25 +281,13 @@ async def log_error(error: Union[Exception, str], ctx: Optional[Union[commands.C
                 from database import users
                 user: users.User = await users.get_user(message.author.id)
                 user_settings = str(user)
-            except exceptions.FirstTimeUserError:
+            except (exceptions.FirstTimeUserError, sqlite3.Error):
                 pass
     else:
-        date_time = datetime.utcnow()
+        date_time = current_time
         message_content = 'N/A'
         jump_url = 'N/A'
         user_settings = 'N/A'
-    try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (date_time, message_content, error_message, user_settings, jump_url))
-        logs.logger.error(f'\n{error_message}\n>> Jump URL: {jump_url}')
-    except sqlite3.Error as error:
-        if ctx is not None:
-            logs.logger.error(
-                strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql),
-                ctx
-            )
-        else:
-            logs.logger.error(
-                strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
-            )
-        raise
\ No newline at end of file
+    error_message = f'{error_message}\n- Fingerprint: {fingerprint}'
+    _PENDING_ERRORS.append((date_time, message_content, error_message, user_settings, jump_url))
+    logs.logger.error(f'\n{error_message}\n>> Jump URL: {jump_url}')
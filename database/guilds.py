@@ -3,9 +3,8 @@
 
 
 from dataclasses import dataclass
-import itertools
 import sqlite3
-from typing import List, Tuple, Union
+from typing import Dict, List, Union
 
 import discord
 from discord.ext import commands
@@ -14,6 +13,10 @@ from database import errors
 from resources import exceptions, settings, strings
 
 
+# Prefix of every guild that used a command since the bot started. Updated by _update_guild.
+_PREFIX_CACHE: Dict[int, str] = {}
+
+
 # Containers
 @dataclass()
 class Guild():
@@ -107,7 +110,7 @@ class Guild():
         self.auto_flex_xmas_void_enabled = new_settings.auto_flex_xmas_void_enabled
 
     async def update(self, **kwargs) -> None:
-        """Updates the guild record in the database. Also calls refresh().
+        """Updates the guild record in the database and applies the changes to this object.
 
         Arguments
         ---------
@@ -155,7 +158,8 @@ class Guild():
             prefix: str
         """
         await _update_guild(self.guild_id, **kwargs)
-        await self.refresh()
+        for column, value in kwargs.items():
+            setattr(self, column, value)
 
 
 # Miscellaneous functions
@@ -229,80 +233,64 @@ async def _dict_to_guild(record: dict) -> Guild:
     return guild
 
 
-async def _get_mixed_case_prefixes(prefix: str) -> List[str]:
-    """Turns a string into a list of all mixed case variations of said string
+# Read data
+async def _get_guild_prefix(guild_id: int, insert_if_missing: bool) -> str:
+    """Returns the prefix of a guild from the prefix cache or the database. If the guild has no record, the default
+    prefix is returned. If insert_if_missing is True, a record with the default prefix is created as well.
 
-    Returns
-    -------
-    All mixed case variations: List[str]
+    Raises
+    ------
+    sqlite3.Error if something happened within the database.  Also logs this error to the database.
     """
-    mixed_prefixes = []
-    all_prefixes = map(''.join, itertools.product(*((char.upper(), char.lower()) for char in prefix)))
-    for prefix in list(all_prefixes):
-        mixed_prefixes.append(prefix)
-    return mixed_prefixes
-
-
-# Read data
-async def get_prefix(ctx_or_message: Union[commands.Context, discord.Message]) -> str:
-    """Check database for stored prefix. If no prefix is found, the default prefix is used"""
+    prefix = _PREFIX_CACHE.get(guild_id, None)
+    if prefix is not None: return prefix
     table = 'guilds'
-    function_name = 'get_prefix'
+    function_name = '_get_guild_prefix'
     sql = f'SELECT prefix FROM {table} WHERE guild_id=?'
-    guild_id = ctx_or_message.guild.id
     try:
-        cur=settings.NAVI_DB.cursor()
-        cur.execute(sql, (guild_id,))
-        record = cur.fetchone()
-        prefix = record['prefix'].replace('"','') if record else settings.DEFAULT_PREFIX
+        record = await settings.NAVI_DB.fetchone_async(sql, (guild_id,))
+        if record:
+            prefix = record['prefix'].replace('"','')
+        elif insert_if_missing:
+            sql = f'INSERT INTO {table} (guild_id, prefix) VALUES (?, ?)'
+            await settings.NAVI_DB.execute_async(sql, (guild_id, settings.DEFAULT_PREFIX))
+            prefix = settings.DEFAULT_PREFIX
+        else:
+            return settings.DEFAULT_PREFIX
     except sqlite3.Error as error:
         await errors.log_error(
-            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql),
-            ctx_or_message
+            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
         )
+        raise
+    _PREFIX_CACHE[guild_id] = prefix
 
     return prefix
 
-async def get_all_prefixes(bot: commands.Bot, ctx: commands.Context) -> Tuple:
+
+async def get_prefix(ctx_or_message: Union[commands.Context, discord.Message]) -> str:
+    """Check database for stored prefix. If no prefix is found, the default prefix is used"""
+    return await _get_guild_prefix(ctx_or_message.guild.id, insert_if_missing=False)
+
+
+async def get_all_prefixes(bot: commands.Bot, message: discord.Message) -> List[str]:
     """Gets all prefixes. If no prefix is found, a record for the guild is created with the
     default prefix.
+    The prefix is matched case-insensitively. If the message starts with the prefix in any case, the prefix is
+    returned exactly as it was written in the message.
 
     Returns
     -------
-    A tuple with the current server prefix, all "rpg" prefixes and the pingable bot
+    A list with the pingable bot and the current server prefix
 
     Raises
     ------
     sqlite3.Error if something happened within the database.  Also logs this error to the database.
     """
-    table = 'guilds'
-    function_name = 'get_all_prefixes'
-    sql = f'SELECT prefix FROM {table} WHERE guild_id=?'
-    guild_id = ctx.guild.id
-    try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (guild_id,))
-        record = cur.fetchone()
-        prefixes = []
-        if record:
-            prefix_db = record['prefix'].replace('"','')
-            prefix_db_mixed_case = await _get_mixed_case_prefixes(prefix_db)
-            for prefix in prefix_db_mixed_case:
-                prefixes.append(prefix)
-        else:
-            sql = f'INSERT INTO {table} (guild_id, prefix) VALUES (?, ?)'
-            cur.execute(sql, (guild_id, settings.DEFAULT_PREFIX))
-            prefix_default_mixed_case = await _get_mixed_case_prefixes(settings.DEFAULT_PREFIX)
-            for prefix in prefix_default_mixed_case:
-                prefixes.append(prefix)
-    except sqlite3.Error as error:
-        await errors.log_error(
-            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql),
-            ctx
-        )
-        raise
+    prefix = await _get_guild_prefix(message.guild.id, insert_if_missing=True)
+    message_prefix = message.content[:len(prefix)]
+    if message_prefix.lower() == prefix.lower(): prefix = message_prefix
 
-    return commands.when_mentioned_or(*prefixes)(bot, ctx)
+    return commands.when_mentioned_or(prefix)(bot, message)
 
 
 async def get_guild(guild_id: int) -> Guild:
@@ -323,21 +311,16 @@ async def get_guild(guild_id: int) -> Guild:
     function_name = 'get_guild'
     sql_select = f'SELECT * FROM {table} WHERE guild_id=?'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql_select, (guild_id,))
-        record = cur.fetchone()
+        record = await settings.NAVI_DB.fetchone_async(sql_select, (guild_id,))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql_select)
         )
         raise
     if not record:
-        sql = f'INSERT INTO {table} (guild_id, prefix) VALUES (?, ?)'
+        sql = f'INSERT INTO {table} (guild_id, prefix) VALUES (?, ?) RETURNING *'
         try:
-            cur.execute(sql, (guild_id, settings.DEFAULT_PREFIX))
-            sql = sql_select
-            cur.execute(sql, (guild_id,))
-            record = cur.fetchone()
+            record = await settings.NAVI_DB.fetchone_async(sql, (guild_id, settings.DEFAULT_PREFIX))
         except sqlite3.Error as error:
             await errors.log_error(
                 strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -411,14 +394,14 @@ async def _update_guild(guild_id: int, **kwargs) -> None:
         )
         raise exceptions.NoArgumentsError('You need to specify at least one keyword argument.')
     try:
-        cur = settings.NAVI_DB.cursor()
         sql = f'UPDATE {table} SET'
         for kwarg in kwargs:
             sql = f'{sql} {kwarg} = :{kwarg},'
         sql = sql.strip(",")
         kwargs['guild_id'] = guild_id
         sql = f'{sql} WHERE guild_id = :guild_id'
-        cur.execute(sql, kwargs)
+        await settings.NAVI_DB.execute_async(sql, kwargs)
+        if 'prefix' in kwargs: _PREFIX_CACHE[guild_id] = kwargs['prefix'].replace('"','')
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -37,7 +37,7 @@ class Portal():
         self.channel_id = new_portal.channel_id
 
     async def update(self, **kwargs) -> None:
-        """Updates the portal in the database. Also calls refresh().
+        """Updates the portal in the database and applies the changes to this object.
 
         Arguments
         ---------
@@ -46,7 +46,8 @@ class Portal():
             user_id: int
         """
         await _update_portal(self, **kwargs)
-        await self.refresh()
+        for column, value in kwargs.items():
+            setattr(self, column, value)
 
 
 # Miscellaneous functions
@@ -105,9 +106,7 @@ async def get_portal(user_id: int, channel_id: int) -> Portal:
     function_name = 'get_portal'
     sql = f'SELECT * FROM {table} WHERE user_id=? AND channel_id=?'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (user_id, channel_id))
-        record = cur.fetchone()
+        record = await settings.NAVI_DB.fetchone_async(sql, (user_id, channel_id))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -144,9 +143,7 @@ async def get_portals(user_id: int) -> Tuple[Portal]:
     function_name = 'get_portals'
     sql = f'SELECT * FROM {table} WHERE user_id=? ORDER BY sort_index ASC'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (user_id,))
-        records = cur.fetchall()
+        records = await settings.NAVI_DB.fetchall_async(sql, (user_id,))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -177,8 +174,7 @@ async def _delete_portal(portal: Portal) -> None:
     table = 'users_portals'
     sql = f'DELETE FROM {table} WHERE user_id=? AND channel_id=?'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (portal.user_id, portal.channel_id))
+        await settings.NAVI_DB.execute_async(sql, (portal.user_id, portal.channel_id))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -212,12 +208,11 @@ async def _update_portal(portal: Portal, **kwargs) -> None:
     kwargs['user_id_old'] = portal.user_id
     kwargs['channel_id_old'] = portal.channel_id
     try:
-        cur = settings.NAVI_DB.cursor()
         sql = f'UPDATE {table} SET'
         for kwarg in kwargs:
             sql = f'{sql} {kwarg} = :{kwarg},'
         sql = f'{sql} WHERE user_id = :user_id_old AND channel_id = :channel_id_old'
-        cur.execute(sql, kwargs)
+        await settings.NAVI_DB.execute_async(sql, kwargs)
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -245,15 +240,14 @@ async def insert_portal(user_id: int, channel_id: int) -> Portal:
     """
     function_name = 'insert_portal'
     table = 'users_portals'
-    cur = settings.NAVI_DB.cursor()
     sql = f'INSERT INTO {table} (user_id, channel_id) VALUES (?, ?)'
     try:
-        cur.execute(sql, (user_id, channel_id))
+        await settings.NAVI_DB.execute_async(sql, (user_id, channel_id))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
         )
         raise
-    portal = await get_portal(user_id, channel_id)
+    portal = Portal(user_id=user_id, channel_id=channel_id)
 
     return portal
\ No newline at end of file
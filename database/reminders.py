@@ -1,21 +1,33 @@
 # reminders.py
-"""Provides access to the tables "reminders_users" and "reminders_clans" in the database"""
+"""Provides access to the tables "reminders_users" and "reminders_clans" in the database.
 
+All reminders of the most recently used users and the reminders of the most recently used clans are cached. All
+functions in this module that write reminders keep the cache up to date, so reading the reminders of a cached user or
+clan doesn't need a query. Reminders are handed out as copies, so changing them doesn't change the cache.
+"""
+
+from collections import OrderedDict
+import copy
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 import sqlite3
-from typing import List, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import discord
 from discord.ext import tasks
 
 from database import cooldowns, errors
-from resources import exceptions, settings, strings
+from resources import exceptions, scheduler, settings, strings
 
 
-# Reminders scheduled for task creation / deletion
-scheduled_for_tasks = {}
-scheduled_for_deletion = {}
+# Reminders that are due soon. Fired by cogs.tasks.
+reminder_scheduler = scheduler.ReminderScheduler()
+# All reminders of the most recently used users, by user id. Contains a dict with the reminders by task name.
+_USER_REMINDERS: OrderedDict = OrderedDict()
+# Reminders of the most recently used clans, by clan name. None if a clan has no reminder.
+_CLAN_REMINDERS: OrderedDict = OrderedDict()
+# Counts reminder writes. Reminders read during a write are not cached.
+_REMINDER_WRITES = {'count': 0}
 
 
 # Containers
@@ -45,6 +57,7 @@ class Reminder():
         Also logs all errors to the database.
         """
         await _delete_reminder(self)
+        reminder_scheduler.cancel(self.task_name)
         await self.refresh()
         if self.record_exists:
             error_message = f'Reminder got deleted but record still exists.\n{self}'
@@ -76,7 +89,8 @@ class Reminder():
         self.user_id = new_settings.user_id
 
     async def update(self, **kwargs) -> None:
-        """Updates the clan record in the database. Also calls refresh().
+        """Updates the clan record in the database and applies the changes to this object.
+        If the reminder is triggered after the update, it is (re)scheduled, otherwise it is unscheduled.
 
         Arguments
         ---------
@@ -91,34 +105,48 @@ class Reminder():
             triggered: bool
             user_id: int
         """
-        await _update_reminder(self, **kwargs)
-        await self.refresh()
+        columns = await _update_reminder(self, **kwargs)
+        for column, value in columns.items():
+            setattr(self, column, value)
+        task_name = _get_task_name(self.user_id, self.clan_name, self.activity, self.custom_id)
+        if task_name != self.task_name:
+            reminder_scheduler.cancel(self.task_name)
+            self.task_name = task_name
+        if self.triggered:
+            reminder_scheduler.schedule(self)
+        else:
+            reminder_scheduler.cancel(self.task_name)
 
 
 # Tasks
-@tasks.loop(seconds=10.0)
+@tasks.loop(seconds=60.0)
 async def schedule_reminders():
-    """Task that reads all due reminders from the database and schedules them for task creation"""
-    try:
-        due_user_reminders = await get_due_user_reminders()
-    except exceptions.NoDataFoundError:
-        due_user_reminders = ()
-    try:
-        due_clan_reminders = await get_due_clan_reminders()
-    except exceptions.NoDataFoundError:
-        due_clan_reminders = ()
-    due_reminders = list(due_user_reminders) + list(due_clan_reminders)
-    for reminder in due_reminders:
+    """Task that schedules all due reminders that are not scheduled yet.
+    Reminders are scheduled when they are inserted or updated, so this is only a recovery sweep for reminders that
+    were inserted with a longer time left. The first run after startup also schedules reminders that were already
+    triggered, as the scheduler is empty at that point.
+    """
+    include_triggered = schedule_reminders.current_loop == 0
+    for table in ('reminders_users', 'reminders_clans'):
         try:
-            scheduled_for_tasks[reminder.task_name] = reminder
-            await reminder.update(triggered=True)
+            due_reminders = await _trigger_due_reminders(table, include_triggered)
         except Exception as error:
             await errors.log_error(
-                f'Error scheduling a reminder.\nFunction: schedule_reminders\nReminder: {reminder}\nError: {error}'
-        )
+                f'Error scheduling reminders.\nFunction: schedule_reminders\nTable: {table}\nError: {error}'
+            )
+            continue
+        for reminder in due_reminders:
+            reminder_scheduler.schedule(reminder)
 
 
 # Miscellaneous functions
+def _get_task_name(user_id: Optional[int], clan_name: Optional[str], activity: str, custom_id: Optional[int]) -> str:
+    """Returns the unique task name of a reminder"""
+    if user_id is None: return f'{clan_name}-{activity}'
+    if custom_id is not None: return f'{user_id}-{activity}-{custom_id}'
+    return f'{user_id}-{activity}'
+
+
 async def _dict_to_reminder(record: dict) -> Reminder:
     """Creates a Reminder object from a database record
 
@@ -138,15 +166,8 @@ async def _dict_to_reminder(record: dict) -> Reminder:
     try:
         user_id = record.get('user_id', None)
         custom_id = record.get('custom_id', None)
-        if user_id is None:
-            reminder_type = 'clan'
-            task_name = f"{record['clan_name']}-{record['activity']}"
-        else:
-            reminder_type = 'user'
-            if custom_id is not None:
-                task_name = f"{user_id}-{record['activity']}-{custom_id}"
-            else:
-                task_name = f"{user_id}-{record['activity']}"
+        reminder_type = 'clan' if user_id is None else 'user'
+        task_name = _get_task_name(user_id, record.get('clan_name', None), record['activity'], custom_id)
         reminder = Reminder(
             activity = record['activity'],
             channel_id = record['channel_id'],
@@ -169,6 +190,112 @@ async def _dict_to_reminder(record: dict) -> Reminder:
     return reminder
 
 
+def _store_cached_reminder(reminder: Reminder) -> None:
+    """Stores a copy of a written reminder in the cache if its user or clan is cached"""
+    if reminder.reminder_type == 'user':
+        user_reminders = _USER_REMINDERS.get(reminder.user_id, None)
+        if user_reminders is not None: user_reminders[reminder.task_name] = copy.copy(reminder)
+    elif reminder.clan_name in _CLAN_REMINDERS:
+        _CLAN_REMINDERS[reminder.clan_name] = copy.copy(reminder)
+
+
+def _remove_cached_reminder(reminder_type: str, user_id: Optional[int], clan_name: Optional[str],
+                            task_name: str) -> Optional[Reminder]:
+    """Removes a reminder from the cache.
+
+    Returns
+    -------
+    The removed reminder or None if the reminder or its user or clan is not cached
+    """
+    if reminder_type == 'user':
+        user_reminders = _USER_REMINDERS.get(user_id, None)
+        return user_reminders.pop(task_name, None) if user_reminders is not None else None
+    cached_reminder = _CLAN_REMINDERS.get(clan_name, None)
+    if cached_reminder is not None: _CLAN_REMINDERS[clan_name] = None
+    return cached_reminder
+
+
+def _is_cached(reminder_type: str, user_id: Optional[int], clan_name: Optional[str]) -> bool:
+    """Checks if the reminders of a user or clan are cached"""
+    return user_id in _USER_REMINDERS if reminder_type == 'user' else clan_name in _CLAN_REMINDERS
+
+
+def remove_user_reminders_from_cache(user_id: int) -> None:
+    """Removes the reminders of a user from the cache. Use this if user reminders are changed without using this
+    module."""
+    _USER_REMINDERS.pop(user_id, None)
+
+
+async def _get_cached_user_reminders(user_id: int) -> Dict[str, Reminder]:
+    """Returns all reminders of a user by task name. Loads them if the user isn't cached yet.
+    If the cache is full, the least recently used users are removed.
+
+    Raises
+    ------
+    sqlite3.Error if something happened within the database.
+    LookupError if something goes wrong reading the dict.
+    Also logs all errors to the database.
+    """
+    user_reminders = _USER_REMINDERS.get(user_id, None)
+    if user_reminders is not None:
+        _USER_REMINDERS.move_to_end(user_id)
+        return user_reminders
+    reminder_writes = _REMINDER_WRITES['count']
+    table = 'reminders_users'
+    function_name = '_get_cached_user_reminders'
+    sql = f'SELECT * FROM {table} WHERE user_id=?'
+    try:
+        records = await settings.NAVI_DB.fetchall_async(sql, (user_id,))
+    except sqlite3.Error as error:
+        await errors.log_error(
+            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
+        )
+        raise
+    user_reminders = {}
+    for record in records:
+        reminder = await _dict_to_reminder(dict(record))
+        user_reminders[reminder.task_name] = reminder
+    if reminder_writes != _REMINDER_WRITES['count']: return user_reminders
+    _USER_REMINDERS[user_id] = user_reminders
+    while len(_USER_REMINDERS) > settings.USER_CACHE_SIZE:
+        _USER_REMINDERS.popitem(last=False)
+
+    return user_reminders
+
+
+async def _get_cached_clan_reminder(clan_name: str) -> Optional[Reminder]:
+    """Returns the reminder of a clan or None if the clan has no reminder. Loads it if the clan isn't cached yet.
+    If the cache is full, the least recently used clans are removed.
+
+    Raises
+    ------
+    sqlite3.Error if something happened within the database.
+    LookupError if something goes wrong reading the dict.
+    Also logs all errors to the database.
+    """
+    if clan_name in _CLAN_REMINDERS:
+        _CLAN_REMINDERS.move_to_end(clan_name)
+        return _CLAN_REMINDERS[clan_name]
+    reminder_writes = _REMINDER_WRITES['count']
+    table = 'reminders_clans'
+    function_name = '_get_cached_clan_reminder'
+    sql = f'SELECT * FROM {table} WHERE clan_name=?'
+    try:
+        record = await settings.NAVI_DB.fetchone_async(sql, (clan_name,))
+    except sqlite3.Error as error:
+        await errors.log_error(
+            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
+        )
+        raise
+    reminder = await _dict_to_reminder(dict(record)) if record else None
+    if reminder_writes != _REMINDER_WRITES['count']: return reminder
+    _CLAN_REMINDERS[clan_name] = reminder
+    while len(_CLAN_REMINDERS) > settings.USER_CACHE_SIZE:
+        _CLAN_REMINDERS.popitem(last=False)
+
+    return reminder
+
+
 # Read Data
 async def get_user_reminder(user_id: int, activity: str, custom_id: Optional[int] = None) -> Reminder:
     """Gets all settings for a user reminder from a user id and an activity.
@@ -191,28 +318,16 @@ async def get_user_reminder(user_id: int, activity: str, custom_id: Optional[int
     ValueError if activity is "custom" and custom_id is None.
     Also logs all errors to the database.
     """
-    table = 'reminders_users'
-    function_name = 'get_user_reminder'
     if activity == 'custom' and custom_id is None:
         raise ValueError('Activity "custom" given but custom_id is None.')
-    sql = f'SELECT * FROM {table} WHERE user_id=? AND activity=?'
-    if custom_id is not None: sql = f'{sql} AND custom_id=?'
-    try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (user_id, activity)) if custom_id is None else cur.execute(sql, (user_id, activity, custom_id))
-        record = cur.fetchone()
-    except sqlite3.Error as error:
-        await errors.log_error(
-            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
-        )
-        raise
-    if not record:
+    user_reminders = await _get_cached_user_reminders(user_id)
+    reminder = user_reminders.get(_get_task_name(user_id, None, activity, custom_id), None)
+    if reminder is None:
         raise exceptions.NoDataFoundError(
             f'No reminder data found in database for user "{user_id}" and activity "{activity}".'
         )
-    reminder = await _dict_to_reminder(dict(record))
 
-    return reminder
+    return copy.copy(reminder)
 
 
 async def get_clan_reminder(clan_name: str) -> Reminder:
@@ -229,23 +344,12 @@ async def get_clan_reminder(clan_name: str) -> Reminder:
     LookupError if something goes wrong reading the dict.
     Also logs all errors to the database.
     """
-    table = 'reminders_clans'
-    function_name = 'get_clan_reminder'
-    sql = f'SELECT * FROM {table} WHERE clan_name=?'
-    try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (clan_name,))
-        record = cur.fetchone()
-    except sqlite3.Error as error:
-        await errors.log_error(
-            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
-        )
-        raise
-    if not record:
+    reminder = await _get_cached_clan_reminder(clan_name)
+    if reminder is None:
         raise exceptions.NoDataFoundError(
             f'No reminder data found in database for clan "{clan_name}".'
         )
-    reminder = await _dict_to_reminder(dict(record))
+    reminder = copy.copy(reminder)
 
     return reminder
 
@@ -271,26 +375,28 @@ async def get_active_user_reminders(user_id: Optional[int] = None, activity: Opt
     LookupError if something goes wrong reading the dict.
     Also logs all errors to the database.
     """
+    if end_time is None: end_time = datetime.utcnow().replace(microsecond=0)
+    if user_id is not None:
+        user_reminders = await _get_cached_user_reminders(user_id)
+        reminders = sorted(
+            (reminder for reminder in user_reminders.values()
+             if reminder.end_time > end_time and (activity is None or reminder.activity.startswith(activity))),
+            key=lambda reminder: reminder.end_time
+        )
+        if not reminders:
+            raise exceptions.NoDataFoundError(f'No active user reminders found in database. User: {user_id}')
+        return tuple(copy.copy(reminder) for reminder in reminders)
     table = 'reminders_users'
     function_name = 'get_active_user_reminders'
     sql = f'SELECT * FROM {table} WHERE end_time>?'
-    if end_time is None:
-        current_time = datetime.utcnow().replace(microsecond=0)
-        end_time_str = current_time.isoformat(sep=' ')
-    else:
-        end_time_str = end_time.isoformat(sep=' ')
+    end_time_str = end_time.isoformat(sep=' ')
     queries = [end_time_str,]
-    if user_id is not None:
-        sql = f'{sql} AND user_id=?'
-        queries.append(user_id)
     if activity is not None:
         sql = f"{sql} AND activity LIKE ?"
         queries.append(f'{activity}%')
     sql = f'{sql} ORDER BY end_time'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, queries)
-        records = cur.fetchall()
+        records = await settings.NAVI_DB.fetchall_async(sql, queries)
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -298,9 +404,7 @@ async def get_active_user_reminders(user_id: Optional[int] = None, activity: Opt
         raise
 
     if not records:
-        error_message = 'No active user reminders found in database.'
-        if user_id is not None: error_message = f'{error_message} User: {user_id}'
-        raise exceptions.NoDataFoundError(error_message)
+        raise exceptions.NoDataFoundError('No active user reminders found in database.')
     reminders = []
     for record in records:
         reminder = await _dict_to_reminder(dict(record))
@@ -323,18 +427,17 @@ async def get_active_clan_reminders(clan_name: Optional[str] = None) -> Tuple[Re
     LookupError if something goes wrong reading the dict.
     Also logs all errors to the database.
     """
+    current_time = datetime.utcnow().replace(microsecond=0)
+    if clan_name is not None:
+        reminder = await _get_cached_clan_reminder(clan_name)
+        if reminder is None or reminder.end_time <= current_time:
+            raise exceptions.NoDataFoundError(f'No active clan reminders found in database. Clan: {clan_name}')
+        return (copy.copy(reminder),)
     table = 'reminders_clans'
     function_name = 'get_active_clan_reminders'
-    if clan_name is None:
-        sql = f'SELECT * FROM {table} WHERE end_time>? ORDER BY end_time'
-    else:
-        sql = f'SELECT * FROM {table} WHERE clan_name=? AND end_time>? ORDER BY end_time'
+    sql = f'SELECT * FROM {table} WHERE end_time>? ORDER BY end_time'
     try:
-        cur = settings.NAVI_DB.cursor()
-        current_time = datetime.utcnow().replace(microsecond=0)
-        current_time_str = current_time.isoformat(sep=' ')
-        cur.execute(sql, (current_time_str,)) if clan_name is None else cur.execute(sql, (clan_name, current_time_str))
-        records = cur.fetchall()
+        records = await settings.NAVI_DB.fetchall_async(sql, (current_time.isoformat(sep=' '),))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -342,9 +445,7 @@ async def get_active_clan_reminders(clan_name: Optional[str] = None) -> Tuple[Re
         raise
 
     if not records:
-        error_message = 'No active clan reminders found in database.'
-        if clan_name is not None: error_message = f'{error_message} Clan: {clan_name}'
-        raise exceptions.NoDataFoundError(error_message)
+        raise exceptions.NoDataFoundError('No active clan reminders found in database.')
     reminders = []
     for record in records:
         reminder = await _dict_to_reminder(dict(record))
@@ -355,7 +456,7 @@ async def get_active_clan_reminders(clan_name: Optional[str] = None) -> Tuple[Re
 
 async def get_due_user_reminders(user_id: Optional[int] = None) -> Tuple[Reminder]:
     """Gets all reminders for all users or - if the argument user_id is set - for one user that are due within
-    the next 15 seconds.
+    the schedule horizon.
 
     Returns
     -------
@@ -375,17 +476,15 @@ async def get_due_user_reminders(user_id: Optional[int] = None) -> Tuple[Reminde
     else:
         sql = f'SELECT * FROM {table} WHERE user_id=? AND triggered=? AND end_time BETWEEN ? AND ?'
     try:
-        cur = settings.NAVI_DB.cursor()
         current_time = datetime.utcnow().replace(microsecond=0)
-        end_time = current_time + timedelta(seconds=15)
+        end_time = current_time + timedelta(seconds=settings.REMINDER_SCHEDULE_HORIZON)
         current_time_str = current_time.isoformat(sep=' ')
         end_time_str = end_time.isoformat(sep=' ')
         triggered = False
         if user_id is None:
-            cur.execute(sql, (triggered, current_time_str, end_time_str))
+            records = await settings.NAVI_DB.fetchall_async(sql, (triggered, current_time_str, end_time_str))
         else:
-            cur.execute(sql, (user_id, triggered, current_time_str, end_time_str))
-        records = cur.fetchall()
+            records = await settings.NAVI_DB.fetchall_async(sql, (user_id, triggered, current_time_str, end_time_str))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -406,7 +505,7 @@ async def get_due_user_reminders(user_id: Optional[int] = None) -> Tuple[Reminde
 
 async def get_due_clan_reminders(clan_name: Optional[str] = None) -> Tuple[Reminder]:
     """Gets all reminders for all clans or - if the argument clan_name is set - for one clan that are due within
-    the next 15 seconds.
+    the schedule horizon.
 
     Returns
     -------
@@ -426,17 +525,15 @@ async def get_due_clan_reminders(clan_name: Optional[str] = None) -> Tuple[Remin
     else:
         sql = f'SELECT * FROM {table} WHERE clan_name=? AND triggered=? AND end_time BETWEEN ? AND ?'
     try:
-        cur = settings.NAVI_DB.cursor()
         current_time = datetime.utcnow().replace(microsecond=0)
-        end_time  = current_time + timedelta(seconds=15)
+        end_time = current_time + timedelta(seconds=settings.REMINDER_SCHEDULE_HORIZON)
         current_time_str = current_time.isoformat(sep=' ')
         end_time_str = end_time.isoformat(sep=' ')
         triggered = False
         if clan_name is None:
-            cur.execute(sql, (triggered, current_time_str, end_time_str))
+            records = await settings.NAVI_DB.fetchall_async(sql, (triggered, current_time_str, end_time_str))
         else:
-            cur.execute(sql, (clan_name, triggered, current_time_str, end_time_str))
-        records = cur.fetchall()
+            records = await settings.NAVI_DB.fetchall_async(sql, (clan_name, triggered, current_time_str, end_time_str))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -477,12 +574,13 @@ async def get_old_user_reminders(user_id: Optional[int] = None) -> Tuple[Reminde
     else:
         sql = f'SELECT * FROM {table} WHERE user_id=? AND end_time < ?'
     try:
-        cur = settings.NAVI_DB.cursor()
         current_time = datetime.utcnow().replace(microsecond=0)
         end_time  = current_time - timedelta(seconds=20)
         end_time_str = end_time.isoformat(sep=' ')
-        cur.execute(sql, (end_time_str,)) if user_id is None else cur.execute(sql, (user_id, end_time_str))
-        records = cur.fetchall()
+        if user_id is None:
+            records = await settings.NAVI_DB.fetchall_async(sql, (end_time_str,))
+        else:
+            records = await settings.NAVI_DB.fetchall_async(sql, (user_id, end_time_str))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -523,12 +621,13 @@ async def get_old_clan_reminders(clan_name: Optional[str] = None) -> Tuple[Remin
     else:
         sql = f'SELECT * FROM {table} WHERE clan_name=? AND end_time < ?'
     try:
-        cur = settings.NAVI_DB.cursor()
         current_time = datetime.utcnow().replace(microsecond=0)
         end_time  = current_time - timedelta(seconds=20)
         end_time_str = end_time.isoformat(sep=' ')
-        cur.execute(sql, (end_time_str,)) if clan_name is None else cur.execute(sql, (clan_name, end_time_str))
-        records = cur.fetchall()
+        if clan_name is None:
+            records = await settings.NAVI_DB.fetchall_async(sql, (end_time_str,))
+        else:
+            records = await settings.NAVI_DB.fetchall_async(sql, (clan_name, end_time_str))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -567,20 +666,61 @@ async def _delete_reminder(reminder: Reminder) -> None:
         sql = f'DELETE FROM {table} WHERE clan_name=? AND activity=?'
     if reminder.activity == 'custom': sql = f'{sql} AND custom_id=?'
     try:
-        cur = settings.NAVI_DB.cursor()
         reminder_id = reminder.user_id if reminder.reminder_type == 'user' else reminder.clan_name
         if reminder.activity == 'custom':
-            cur.execute(sql, (reminder_id, reminder.activity, reminder.custom_id))
+            await settings.NAVI_DB.execute_async(sql, (reminder_id, reminder.activity, reminder.custom_id))
         else:
-            cur.execute(sql, (reminder_id, reminder.activity))
+            await settings.NAVI_DB.execute_async(sql, (reminder_id, reminder.activity))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
         )
         raise
+    _REMINDER_WRITES['count'] += 1
+    _remove_cached_reminder(reminder.reminder_type, reminder.user_id, reminder.clan_name, reminder.task_name)
+
+
+async def delete_old_reminders() -> Tuple[str]:
+    """Deletes all user and clan reminders that have an end time more than 20 seconds in the past with one DELETE per
+    table and unschedules them. Uses DELETE with RETURNING, which needs SQLite 3.35 (checked in resources.settings on
+    startup).
+
+    Returns
+    -------
+    Tuple with the task names of all deleted reminders
+
+    Raises
+    ------
+    sqlite3.Error if something happened within the database.
+    Also logs all errors to the database.
+    """
+    function_name = 'delete_old_reminders'
+    end_time = datetime.utcnow().replace(microsecond=0) - timedelta(seconds=20)
+    task_names = []
+    for table, columns in (('reminders_users', 'user_id, activity, custom_id'), ('reminders_clans', 'clan_name, activity')):
+        sql = f'DELETE FROM {table} WHERE end_time < ? RETURNING {columns}'
+        try:
+            records = await settings.NAVI_DB.fetchall_async(sql, (end_time.isoformat(sep=' '),))
+        except sqlite3.Error as error:
+            await errors.log_error(
+                strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
+            )
+            raise
+        _REMINDER_WRITES['count'] += 1
+        for record in records:
+            record = dict(record)
+            user_id = record.get('user_id', None)
+            clan_name = record.get('clan_name', None)
+            task_name = _get_task_name(user_id, clan_name, record['activity'], record.get('custom_id', None))
+            _remove_cached_reminder('clan' if user_id is None else 'user', user_id, clan_name, task_name)
+            task_names.append(task_name)
+    for task_name in task_names:
+        reminder_scheduler.cancel(task_name)
 
+    return tuple(task_names)
 
-async def _update_reminder(reminder: Reminder, **kwargs) -> None:
+
+async def _update_reminder(reminder: Reminder, **kwargs) -> Dict[str, Any]:
     """Updates reminder record. Use Reminder.update() to trigger this function.
 
     Arguments
@@ -597,6 +737,10 @@ async def _update_reminder(reminder: Reminder, **kwargs) -> None:
         triggered: bool
         user_id: int
 
+    Returns
+    -------
+    dict with all columns that were written (column=value), including triggered
+
     Raises
     ------
     sqlite3.Error if something happened within the database.
@@ -613,10 +757,10 @@ async def _update_reminder(reminder: Reminder, **kwargs) -> None:
     current_time = datetime.utcnow().replace(microsecond=0)
     end_time = kwargs['end_time'] if 'end_time' in kwargs else reminder.end_time
     time_left = end_time - current_time
-    triggered = False if time_left.total_seconds() > 15 else True
+    triggered = False if time_left.total_seconds() > settings.REMINDER_SCHEDULE_HORIZON else True
     if 'triggered' not in kwargs: kwargs['triggered'] = triggered
+    columns = dict(kwargs)
     try:
-        cur = settings.NAVI_DB.cursor()
         sql = f'UPDATE {table} SET'
         for kwarg in kwargs:
             sql = f'{sql} {kwarg} = :{kwarg},'
@@ -632,13 +776,85 @@ async def _update_reminder(reminder: Reminder, **kwargs) -> None:
         if reminder.activity == 'custom':
             kwargs['custom_id_old'] = reminder.custom_id
             sql = f'{sql} AND custom_id = :custom_id_old'
-        cur.execute(sql, kwargs)
+        await settings.NAVI_DB.execute_async(sql, kwargs)
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
         )
         raise
-    if triggered: scheduled_for_tasks[reminder.task_name] = reminder
+    _REMINDER_WRITES['count'] += 1
+    cached_reminder = _remove_cached_reminder(reminder.reminder_type, reminder.user_id, reminder.clan_name,
+                                              reminder.task_name)
+    if cached_reminder is not None:
+        for column, value in columns.items():
+            setattr(cached_reminder, column, value)
+        cached_reminder.task_name = _get_task_name(cached_reminder.user_id, cached_reminder.clan_name,
+                                                   cached_reminder.activity, cached_reminder.custom_id)
+        _store_cached_reminder(cached_reminder)
+    elif not _is_cached(reminder.reminder_type, reminder.user_id, reminder.clan_name):
+        # The updated values are unknown, so the cache of the user or clan the reminder belongs to now is dropped
+        if reminder.reminder_type == 'user':
+            _USER_REMINDERS.pop(columns.get('user_id', reminder.user_id), None)
+        else:
+            _CLAN_REMINDERS.pop(columns.get('clan_name', reminder.clan_name), None)
+
+    return columns
+
+
+async def _trigger_due_reminders(table: str, include_triggered: Optional[bool] = False) -> Tuple[Reminder]:
+    """Gets all reminders of a table that are due within the schedule horizon and sets them to triggered with one
+    batched update. Use schedule_reminders() to trigger this function.
+
+    Arguments
+    ---------
+    table: "reminders_users" or "reminders_clans"
+    include_triggered: If True, reminders that are already triggered are returned as well.
+
+    Returns
+    -------
+    Tuple[Reminder]. Empty if no reminders are due.
+
+    Raises
+    ------
+    sqlite3.Error if something happened within the database.
+    LookupError if something goes wrong reading the dict.
+    Also logs all errors to the database.
+    """
+    function_name = '_trigger_due_reminders'
+    current_time = datetime.utcnow().replace(microsecond=0)
+    end_time = current_time + timedelta(seconds=settings.REMINDER_SCHEDULE_HORIZON)
+    sql = f'SELECT rowid, * FROM {table} WHERE end_time BETWEEN ? AND ?'
+    if not include_triggered: sql = f'{sql} AND triggered=0'
+
+    def select_and_trigger() -> List[sqlite3.Row]:
+        """Runs on the database thread, so no other query can run between the select and the update"""
+        cur = settings.NAVI_DB.cursor()
+        cur.execute(sql, (current_time.isoformat(sep=' '), end_time.isoformat(sep=' ')))
+        records = cur.fetchall()
+        rowids = [record['rowid'] for record in records if not record['triggered']]
+        for index in range(0, len(rowids), 500):
+            rowids_chunk = rowids[index:index+500]
+            sql_update = f'UPDATE {table} SET triggered=1 WHERE rowid IN ({",".join("?" * len(rowids_chunk))})'
+            cur.execute(sql_update, rowids_chunk)
+        return records
+
+    try:
+        records = await settings.NAVI_DB.run_async(select_and_trigger)
+    except sqlite3.Error as error:
+        await errors.log_error(
+            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
+        )
+        raise
+    _REMINDER_WRITES['count'] += 1
+    reminders = []
+    for record in records:
+        record = dict(record)
+        record['triggered'] = True
+        reminder = await _dict_to_reminder(record)
+        _store_cached_reminder(reminder)
+        reminders.append(reminder)
+
+    return tuple(reminders)
 
 
 async def insert_user_reminder(user_id: int, activity: str, time_left: timedelta,
@@ -646,7 +862,7 @@ async def insert_user_reminder(user_id: int, activity: str, time_left: timedelta
     """Inserts a user reminder record.
     This function first checks if a reminder exists. If yes, the existing reminder will be updated instead and
     no new record is inserted.
-    If end_time is less than 16 seconds in the future, this also creates a background task.
+    If end_time is within the schedule horizon, this also schedules the reminder.
 
     Arguments
     ---------
@@ -666,13 +882,11 @@ async def insert_user_reminder(user_id: int, activity: str, time_left: timedelta
     current_time = datetime.utcnow().replace(microsecond=0)
     end_time = current_time + time_left
     custom_id = None
-    triggered = False if time_left.total_seconds() > 15 else True
+    triggered = False if time_left.total_seconds() > settings.REMINDER_SCHEDULE_HORIZON else True
     try:
-        cur = settings.NAVI_DB.cursor()
         if activity == 'custom':
             sql = f'SELECT custom_id FROM {table} WHERE user_id = ? AND activity = ? ORDER BY custom_id ASC'
-            cur.execute(sql, (user_id, 'custom',))
-            record_custom_reminders = cur.fetchall()
+            record_custom_reminders = await settings.NAVI_DB.fetchall_async(sql, (user_id, 'custom',))
             if not record_custom_reminders:
                 custom_id = 1
             else:
@@ -713,19 +927,33 @@ async def insert_user_reminder(user_id: int, activity: str, time_left: timedelta
             f'VALUES (?, ?, ?, ?, ?, ?, ?)'
         )
         try:
-            cur.execute(sql, (user_id, activity, end_time, channel_id, message, custom_id, triggered))
+            await settings.NAVI_DB.execute_async(sql, (user_id, activity, end_time, channel_id, message, custom_id,
+                                                       triggered))
         except sqlite3.Error as error:
             await errors.log_error(
                 strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
             )
             raise
-        reminder = await get_user_reminder(user_id, activity, custom_id)
+        reminder = Reminder(
+            activity = activity,
+            channel_id = channel_id,
+            clan_name = None,
+            custom_id = custom_id,
+            end_time = end_time,
+            message = message,
+            reminder_type = 'user',
+            task_name = _get_task_name(user_id, None, activity, custom_id),
+            triggered = triggered,
+            user_id = user_id,
+        )
+        _REMINDER_WRITES['count'] += 1
+        _store_cached_reminder(reminder)
 
-    # Create background task if necessary
+    # Schedule reminder if necessary
     if triggered:
-        scheduled_for_tasks[reminder.task_name] = reminder
+        reminder_scheduler.schedule(reminder)
     else:
-        scheduled_for_deletion[reminder.task_name] = reminder
+        reminder_scheduler.cancel(reminder.task_name)
 
     return reminder
 
@@ -734,7 +962,7 @@ async def insert_clan_reminder(clan_name: str, time_left: timedelta, channel_id:
     """Inserts a clan reminder record.
     This function first checks if a reminder exists. If yes, the existing reminder will be updated instead and
     no new record is inserted.
-    If end_time is less than 16 seconds in the future, this also creates a background task.
+    If end_time is within the schedule horizon, this also schedules the reminder.
 
     Returns
     -------
@@ -754,7 +982,7 @@ async def insert_clan_reminder(clan_name: str, time_left: timedelta, channel_id:
         pass
     current_time = datetime.utcnow().replace(microsecond=0)
     end_time = current_time + time_left
-    triggered = False if time_left.total_seconds() > 15 else True
+    triggered = False if time_left.total_seconds() > settings.REMINDER_SCHEDULE_HORIZON else True
     if reminder is not None:
         await reminder.update(end_time=end_time, channel_id=channel_id, message=message, triggered=triggered)
     else:
@@ -763,25 +991,37 @@ async def insert_clan_reminder(clan_name: str, time_left: timedelta, channel_id:
             f'VALUES (?, ?, ?, ?, ?, ?)'
         )
         try:
-            cur = settings.NAVI_DB.cursor()
-            cur.execute(sql, (clan_name, 'guild', end_time, channel_id, message, triggered))
+            await settings.NAVI_DB.execute_async(sql, (clan_name, 'guild', end_time, channel_id, message, triggered))
         except sqlite3.Error as error:
             await errors.log_error(
                 strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
             )
             raise
-        reminder = await get_clan_reminder(clan_name)
-    # Create background task if necessary
+        reminder = Reminder(
+            activity = 'guild',
+            channel_id = channel_id,
+            clan_name = clan_name,
+            custom_id = None,
+            end_time = end_time,
+            message = message,
+            reminder_type = 'clan',
+            task_name = _get_task_name(None, clan_name, 'guild', None),
+            triggered = triggered,
+            user_id = None,
+        )
+        _REMINDER_WRITES['count'] += 1
+        _store_cached_reminder(reminder)
+    # Schedule reminder if necessary
     if triggered:
-        scheduled_for_tasks[reminder.task_name] = reminder
+        reminder_scheduler.schedule(reminder)
     else:
-        scheduled_for_deletion[reminder.task_name] = reminder
+        reminder_scheduler.cancel(reminder.task_name)
     return reminder
 
 
 async def reduce_reminder_time(user_id: int, time_reduction: Union[timedelta, str], activities: List[str]) -> None:
     """Reduces the end time of all user reminders affected by sleepy potions of one user by a certain amount.
-    If the new end time is within the next 15 seconds, the reminder is immediately scheduled.
+    If the new end time is within the schedule horizon, the reminder is immediately scheduled.
     If the new end time is in the past, the reminder is deleted.
 
     Arguments
@@ -812,18 +1052,16 @@ async def reduce_reminder_time(user_id: int, time_reduction: Union[timedelta, st
         new_end_time = reminder.end_time - reduced_time
         time_left = new_end_time - current_time
         if time_left.total_seconds() <= 0:
-            scheduled_for_deletion[reminder.task_name] = reminder
             await reminder.delete()
-        elif 1 <= time_left.total_seconds() <= 15:
+        elif 1 <= time_left.total_seconds() <= settings.REMINDER_SCHEDULE_HORIZON:
             await reminder.update(end_time=new_end_time, triggered=True)
-            scheduled_for_tasks[reminder.task_name] = reminder
         else:
             await reminder.update(end_time=new_end_time)
 
 
 async def reduce_reminder_time_percentage(user_id: int, percentage: float, activities: List[str], user_settings) -> None:
     """Reduces the end time of user reminders by a certain percentage of the cooldown.
-    If the new end time is within the next 15 seconds, the reminder is immediately scheduled.
+    If the new end time is within the schedule horizon, the reminder is immediately scheduled.
     If the new end time is in the past, the reminder is deleted.
     Note that the percentage is calculated based on the full cooldown.
 
@@ -845,32 +1083,30 @@ async def reduce_reminder_time_percentage(user_id: int, percentage: float, activ
         return
     for reminder in reminders:
         if reminder.activity not in activities: continue
-        cooldown = await cooldowns.get_cooldown(reminder.activity)
+        cooldown = await cooldowns.get_cached_cooldown(reminder.activity)
         user_donor_tier = 3 if user_settings.user_donor_tier > 3 else user_settings.user_donor_tier
         if cooldown.donor_affected:
-            cooldown_seconds = (cooldown.actual_cooldown_mention()
+            cooldown_seconds = (cooldown.actual_cooldown_mention
                                 * settings.DONOR_COOLDOWNS[user_donor_tier])
         else:
-            cooldown_seconds = cooldown.actual_cooldown_mention()
+            cooldown_seconds = cooldown.actual_cooldown_mention
         time_left = reminder.end_time - current_time
         time_left_new_seconds = time_left.total_seconds() - (cooldown_seconds * ((percentage) / 100))
         time_left_new = timedelta(seconds=time_left_new_seconds)
         new_end_time = current_time + time_left_new
         if time_left_new_seconds <= 0:
-            reminder.end_time = current_time + timedelta(seconds=1)
-            scheduled_for_tasks[reminder.task_name] = reminder
-            scheduled_for_deletion[reminder.task_name] = reminder
             await reminder.delete()
-        elif 1 <= time_left.total_seconds() <= 15:
+            reminder.end_time = current_time + timedelta(seconds=1)
+            reminder_scheduler.schedule(reminder)
+        elif 1 <= time_left.total_seconds() <= settings.REMINDER_SCHEDULE_HORIZON:
             await reminder.update(end_time=new_end_time, triggered=True)
-            scheduled_for_tasks[reminder.task_name] = reminder
         else:
             await reminder.update(end_time=new_end_time)
 
 
 async def increase_reminder_time_percentage(user_id: int, percentage: float, activities: List[str], user_settings) -> None:
     """Increases the end time of user reminders by a certain percentage of the cooldown.
-    Doesn't affect reminders already scheduled.
+    Reminders that are due within the schedule horizon after the change are rescheduled.
     Note that the percentage is calculated based on the full cooldown.
 
     Arguments
@@ -891,17 +1127,15 @@ async def increase_reminder_time_percentage(user_id: int, percentage: float, act
         return
     for reminder in reminders:
         if reminder.activity not in activities: continue
-        cooldown = await cooldowns.get_cooldown(reminder.activity)
+        cooldown = await cooldowns.get_cached_cooldown(reminder.activity)
         user_donor_tier = 3 if user_settings.user_donor_tier > 3 else user_settings.user_donor_tier
         if cooldown.donor_affected:
-            cooldown_seconds = (cooldown.actual_cooldown_mention()
+            cooldown_seconds = (cooldown.actual_cooldown_mention
                                 * settings.DONOR_COOLDOWNS[user_donor_tier])
         else:
-            cooldown_seconds = cooldown.actual_cooldown_mention()
+            cooldown_seconds = cooldown.actual_cooldown_mention
         time_left = reminder.end_time - current_time
         time_left_new_seconds = time_left.total_seconds() + (cooldown_seconds * ((percentage) / 100))
         time_left_new = timedelta(seconds=time_left_new_seconds)
         new_end_time = current_time + time_left_new
-        if reminder.triggered:
-            scheduled_for_deletion[reminder.task_name] = reminder
-        await reminder.update(end_time=new_end_time, triggered=False)
\ No newline at end of file
+        await reminder.update(end_time=new_end_time)
\ No newline at end of file
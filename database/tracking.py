@@ -1,5 +1,5 @@
 # tracking.py
-"""Provides access to the tables "tracking_log" and "tracking_leaderboard" in the database"""
+"""Provides access to the table "tracking_log" in the database"""
 
 
 from dataclasses import dataclass
@@ -7,9 +7,7 @@ from datetime import datetime, timedelta
 import sqlite3
 from typing import NamedTuple, Optional, Tuple
 
-from discord.ext import tasks
-
-from database import errors, users
+from database import errors
 from resources import exceptions, settings, strings
 
 
@@ -57,7 +55,7 @@ class LogEntry():
         self.user_id = new_settings.user_id
 
     async def update(self, **kwargs) -> None:
-        """Updates the log entry record in the database. Also calls refresh().
+        """Updates the log entry record in the database and applies the changes to this object.
 
         Arguments
         ---------
@@ -69,7 +67,8 @@ class LogEntry():
             guild_id: int
         """
         await _update_log_entry(self, **kwargs)
-        await self.refresh()
+        for column, value in kwargs.items():
+            setattr(self, 'entry_type' if column == 'type' else column, value)
 
 class LogReport(NamedTuple):
     """Object that represents a report based on a certain amount of log entries."""
@@ -84,104 +83,6 @@ class LogReport(NamedTuple):
     user_id: int
     work_amount: int
 
-@dataclass()
-class LogLeaderboardUser():
-    """Object that represents a user report from table "tracking_leaderboard"."""
-    all_time: int
-    command: str
-    guild_id: int # Set to None if report_type is 'global'
-    report_type: str # Either 'guild' or 'global'
-    last_1h: int
-    last_12h: int
-    last_24h: int
-    last_7d: int
-    last_4w: int
-    last_12m: int
-    updated: int
-    user_id: int
-
-    async def refresh(self) -> None:
-        """Refreshes leaderboard user data from the database.
-        If the record doesn't exist anymore, "record_exists" will be set to False.
-        All other values will stay on their old values before deletion (!).
-        """
-        try:
-            new_settings = await get_log_leaderboard_user(self.user_id, self.guild_id, self.command)
-        except exceptions.NoDataFoundError as error:
-            self.record_exists = False
-            return
-        self.all_time = new_settings.all_time
-        self.command = new_settings.command
-        self.guild_id = new_settings.guild_id
-        self.report_type = new_settings.report_type
-        self.last_1h = new_settings.last_1h
-        self.last_12h = new_settings.last_12h
-        self.last_24h = new_settings.last_24h
-        self.last_7d = new_settings.last_7d
-        self.last_4w = new_settings.last_4w
-        self.last_12m = new_settings.last_12m
-        self.updated = new_settings.updated
-        self.user_id = new_settings.user_id
-
-    async def update(self, **kwargs) -> None:
-        """Updates the leaderboard record in the database. Also calls refresh().
-
-        Arguments
-        ---------
-        kwargs (column=value):
-            user_id: int
-            guild_id: int
-            command: str
-            last_1h: int
-            last_12h: int
-            last_24h: int
-            last_7d: int
-            last_4w: int
-            last_1y: int
-            all_time: int
-            updated: datetime UTC - If not specified, will be set to current time
-        """
-        await _update_log_leaderboard_user(self, **kwargs)
-        await self.refresh()
-
-# Tasks
-@tasks.loop(minutes=5.0)
-async def log_to_leaderboard():
-    """Task that converts the tracking log entries into leaderboard entries"""
-    async def count_commands(log_entries: Tuple[LogEntry]) -> dict:
-        """Returns dict with total command count for each guild for a tuple of log entries
-
-        Returns
-        ---------
-        dict with command count per guild
-        key: value --> guild_id: command count
-        """
-        guild_command_count = {}
-        for log_entry in log_entries:
-            if log_entry.guild_id in guild_command_count:
-                guild_command_count[log_entry.guild_id] += log_entry.command_count
-            else:
-                guild_command_count[log_entry.guild_id] = log_entry.command_count
-        return guild_command_count
-
-    all_users: users.User = await users.get_all_users()
-    for user in all_users:
-        log_entries_1h = await get_log_entries(user.user_id, 'hunt', timedelta(hours=1))
-        count_1h = await count_commands(log_entries_1h)
-        log_entries_12h = await get_log_entries(user.user_id, 'hunt', timedelta(hours=12))
-        count_12h = await count_commands(log_entries_12h)
-        log_entries_24h = await get_log_entries(user.user_id, 'hunt', timedelta(hours=24))
-        count_24h = await count_commands(log_entries_24h)
-        log_entries_7d = await get_log_entries(user.user_id, 'hunt', timedelta(days=7))
-        count_7d = await count_commands(log_entries_7d)
-        log_entries_4w = await get_log_entries(user.user_id, 'hunt', timedelta(weeks=4))
-        count_4w = await count_commands(log_entries_4w)
-        log_entries_1y = await get_log_entries(user.user_id, 'hunt', timedelta(weeks=52))
-        count_1y = await count_commands(log_entries_1y)
-        for guild_id in count_1h:
-            pass
-        await insert_log_leaderboard_user(user.user_id, )
-
 # Miscellaneous functions
 async def _dict_to_log_entry(record: dict) -> LogEntry:
     """Creates a LogEntry object from a database record
@@ -217,47 +118,6 @@ async def _dict_to_log_entry(record: dict) -> LogEntry:
     return log_entry
 
 
-async def _dict_to_leaderboard_user(record: dict) -> LogEntry:
-    """Creates a LogLeaderboardUser object from a database record
-
-    Arguments
-    ---------
-    record: Database record from table "tracking_leaderboard" as a dict.
-
-    Returns
-    -------
-    LogLeaderboardUser object.
-
-    Raises
-    ------
-    LookupError if something goes wrong reading the dict. Also logs this error to the database.
-    """
-    function_name = '_dict_to_log_leaderboard_user'
-    try:
-        log_leaderboard_user = LogLeaderboardUser(
-            all_time =  record['all_time'],
-            command = record['commmand'],
-            guild_id = record['guild_id'],
-            last_1h = record['last_1h'],
-            last_12h = record['last_12h'],
-            last_24h = record['last_24h'],
-            last_7d = record['last_7d'],
-            last_4w = record['last_4w'],
-            last_12m = record['last_12m'],
-            report_type = 'global' if record['guild_id'] is None else 'guild',
-            updated = datetime.fromisoformat(record['updated']),
-            user_id = record['user_id'],
-        )
-
-    except Exception as error:
-        await errors.log_error(
-            strings.INTERNAL_ERROR_DICT_TO_OBJECT.format(function=function_name, record=record)
-        )
-        raise LookupError(error)
-
-    return log_leaderboard_user
-
-
 # Read Data
 async def get_log_entry(user_id: int, guild_id: int, command: str, date_time: datetime, entry_type: Optional[str] = 'single') -> LogEntry:
     """Gets a specific log entry based on a specific user, command and an EXACT time.
@@ -278,9 +138,7 @@ async def get_log_entry(user_id: int, guild_id: int, command: str, date_time: da
     function_name = 'get_log_entry'
     sql = f'SELECT * FROM {table} WHERE user_id=? AND guild_id=? AND command=? AND date_time=? AND type=?'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (user_id, guild_id, command, date_time, entry_type))
-        record = cur.fetchone()
+        record = await settings.NAVI_DB.fetchone_async(sql, (user_id, guild_id, command, date_time, entry_type))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -326,12 +184,10 @@ async def get_log_entries(user_id: int, command: str, timeframe: timedelta,
     date_time = datetime.utcnow() - timeframe
     if guild_id is not None: sql = f'{sql} AND guild_id=?'
     try:
-        cur = settings.NAVI_DB.cursor()
         if guild_id is None:
-            cur.execute(sql, (user_id, date_time, command))
+            records = await settings.NAVI_DB.fetchall_async(sql, (user_id, date_time, command))
         else:
-            cur.execute(sql, (user_id, date_time, command, guild_id))
-        records = cur.fetchall()
+            records = await settings.NAVI_DB.fetchall_async(sql, (user_id, date_time, command, guild_id))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -373,9 +229,7 @@ async def get_all_log_entries(user_id: int) -> Tuple[LogEntry]:
         f'SELECT * FROM {table} WHERE user_id=?'
     )
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (user_id,))
-        records = cur.fetchall()
+        records = await settings.NAVI_DB.fetchall_async(sql, (user_id,))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -392,53 +246,6 @@ async def get_all_log_entries(user_id: int) -> Tuple[LogEntry]:
     return tuple(log_entries)
 
 
-async def get_old_log_entries(days: int) -> Tuple[LogEntry]:
-    """Gets all single log entries older than a certain amount of days.
-
-    Arguments
-    ---------
-    user_id: int
-    days: amount of days that should be kept as single entries
-    guild_id: Optional[int]
-
-    Returns
-    -------
-    Tuple[LogEntry]
-
-    Raises
-    ------
-    sqlite3.Error if something happened within the database.
-    exceptions.NoDataFoundError if no guild was found.
-    LookupError if something goes wrong reading the dict.
-    Also logs all errors to the database.
-    """
-    table = 'tracking_log'
-    function_name = 'get_old_log_entries'
-    sql = (
-        f'SELECT * FROM {table} WHERE date_time<? AND type=?'
-    )
-    date_time = datetime.utcnow() - timedelta(days=days)
-    date_time = date_time.replace(hour=0, minute=0, second=0)
-    try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (date_time, 'single'))
-        records = cur.fetchall()
-    except sqlite3.Error as error:
-        await errors.log_error(
-            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
-        )
-        raise
-    if not records:
-        error_message = f'No log data found in database older than {days} days".'
-        raise exceptions.NoDataFoundError(error_message)
-    log_entries = []
-    for record in records:
-        log_entry = await _dict_to_log_entry(dict(record))
-        log_entries.append(log_entry)
-
-    return tuple(log_entries)
-
-
 async def get_log_report(user_id: int, timeframe: timedelta,
                          guild_id: Optional[int] = None) -> LogReport:
     """Gets a summary log report for all commands for a certain amount of time from a user id.
@@ -461,12 +268,10 @@ async def get_log_report(user_id: int, timeframe: timedelta,
     if guild_id is not None: sql = f'{sql} AND guild_id=?'
     sql = f'{sql} GROUP BY command'
     try:
-        cur = settings.NAVI_DB.cursor()
         if guild_id is None:
-            cur.execute(sql, (user_id, date_time))
+            records = await settings.NAVI_DB.fetchall_async(sql, (user_id, date_time))
         else:
-            cur.execute(sql, (user_id, date_time, guild_id))
-        records = cur.fetchall()
+            records = await settings.NAVI_DB.fetchall_async(sql, (user_id, date_time, guild_id))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -499,91 +304,6 @@ async def get_log_report(user_id: int, timeframe: timedelta,
     return log_report
 
 
-async def get_log_leaderboard_user(user_id: int, guild_id: int, command: str) -> LogLeaderboardUser:
-    """Gets a guild or global leaderboard.
-
-    Arguments
-    ---------
-    command: str
-    guild_id: Optional[int]
-
-    Returns
-    -------
-    Tuple[LogEntry]
-
-    Raises
-    ------
-    sqlite3.Error if something happened within the database.
-    exceptions.NoDataFoundError if no guild was found.
-    LookupError if something goes wrong reading the dict.
-    Also logs all errors to the database.
-    """
-    table = 'tracking_leaderboard'
-    function_name = 'get_log_leaderboard_user'
-    sql = f'SELECT * FROM {table} WHERE user_id=? AND guild_id=? AND command=?'
-    try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (user_id, guild_id, command))
-        record = cur.fetchone()
-    except sqlite3.Error as error:
-        await errors.log_error(
-            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
-        )
-        raise
-    if not record:
-        error_message = (
-            f'No leaderboard data found in database for user "{user_id}", guild "{guild_id}" and command "{command}".'
-        )
-        raise exceptions.NoDataFoundError(error_message)
-    log_leaderboard_user = await _dict_to_leaderboard_user(dict(record))
-
-    return log_leaderboard_user
-
-
-async def get_log_leaderboard(command: str, guild_id: Optional[int] = None) -> Tuple[LogLeaderboardUser]:
-    """Gets a certain record from table "tracking_leaderboard".
-
-    Arguments
-    ---------
-    command: str
-    guild_id: Optional[int]
-
-    Returns
-    -------
-    Tuple[LogEntry]
-
-    Raises
-    ------
-    sqlite3.Error if something happened within the database.
-    exceptions.NoDataFoundError if no guild was found.
-    LookupError if something goes wrong reading the dict.
-    Also logs all errors to the database.
-    """
-    table = 'tracking_leaderboard'
-    function_name = 'get_log_leaderboard'
-    sql = f'SELECT * FROM {table} WHERE command=?'
-    if guild_id is not None: sql = f'{sql} AND guild_id=?'
-    try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (command,)) if guild_id is None else cur.execute(sql, (command, guild_id))
-        records = cur.fetchall()
-    except sqlite3.Error as error:
-        await errors.log_error(
-            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
-        )
-        raise
-    if not records:
-        error_message = f'No leaderboard data found in database for command "{command}".'
-        if guild_id is not None: error_message = f'{error_message} Guild: {guild_id}'
-        raise exceptions.NoDataFoundError(error_message)
-    log_leaderboard = []
-    for record in records:
-        log_entry = await _dict_to_leaderboard_user(dict(record))
-        log_leaderboard.append(log_entry)
-
-    return tuple(log_leaderboard)
-
-
 # Write Data
 async def _delete_log_entry(log_entry: LogEntry) -> None:
     """Deletes a log entry. Use LogEntry.delete() to trigger this function.
@@ -598,62 +318,8 @@ async def _delete_log_entry(log_entry: LogEntry) -> None:
     function_name = '_delete_log_entry'
     sql = f'DELETE FROM {table} WHERE user_id=? AND guild_id=? AND command=? AND date_time=? AND type=?'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (log_entry.user_id, log_entry.guild_id, log_entry.command, log_entry.date_time,
-                          log_entry.entry_type))
-    except sqlite3.Error as error:
-        await errors.log_error(
-            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
-        )
-        raise
-
-
-async def _update_log_leaderboard_user(log_leaderboard_user: LogLeaderboardUser, **kwargs) -> None:
-    """Updates log_leaderboard record. Use LogLeaderboardUser.update() to trigger this function.
-
-    Arguments
-    ---------
-    log_leaderboard_user: LogLeaderboardUser
-    kwargs (column=value):
-        user_id: int
-        guild_id: int
-        command: str
-        last_1h: int
-        last_12h: int
-        last_24h: int
-        last_7d: int
-        last_4w: int
-        last_1y: int
-        all_time: int
-        updated: datetime UTC - If not specified, will be set to current time
-
-    Raises
-    ------
-    sqlite3.Error if something happened within the database.
-    NoArgumentsError if no kwargs are passed (need to pass at least one)
-    Also logs all errors to the database.
-    """
-    table = 'log_leaderboard'
-    function_name = '_update_log_leaderboard_user'
-    if not kwargs:
-        await errors.log_error(
-            strings.INTERNAL_ERROR_NO_ARGUMENTS.format(table=table, function=function_name)
-        )
-        raise exceptions.NoArgumentsError('You need to specify at least one keyword argument.')
-    current_time = datetime.utcnow().replace(microsecond=0)
-    if 'updated' not in kwargs:
-        kwargs['updated'] = current_time
-    try:
-        cur = settings.NAVI_DB.cursor()
-        sql = f'UPDATE {table} SET'
-        for kwarg in kwargs:
-            sql = f'{sql} {kwarg} = :{kwarg},'
-        sql = sql.strip(",")
-        kwargs['user_id_old'] = log_leaderboard_user.user_id
-        kwargs['guild_id_old'] = log_leaderboard_user.guild_id
-        kwargs['command_old'] = log_leaderboard_user.command
-        sql = f'{sql} WHERE user_id = :user_id_old AND guild_id = :guild_id_old AND command = :command_old'
-        cur.execute(sql, kwargs)
+        await settings.NAVI_DB.execute_async(sql, (log_entry.user_id, log_entry.guild_id, log_entry.command,
+                                                   log_entry.date_time, log_entry.entry_type))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -689,7 +355,6 @@ async def _update_log_entry(log_entry: LogEntry, **kwargs) -> None:
         )
         raise exceptions.NoArgumentsError('You need to specify at least one keyword argument.')
     try:
-        cur = settings.NAVI_DB.cursor()
         sql = f'UPDATE {table} SET'
         for kwarg in kwargs:
             sql = f'{sql} {kwarg} = :{kwarg},'
@@ -702,7 +367,7 @@ async def _update_log_entry(log_entry: LogEntry, **kwargs) -> None:
             f'{sql} WHERE user_id = :user_id_old AND type = :entry_type_old AND command = :command_old '
             f'AND date_time = :date_time_old'
         )
-        cur.execute(sql, kwargs)
+        await settings.NAVI_DB.execute_async(sql, kwargs)
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -729,118 +394,109 @@ async def insert_log_entry(user_id: int, guild_id: int,
         f'INSERT INTO {table} (user_id, guild_id, command, command_count, date_time) VALUES (?, ?, ?, ?, ?)'
     )
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (user_id, guild_id, command, 1, date_time))
+        await settings.NAVI_DB.execute_async(sql, (user_id, guild_id, command, 1, date_time))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
         )
         raise
-    log_entry = await get_log_entry(user_id, guild_id, command, date_time)
+    log_entry = LogEntry(
+        command = command,
+        command_count = 1,
+        date_time = date_time,
+        entry_type = 'single',
+        guild_id = guild_id,
+        user_id = user_id,
+    )
 
     return log_entry
 
 
-async def insert_log_summary(user_id: int, guild_id: int, command: str, date_time: datetime, amount: int) -> LogEntry:
-    """Inserts a summary record to the table "tracking_log". If record already exists, count is increased by one instead.
+async def consolidate_log_entries(days: int) -> int:
+    """Consolidates all single log entries older than a certain amount of days into one summary entry per user, guild,
+    command and day.
+    Every day is consolidated in its own transaction with one INSERT ... SELECT and one DELETE, so other queries can run
+    in between. If the day already had a summary entry, the new one is merged into it in the same transaction.
+    The oldest single entry that is left is the progress cursor, so if this gets interrupted, the next run continues
+    where this one stopped.
+
+    Arguments
+    ---------
+    days: Amount of days that should be kept as single entries
 
     Returns
     -------
-    LogEntry object with the newly created log entry.
+    Amount of single log entries consolidated: int
 
     Raises
     ------
     sqlite3.Error if something happened within the database.
     Also logs all errors to the database.
     """
-    function_name = 'insert_log_summary'
     table = 'tracking_log'
-    log_entry = None
-    try:
-        log_entry = await get_log_entry(user_id, guild_id, command, date_time, 'summary')
-    except exceptions.NoDataFoundError:
-        pass
-    if log_entry is not None:
-        await log_entry.update(command_count=log_entry.command_count + amount)
-    else:
-        sql = (
-            f'INSERT INTO {table} (user_id, guild_id, command, command_count, date_time, type) VALUES (?, ?, ?, ?, ?, ?)'
-        )
-        try:
-            cur = settings.NAVI_DB.cursor()
-            cur.execute(sql, (user_id, guild_id, command, amount, date_time, 'summary'))
-        except sqlite3.Error as error:
-            await errors.log_error(
-                strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
-            )
-            raise
-        log_entry = await get_log_entry(user_id, guild_id, command, date_time, 'summary')
-
-    return log_entry
-
+    function_name = 'consolidate_log_entries'
+    sql_cursor = f"SELECT MIN(date_time) AS date_time FROM {table} WHERE type='single' AND date_time<?"
+    sql_insert = (
+        f"INSERT INTO {table} (user_id, guild_id, command, command_count, date_time, type) "
+        f"SELECT user_id, guild_id, command, SUM(command_count), date(date_time) || ' 23:59:59.999999', 'summary' "
+        f"FROM {table} WHERE type='single' AND date_time>=? AND date_time<? "
+        f"GROUP BY user_id, guild_id, command, date(date_time)"
+    )
+    sql_delete = f"DELETE FROM {table} WHERE type='single' AND date_time>=? AND date_time<?"
+    sql_first_summaries = (
+        f"SELECT MIN(rowid) FROM {table} WHERE type='summary' AND date_time=? GROUP BY user_id, guild_id, command"
+    )
+    sql_merge = (
+        f"UPDATE {table} SET command_count=(SELECT SUM(summary.command_count) FROM {table} AS summary "
+        f"WHERE summary.type='summary' AND summary.date_time={table}.date_time AND summary.user_id={table}.user_id "
+        f"AND summary.guild_id IS {table}.guild_id AND summary.command={table}.command) "
+        f"WHERE type='summary' AND date_time=? AND rowid IN ({sql_first_summaries} HAVING COUNT(*)>1)"
+    )
+    sql_delete_merged = (
+        f"DELETE FROM {table} WHERE type='summary' AND date_time=? AND rowid NOT IN ({sql_first_summaries})"
+    )
+    date_time_max = datetime.utcnow() - timedelta(days=days)
+    date_time_max = date_time_max.replace(hour=0, minute=0, second=0, microsecond=0)
 
-async def insert_log_leaderboard_user(user_id: int, guild_id: int, command: str, all_time: int, last_1h: int,
-                                      last_12h: int, last_24h: int, last_7d: int, last_4w: int, last_12m: int,
-                                      updated: datetime,) -> LogEntry:
-    """Inserts a a record to the table "tracking_leaderboard".
-    This function first checks if a record exists. If yes, the existing record will be updated instead and
-    no new record is inserted.
+    def consolidate_day() -> int:
+        """Runs on the database thread. Consolidates the day of the oldest single log entry.
 
-    Returns
-    -------
-    LogLeaderBoardUser object with the newly created entry.
+        Returns
+        -------
+        Amount of single log entries consolidated, -1 if there is nothing left to consolidate.
+        """
+        cur = settings.NAVI_DB.cursor()
+        record = cur.execute(sql_cursor, (date_time_max,)).fetchone()
+        if record['date_time'] is None: return -1
+        day_start = datetime.fromisoformat(str(record['date_time'])[:10])
+        day_end = min(day_start + timedelta(days=1), date_time_max)
+        cur.execute('BEGIN')
+        try:
+            cur.execute(sql_insert, (day_start, day_end))
+            cur.execute(sql_delete, (day_start, day_end))
+            log_entry_count = cur.rowcount
+            summary_date_time = day_start.replace(hour=23, minute=59, second=59, microsecond=999999)
+            cur.execute(sql_merge, (summary_date_time, summary_date_time))
+            cur.execute(sql_delete_merged, (summary_date_time, summary_date_time))
+            cur.execute('COMMIT')
+        except sqlite3.Error:
+            cur.execute('ROLLBACK')
+            raise
+        return log_entry_count
 
-    Raises
-    ------
-    sqlite3.Error if something happened within the database.
-    Also logs all errors to the database.
-    """
-    function_name = 'insert_log_leaderboard_user'
-    table = 'tracking_leaderboard'
-    log_leaderboard_user = None
-    try:
-        log_leaderboard_user = await get_log_leaderboard_user(user_id, guild_id, command)
-    except exceptions.NoDataFoundError:
-        pass
-    if log_leaderboard_user is not None:
-        await log_leaderboard_user.update(all_time=all_time, last_1h=last_1h, last_12h=last_12h, last_24h=last_24h,
-                                          last_7d=last_7d, last_4w=last_4w, last_12m=last_12m, updated=updated)
-    else:
-        sql = (
-            f'INSERT INTO {table} (user_id, guild_id, command, command_count, date_time) VALUES (?, ?, ?, ?, ?)'
-        )
+    log_entry_count = 0
+    while True:
         try:
-            cur = settings.NAVI_DB.cursor()
-            cur.execute(sql, (user_id, guild_id, command, all_time, last_1h, last_12h, last_24h, last_7d, last_4w,
-                            last_12h, updated))
+            day_count = await settings.NAVI_DB.run_async(consolidate_day)
         except sqlite3.Error as error:
             await errors.log_error(
-                strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
+                strings.INTERNAL_ERROR_SQLITE3.format(
+                    error=error, table=table, function=function_name,
+                    sql=f'{sql_insert}; {sql_delete}; {sql_merge}; {sql_delete_merged}'
+                )
             )
             raise
-        log_leaderboard_user = await get_log_leaderboard_user(user_id, guild_id, command)
-
-    return log_leaderboard_user
+        if day_count < 0: break
+        log_entry_count += day_count
 
-
-async def delete_log_entries(user_id: int, guild_id: int, command: str, date_time_min: datetime,
-                             date_time_max: datetime) -> None:
-    """Deletes all single log entries between two datetimes.
-
-    Raises
-    ------
-    sqlite3.Error if something happened within the database.
-    NoArgumentsError if no kwargs are passed (need to pass at least one)
-    Also logs all errors to the database.
-    """
-    table = 'tracking_log'
-    function_name = '_delete_log_entries'
-    sql = f'DELETE FROM {table} WHERE user_id=? AND guild_id=? AND command=? AND type=? AND date_time BETWEEN ? AND ?'
-    try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (user_id, guild_id, command, 'single', date_time_min, date_time_max))
-    except sqlite3.Error as error:
-        await errors.log_error(
-            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
-        )
-        raise
\ No newline at end of file
+    return log_entry_count
@@ -36,8 +36,8 @@ def update_database() -> bool:
     if db_version == settings.NAVI_DB_VERSION:
         logs.logger.info('Database Update: Nothing to do, exiting.')
         return True
-    logs.logger.info('Database: Backing up database to /database/navi_db_backup.db...')
-    backup_db_file = os.path.join(settings.BOT_DIR, 'database/navi_db_backup.db')
+    backup_db_file = os.path.join(os.path.dirname(settings.DB_FILE), 'navi_db_backup.db')
+    logs.logger.info(f'Database: Backing up database to {backup_db_file}...')
     navi_backup_db = sqlite3.connect(backup_db_file)
     settings.NAVI_DB.backup(navi_backup_db)
     navi_backup_db.close()
@@ -454,6 +454,40 @@ def update_database() -> bool:
             "('{name} Hey! It''s time for {command}!')",
             "ALTER TABLE users ADD alert_love_share_visible INTEGER NOT NULL DEFAULT (1)",
         ]
+    if db_version < 18:
+        sqls += [
+            "DROP TABLE IF EXISTS tracking_leaderboard",
+        ]
+    if db_version < 19:
+        sqls += [
+            "CREATE INDEX IF NOT EXISTS tracking_log_type_date_time ON tracking_log (type, date_time)",
+            "PRAGMA auto_vacuum = INCREMENTAL", # Applied by the VACUUM below
+        ]
+    if db_version < 20:
+        clan_member_columns = ('leader_id',) + tuple(f'member{number}_id' for number in range(1, 11))
+        sqls += [
+            "CREATE TABLE IF NOT EXISTS clan_members (user_id INTEGER PRIMARY KEY NOT NULL, clan_name TEXT NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS clan_members_clan_name ON clan_members (clan_name)",
+            "INSERT OR REPLACE INTO clan_members (user_id, clan_name) "
+            + ' UNION '.join(f"SELECT {column}, clan_name FROM clans WHERE {column} IS NOT NULL"
+                             for column in clan_member_columns),
+            "CREATE INDEX IF NOT EXISTS users_clan_name ON users (clan_name)",
+        ]
+    if db_version < 21:
+        sqls += [
+            "CREATE INDEX IF NOT EXISTS alts_user2_id ON alts (user2_id)",
+        ]
+    if db_version < 22:
+        sqls += [
+            "CREATE INDEX IF NOT EXISTS reminders_clans_end_time ON reminders_clans (end_time)",
+            "CREATE INDEX IF NOT EXISTS users_trade_daily_done ON users (trade_daily_done) WHERE trade_daily_done<>0",
+        ]
+    if db_version < 23:
+        sqls += [
+            "CREATE TABLE IF NOT EXISTS error_summaries (fingerprint TEXT PRIMARY KEY NOT NULL, error_type TEXT, "
+            "location TEXT, sample TEXT, count INTEGER NOT NULL DEFAULT 0, logged INTEGER NOT NULL DEFAULT 0, "
+            "first_seen DATETIME, last_seen DATETIME)",
+        ]
 
     # Run SQLs
     for sql in sqls:
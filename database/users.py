@@ -1,16 +1,28 @@
 # users.py
 """Provides access to the table "users" in the database"""
 
+from collections import OrderedDict
+import copy
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import date, datetime
 import sqlite3
-from typing import NamedTuple, Tuple
+from typing import Dict, NamedTuple, Optional, Set, Tuple
 
 from database import alts as alts_db
 from database import errors
 from resources import exceptions, settings, strings
 
 
+# Cache of the most recently used users. Contains the database record and the User object built from it.
+_USER_CACHE: OrderedDict = OrderedDict()
+_USER_CACHE_STATS = {'hits': 0, 'misses': 0}
+# Counts user writes. Queries run on the database thread, so a user can be changed while get_user waits for its
+# record. Records read during a write are not cached.
+_USER_WRITES = {'count': 0}
+# Ids of all users in the table. None until it is loaded. Kept up to date by insert_user and delete_user.
+_USER_IDS: Optional[Set[int]] = None
+
+
 # Containers
 class UserAlert(NamedTuple):
     """Object that summarizes all user settings for a specific alert"""
@@ -281,6 +293,7 @@ class User():
         alt_id: int
         """
         await alts_db.insert_alt(self.user_id, alt_id)
+        await _update_cached_alts(self.user_id, alt_id, add=True)
         await self.refresh()
         
     async def remove_alt(self, alt_id: int) -> None:
@@ -291,6 +304,7 @@ class User():
         alt_id: int
         """
         await alts_db.delete_alt(self.user_id, alt_id)
+        await _update_cached_alts(self.user_id, alt_id, add=False)
         await self.refresh()
         
     async def update(self, **kwargs) -> None:
@@ -778,9 +792,93 @@ async def _dict_to_user(record: dict) -> User:
     return user
 
 
+def _adapt_value(value):
+    """Converts a value to what sqlite returns when reading it back after writing it."""
+    if isinstance(value, bool): return int(value)
+    if isinstance(value, datetime): return value.isoformat(' ')
+    if isinstance(value, date): return value.isoformat()
+    return value
+
+
+async def _cache_record(record: dict) -> User:
+    """Creates a User object from a database record and adds both to the user cache.
+    If the cache is full, the least recently used users are removed.
+
+    Returns
+    -------
+    User object.
+
+    Raises
+    ------
+    LookupError if something goes wrong reading the dict. Also logs this error to the database.
+    """
+    user = await _dict_to_user(record)
+    _USER_CACHE[user.user_id] = (record, user)
+    _USER_CACHE.move_to_end(user.user_id)
+    while len(_USER_CACHE) > settings.USER_CACHE_SIZE:
+        _USER_CACHE.popitem(last=False)
+
+    return user
+
+
+async def _update_cached_user(user_id: int, columns: dict) -> None:
+    """Writes updated column values to a cached user. Does nothing if the user is not cached.
+
+    Arguments
+    ---------
+    user_id: int
+    columns: dict with column=value
+    """
+    _USER_WRITES['count'] += 1
+    cached_user = _USER_CACHE.get(user_id, None)
+    if cached_user is None: return
+    record, _ = cached_user
+    record = dict(record)
+    for column, value in columns.items():
+        record[column] = _adapt_value(value)
+    try:
+        await _cache_record(record)
+    except LookupError:
+        remove_user_from_cache(user_id)
+
+
+async def _update_cached_alts(user_id: int, alt_id: int, add: bool) -> None:
+    """Adds or removes an alt in the alt lists of both cached users.
+
+    Arguments
+    ---------
+    user_id: int
+    alt_id: int
+    add: True if the alt was added, False if it was removed
+    """
+    _USER_WRITES['count'] += 1
+    for cached_user_id, other_user_id in ((user_id, alt_id), (alt_id, user_id)):
+        cached_user = _USER_CACHE.get(cached_user_id, None)
+        if cached_user is None: continue
+        record, _ = cached_user
+        alts = tuple(alt for alt in record['alts'] if alt != other_user_id)
+        if add: alts += (other_user_id,)
+        await _update_cached_user(cached_user_id, {'alts': alts})
+
+
+def remove_user_from_cache(user_id: int) -> None:
+    """Removes a user from the user cache. Use this if a user record is changed without using this module."""
+    _USER_CACHE.pop(user_id, None)
+
+
+def get_cache_stats() -> Dict[str, int]:
+    """Returns size, capacity, hits and misses of the user cache"""
+    return {
+        'size': len(_USER_CACHE),
+        'capacity': settings.USER_CACHE_SIZE,
+        'hits': _USER_CACHE_STATS['hits'],
+        'misses': _USER_CACHE_STATS['misses'],
+    }
+
+
 # Get data
 async def get_user(user_id: int) -> User:
-    """Gets all user settings.
+    """Gets all user settings. Uses the user cache if the user is cached.
 
     Returns
     -------
@@ -793,13 +891,18 @@ async def get_user(user_id: int) -> User:
     LookupError if something goes wrong reading the dict.
     Also logs all errors to the database.
     """
+    cached_user = _USER_CACHE.get(user_id, None)
+    if cached_user is not None:
+        _USER_CACHE_STATS['hits'] += 1
+        _USER_CACHE.move_to_end(user_id)
+        return copy.copy(cached_user[1])
+    _USER_CACHE_STATS['misses'] += 1
+    user_writes = _USER_WRITES['count']
     table = 'users'
     function_name = 'get_user'
     sql = f'SELECT * FROM {table} WHERE user_id=?'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (user_id,))
-        record = cur.fetchone()
+        record = await settings.NAVI_DB.fetchone_async(sql, (user_id,))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -809,9 +912,10 @@ async def get_user(user_id: int) -> User:
         raise exceptions.FirstTimeUserError(f'No user data found in database for user "{user_id}".')
     record = dict(record)
     record['alts'] = await alts_db.get_alts(user_id)
-    user = await _dict_to_user(record)
+    if user_writes != _USER_WRITES['count']: return await _dict_to_user(record)
+    user = await _cache_record(record)
 
-    return user
+    return copy.copy(user)
 
 
 async def get_all_users() -> Tuple[User]:
@@ -832,9 +936,7 @@ async def get_all_users() -> Tuple[User]:
     function_name = 'get_all_users'
     sql = f'SELECT * FROM {table}'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql)
-        records = cur.fetchall()
+        records = await settings.NAVI_DB.fetchall_async(sql)
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -870,9 +972,7 @@ async def get_users_by_clan_name(clan_name: str) -> Tuple[User]:
     function_name = 'get_users_by_clan_name'
     sql = f'SELECT * FROM {table} WHERE clan_name=?'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, (clan_name,))
-        records = cur.fetchall()
+        records = await settings.NAVI_DB.fetchall_async(sql, (clan_name,))
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -905,9 +1005,7 @@ async def get_user_count() -> int:
     function_name = 'get_user_count'
     sql = f'SELECT COUNT(user_id) FROM {table}'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql)
-        record = cur.fetchone()
+        record = await settings.NAVI_DB.fetchone_async(sql)
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
@@ -918,9 +1016,40 @@ async def get_user_count() -> int:
     return user_count
 
 
+async def get_registered_user_ids() -> Set[int]:
+    """Gets the ids of all users in the table "users". Loads them on first use.
+
+    Returns
+    -------
+    Set with all user ids. Do not change it.
+
+    Raises
+    ------
+    sqlite3.Error if something happened within the database.
+    Also logs all errors to the database.
+    """
+    global _USER_IDS
+    if _USER_IDS is not None: return _USER_IDS
+    user_writes = _USER_WRITES['count']
+    table = 'users'
+    function_name = 'get_registered_user_ids'
+    sql = f'SELECT user_id FROM {table}'
+    try:
+        records = await settings.NAVI_DB.fetchall_async(sql)
+    except sqlite3.Error as error:
+        await errors.log_error(
+            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
+        )
+        raise
+    user_ids = {record['user_id'] for record in records}
+    if user_writes == _USER_WRITES['count'] and _USER_IDS is None: _USER_IDS = user_ids
+
+    return user_ids
+
+
 # Write Data
 async def _update_user(user: User, **kwargs) -> None:
-    """Updates user record. Use User.update() to trigger this function.
+    """Updates user record and the cached user. Use User.update() to trigger this function.
     If user_donor_tier is updated and a partner is set, the partner's partner_donor_tier is updated as well.
 
     Arguments
@@ -1151,24 +1280,48 @@ async def _update_user(user: User, **kwargs) -> None:
         )
         raise exceptions.NoArgumentsError('You need to specify at least one keyword argument.')
     try:
-        cur = settings.NAVI_DB.cursor()
         sql = f'UPDATE {table} SET'
         for kwarg in kwargs:
             sql = f'{sql} {kwarg} = :{kwarg},'
         sql = sql.strip(",")
         kwargs['user_id'] = user.user_id
         sql = f'{sql} WHERE user_id = :user_id'
-        cur.execute(sql, kwargs)
+        await _update_cached_user(user.user_id, kwargs)
+        await settings.NAVI_DB.execute_async(sql, kwargs)
         if 'user_donor_tier' in kwargs and user.partner_id is not None:
             partner = await get_user(user.partner_id)
             await partner.update(partner_donor_tier=kwargs['user_donor_tier'])
     except sqlite3.Error as error:
+        remove_user_from_cache(user.user_id)
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
         )
         raise
 
 
+async def reset_trade_daily_done() -> None:
+    """Sets trade_daily_done to 0 for all users with one UPDATE. Also updates all cached users.
+
+    Raises
+    ------
+    sqlite3.Error if something happened within the database.
+    Also logs all errors to the database.
+    """
+    table = 'users'
+    function_name = 'reset_trade_daily_done'
+    sql = f'UPDATE {table} SET trade_daily_done=0 WHERE trade_daily_done<>0'
+    try:
+        await settings.NAVI_DB.execute_async(sql)
+    except sqlite3.Error as error:
+        await errors.log_error(
+            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
+        )
+        raise
+    _USER_WRITES['count'] += 1
+    for user_id, (record, _) in list(_USER_CACHE.items()):
+        if record['trade_daily_done'] != 0: await _update_cached_user(user_id, {'trade_daily_done': 0})
+
+
 async def insert_user(user_id: int) -> User:
     """Inserts a record in the table "users".
 
@@ -1191,15 +1344,41 @@ async def insert_user(user_id: int) -> User:
     sql = f'INSERT INTO {table} (user_id{columns}) VALUES ('
     for value in values:
         sql = f'{sql}?,'
-    sql = f'{sql.strip(",")})'
+    sql = f'{sql.strip(",")}) RETURNING *'
     try:
-        cur = settings.NAVI_DB.cursor()
-        cur.execute(sql, values)
+        record = await settings.NAVI_DB.fetchone_async(sql, values)
     except sqlite3.Error as error:
         await errors.log_error(
             strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
         )
         raise
-    user = await get_user(user_id)
+    _USER_WRITES['count'] += 1
+    if _USER_IDS is not None: _USER_IDS.add(user_id)
+    record = dict(record)
+    record['alts'] = await alts_db.get_alts(user_id)
+    user = await _cache_record(record)
+
+    return copy.copy(user)
+
 
-    return user
\ No newline at end of file
+async def delete_user(user_id: int) -> None:
+    """Deletes a user record and removes the user from the user cache.
+
+    Raises
+    ------
+    sqlite3.Error if something happened within the database.
+    Also logs all errors to the database.
+    """
+    table = 'users'
+    function_name = 'delete_user'
+    sql = f'DELETE FROM {table} WHERE user_id=?'
+    try:
+        await settings.NAVI_DB.execute_async(sql, (user_id,))
+    except sqlite3.Error as error:
+        await errors.log_error(
+            strings.INTERNAL_ERROR_SQLITE3.format(error=error, table=table, function=function_name, sql=sql)
+        )
+        raise
+    _USER_WRITES['count'] += 1
+    if _USER_IDS is not None: _USER_IDS.discard(user_id)
+    remove_user_from_cache(user_id)
\ No newline at end of file
@@ -0,0 +1,174 @@
+# delivery.py
+"""Contains the delivery queue that sends outgoing messages per channel"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import discord
+
+from database import errors
+from resources import logs, settings
+
+
+MAX_MESSAGE_LENGTH = 2000
+
+# Lower values are sent first
+PRIORITY_REMINDER = 0
+PRIORITY_AUTO_FLEX = 1
+PRIORITY_TIP = 2
+
+
+class OutboundMessage(NamedTuple):
+    """Message waiting in the delivery queue"""
+    priority: int
+    sequence: int
+    content: Optional[str]
+    embed: Optional[discord.Embed]
+    queued_at: float # time.monotonic()
+    delivered: asyncio.Future # Result is True once the message was sent, False if it was dropped
+
+
+class DeliveryQueue():
+    """Holds outgoing messages in one queue per channel, ordered by priority.
+    Every channel has a worker task that waits a short moment after the first message arrives, so messages that are
+    due at about the same time can be combined, then sends the queued messages with as few sends as possible within
+    the message length limit. Sends to a channel are spaced out, so busy channels don't run into rate limits. The
+    worker ends when its queue is empty.
+
+    Messages with an embed are never combined.
+    enqueue returns a future that is set to True when the message was sent and to False if it couldn't be sent.
+    """
+    def __init__(self, coalesce_window: float, channel_interval: float) -> None:
+        """
+        Arguments
+        ---------
+        coalesce_window: Seconds a worker waits for more messages before its first send
+        channel_interval: Minimum seconds between two sends to the same channel
+        """
+        self.coalesce_window = coalesce_window
+        self.channel_interval = channel_interval
+        self._queues: Dict[int, List[OutboundMessage]] = {}
+        self._channels: Dict[int, discord.abc.Messageable] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._counter = itertools.count()
+        self.stats: Dict[str, Any] = {
+            'queued': 0,
+            'delivered': 0,
+            'sends': 0,
+            'failed': 0,
+            'lag_last': 0.0,
+            'lag_max': 0.0,
+            'lag_total': 0.0,
+        }
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def enqueue(self, channel: discord.abc.Messageable, content: Optional[str] = None,
+                embed: Optional[discord.Embed] = None, priority: int = PRIORITY_REMINDER) -> asyncio.Future:
+        """Adds a message to the queue of its channel and starts the worker of the channel if necessary.
+
+        Returns
+        -------
+        Future that is set to True when the message was sent and to False if it couldn't be sent. Empty messages
+        are not queued and return False right away.
+        """
+        loop = asyncio.get_running_loop()
+        delivered = loop.create_future()
+        if not content and embed is None:
+            delivered.set_result(False)
+            return delivered
+        outbound_message = OutboundMessage(priority, next(self._counter), content, embed, time.monotonic(), delivered)
+        heapq.heappush(self._queues.setdefault(channel.id, []), outbound_message)
+        self._channels[channel.id] = channel
+        self.stats['queued'] += 1
+        if channel.id not in self._workers:
+            self._workers[channel.id] = loop.create_task(self._run(channel.id))
+        return delivered
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Returns queue depth, active channels, delivered and failed messages, sends and the delivery lag in seconds"""
+        delivered = self.stats['delivered']
+        return {
+            'depth': len(self),
+            'channels': len(self._workers),
+            'queued': self.stats['queued'],
+            'delivered': delivered,
+            'sends': self.stats['sends'],
+            'failed': self.stats['failed'],
+            'lag_last': self.stats['lag_last'],
+            'lag_max': self.stats['lag_max'],
+            'lag_average': self.stats['lag_total'] / delivered if delivered else 0.0,
+        }
+
+    def _pop_batch(self, channel_id: int) -> List[OutboundMessage]:
+        """Removes and returns the messages for the next send of a channel: either one message with an embed or as
+        many text messages as fit into one message, in order of priority."""
+        queue = self._queues[channel_id]
+        batch = [heapq.heappop(queue)]
+        if batch[0].embed is not None: return batch
+        length = len(batch[0].content)
+        while queue and queue[0].embed is None and length + 1 + len(queue[0].content) <= MAX_MESSAGE_LENGTH:
+            outbound_message = heapq.heappop(queue)
+            length += 1 + len(outbound_message.content)
+            batch.append(outbound_message)
+        return batch
+
+    def _set_delivered(self, outbound_messages: List[OutboundMessage], delivered: bool) -> None:
+        for outbound_message in outbound_messages:
+            if not outbound_message.delivered.done(): outbound_message.delivered.set_result(delivered)
+
+    async def _run(self, channel_id: int) -> None:
+        """Sends all queued messages of a channel"""
+        channel = self._channels[channel_id]
+        try:
+            await asyncio.sleep(self.coalesce_window)
+            last_send = 0.0
+            while self._queues.get(channel_id):
+                wait_time = last_send + self.channel_interval - time.monotonic()
+                if wait_time > 0: await asyncio.sleep(wait_time)
+                batch = self._pop_batch(channel_id)
+                last_send = time.monotonic()
+                try:
+                    if batch[0].embed is not None:
+                        await channel.send(content=batch[0].content, embed=batch[0].embed)
+                    else:
+                        await channel.send('\n'.join(outbound_message.content for outbound_message in batch))
+                except discord.errors.Forbidden:
+                    dropped_messages = batch + self._queues[channel_id]
+                    self._queues[channel_id].clear()
+                    self._set_delivered(dropped_messages, False)
+                    self.stats['failed'] += len(dropped_messages)
+                    logs.logger.warning(
+                        f'Delivery queue: Missing permissions for channel {channel_id}, dropped '
+                        f'{len(dropped_messages)} messages.'
+                    )
+                    break
+                except Exception as error:
+                    self._set_delivered(batch, False)
+                    self.stats['failed'] += len(batch)
+                    await errors.log_error(error)
+                    continue
+                self._set_delivered(batch, True)
+                sent_time = time.monotonic()
+                self.stats['sends'] += 1
+                self.stats['delivered'] += len(batch)
+                for outbound_message in batch:
+                    lag = sent_time - outbound_message.queued_at
+                    self.stats['lag_total'] += lag
+                    if lag > self.stats['lag_max']: self.stats['lag_max'] = lag
+                self.stats['lag_last'] = sent_time - batch[-1].queued_at
+        finally:
+            del self._workers[channel_id]
+            self._channels.pop(channel_id, None)
+            queue = self._queues.pop(channel_id, [])
+            if queue:
+                self._set_delivered(queue, False)
+                self.stats['failed'] += len(queue)
+                logs.logger.error(f'Delivery queue: Dropped {len(queue)} messages to channel {channel_id}.')
+
+
+delivery_queue = DeliveryQueue(settings.DELIVERY_COALESCE_WINDOW, settings.DELIVERY_CHANNEL_INTERVAL)
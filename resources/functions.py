@@ -1,6 +1,7 @@
 # functions.py
 
 from argparse import ArgumentError
+import asyncio
 from datetime import datetime, timedelta
 import re
 from typing import Dict, List, Optional, Union
@@ -14,6 +15,12 @@ from database import settings as settings_db
 from resources import emojis, exceptions, settings, strings
 
 
+# Ids of Navi's application commands by name. Built by build_navi_command_ids.
+_NAVI_COMMAND_IDS: Dict[str, int] = {}
+# Auto ready calls that wait for AUTO_READY_DELAY to pass, by user id
+_PENDING_READY_COMMANDS: Dict[int, asyncio.Task] = {}
+
+
 # --- Get discord data ---
 async def get_interaction(message: discord.Message) -> discord.Interaction:
     """Returns the interaction object if the message was triggered by a slash command. Returns None if no user was found."""
@@ -144,27 +151,22 @@ async def get_match_from_patterns(patterns: List[str], string: str) -> re.Match:
 
 # --- Time calculations ---
 async def get_guild_member_by_name(guild: discord.Guild, user_name: str) -> List[discord.Member]:
-    """Returns all guild members found by the given name"""
-    members = []
-    for member in guild.members:
-        if await encode_text(member.name) == await encode_text(user_name) and not member.bot:
-            try:
-                await users.get_user(member.id)
-            except exceptions.FirstTimeUserError:
-                continue
-            members.append(member)
-    return members
+    """Returns all registered guild members found by the given name"""
+    from cache import members as members_cache
+    registered_user_ids = await users.get_registered_user_ids()
+    return [member for member in members_cache.get_members_by_name(guild, user_name)
+            if member.id in registered_user_ids]
 
 
 async def calculate_time_left_from_cooldown(message: discord.Message, user_settings: users.User, activity: str) -> timedelta:
     """Returns the time left for a reminder based on a cooldown."""
     slash_command = True if message.interaction is not None else False
-    cooldown: cooldowns.Cooldown = await cooldowns.get_cooldown(activity)
+    cooldown: cooldowns.CachedCooldown = await cooldowns.get_cached_cooldown(activity)
     bot_answer_time = message.created_at.replace(microsecond=0, tzinfo=None)
     current_time = datetime.utcnow().replace(microsecond=0)
     time_elapsed = current_time - bot_answer_time
     user_donor_tier = 3 if user_settings.user_donor_tier > 3 else user_settings.user_donor_tier
-    actual_cooldown = cooldown.actual_cooldown_slash() if slash_command else cooldown.actual_cooldown_mention()
+    actual_cooldown = cooldown.actual_cooldown_slash if slash_command else cooldown.actual_cooldown_mention
     if activity in strings.POCKET_WATCH_AFFECTED_ACTIVITIES:
         pocket_watch_multiplier = user_settings.user_pocket_watch_multiplier
     else:
@@ -968,9 +970,27 @@ async def get_farm_command(user_settings: users.User, include_prefix: Optional[b
 
 # Miscellaneous
 async def call_ready_command(bot: commands.Bot, message: discord.Message, user: discord.User) -> None:
-    """Calls the ready command as a reply to the current message"""
-    command = bot.get_application_command(name='ready')
-    if command is not None: await command.callback(command.cog, message, user=user)
+    """Calls the ready command as a reply to the current message.
+    The ready command runs in its own task after settings.AUTO_READY_DELAY seconds. If this is called again for the
+    same user before the ready message is sent, the pending call is cancelled, so a burst of commands results in one
+    ready message with the latest state."""
+    pending_task = _PENDING_READY_COMMANDS.get(user.id, None)
+    if pending_task is not None: pending_task.cancel()
+    _PENDING_READY_COMMANDS[user.id] = asyncio.ensure_future(_call_ready_command_delayed(bot, message, user))
+
+
+async def _call_ready_command_delayed(bot: commands.Bot, message: discord.Message, user: discord.User) -> None:
+    """Waits for AUTO_READY_DELAY to pass, then calls the ready command. Use call_ready_command.
+    The task isn't awaited by anyone, so errors of the ready command are logged here."""
+    try:
+        await asyncio.sleep(settings.AUTO_READY_DELAY)
+        command = bot.get_application_command(name='ready')
+        if command is not None: await command.callback(command.cog, message, user=user)
+    except Exception as error:
+        await errors.log_error(error, message)
+    finally:
+        if _PENDING_READY_COMMANDS.get(user.id, None) is asyncio.current_task():
+            del _PENDING_READY_COMMANDS[user.id]
 
 
 async def get_slash_command(user_settings: users.User, command_name: str, include_prefix: Optional[bool] = True) -> str:
@@ -983,12 +1003,22 @@ async def get_slash_command(user_settings: users.User, command_name: str, includ
         return f'`{command}`' if include_prefix else f'`{command.replace("rpg ", "")}`'
 
 
+def build_navi_command_ids(bot: discord.Bot) -> None:
+    """Rebuilds the table with the ids of Navi's application commands by name. Called when the bot is ready."""
+    _NAVI_COMMAND_IDS.clear()
+    for command in bot.application_commands:
+        if command.id is not None: _NAVI_COMMAND_IDS.setdefault(command.name, command.id)
+
+
 async def get_navi_slash_command(bot: discord.Bot, command_name: str) -> str:
     """Gets a slash command from Navi. If found, returns the slash mention. If not found, just returns /command.
     Note that slash mentions only work with GLOBAL commands."""
     main_command, *sub_commands = command_name.lower().split(' ')
+    command_id = _NAVI_COMMAND_IDS.get(main_command, None)
+    if command_id is not None: return f'</{command_name}:{command_id}>'
     for command in bot.application_commands:
         if command.name == main_command:
+            if command.id is not None: _NAVI_COMMAND_IDS[main_command] = command.id
             return f'</{command_name}:{command.id}>'
     return f'`/{command_name}`'
 
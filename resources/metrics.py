@@ -0,0 +1,143 @@
+# metrics.py
+"""Contains histograms and counters that record where the bot spends its time.
+
+Every metric has a name and one histogram or counter per label, e.g. one histogram per cog for the handler duration.
+Histograms have fixed buckets and only store the count per bucket, the sum and the maximum, so recording a value is
+cheap and memory doesn't grow over time.
+
+The values can be shown with /dev stats and are written to a file in the Prometheus text format.
+This module only uses the standard library, so the database connection can use it.
+"""
+
+import bisect
+import os
+from typing import Dict, List, NamedTuple, Tuple
+
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Metric(NamedTuple):
+    """Name, label name and description of a metric"""
+    name: str
+    label: str
+    description: str
+
+
+HANDLER_DURATION = Metric('navi_handler_duration_seconds', 'cog', 'Time the on_message handler of a cog took')
+SQL_DURATION = Metric('navi_sql_duration_seconds', 'function',
+                      'Time a database call took, including the wait for the database thread')
+REMINDER_DELAY = Metric('navi_reminder_delay_seconds', 'type', 'Time between the end time of a reminder and firing it')
+EVENT_LOOP_LAG = Metric('navi_event_loop_lag_seconds', 'loop', 'Time a scheduled callback waited for the event loop')
+MESSAGE_CACHE_LOOKUPS = Metric('navi_message_cache_lookups_total', 'result',
+                               'Message cache lookups by result (hit, wait or miss)')
+
+HISTOGRAM_METRICS = (HANDLER_DURATION, SQL_DURATION, REMINDER_DELAY, EVENT_LOOP_LAG)
+COUNTER_METRICS = (MESSAGE_CACHE_LOOKUPS,)
+
+
+class Histogram():
+    """Histogram with the buckets in BUCKETS"""
+    def __init__(self) -> None:
+        self.bucket_counts: List[int] = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """Records a value"""
+        self.bucket_counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max: self.max = value
+
+    @property
+    def average(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, quantile: float) -> float:
+        """Returns the upper bound of the bucket the quantile falls into. Values above the last bucket return the
+        maximum."""
+        if not self.count: return 0.0
+        rank = quantile * self.count
+        cumulative_count = 0
+        for bucket, bucket_count in zip(BUCKETS, self.bucket_counts):
+            cumulative_count += bucket_count
+            if cumulative_count >= rank: return min(bucket, self.max)
+        return self.max
+
+
+_HISTOGRAMS: Dict[str, Dict[str, Histogram]] = {metric.name: {} for metric in HISTOGRAM_METRICS}
+_COUNTERS: Dict[str, Dict[str, int]] = {metric.name: {} for metric in COUNTER_METRICS}
+
+
+def observe(metric: Metric, label: str, value: float) -> None:
+    """Records a value in the histogram of a metric and label"""
+    histograms = _HISTOGRAMS[metric.name]
+    histogram = histograms.get(label, None)
+    if histogram is None: histogram = histograms[label] = Histogram()
+    histogram.observe(value)
+
+
+def increase(metric: Metric, label: str, amount: int = 1) -> None:
+    """Increases the counter of a metric and label"""
+    counters = _COUNTERS[metric.name]
+    counters[label] = counters.get(label, 0) + amount
+
+
+def reset() -> None:
+    """Removes all recorded values"""
+    for histograms in _HISTOGRAMS.values():
+        histograms.clear()
+    for counters in _COUNTERS.values():
+        counters.clear()
+
+
+def get_histograms(metric: Metric) -> Dict[str, Histogram]:
+    """Returns the histograms of all labels of a metric"""
+    return _HISTOGRAMS[metric.name]
+
+
+def get_counters(metric: Metric) -> Dict[str, int]:
+    """Returns the counters of all labels of a metric"""
+    return _COUNTERS[metric.name]
+
+
+def get_top_histograms(metric: Metric, amount: int) -> List[Tuple[str, Histogram]]:
+    """Returns the labels and histograms of a metric with the highest total time"""
+    return sorted(_HISTOGRAMS[metric.name].items(), key=lambda item: item[1].sum, reverse=True)[:amount]
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus() -> str:
+    """Returns all metrics in the Prometheus text format"""
+    lines = []
+    for metric in HISTOGRAM_METRICS:
+        lines.append(f'# HELP {metric.name} {metric.description}')
+        lines.append(f'# TYPE {metric.name} histogram')
+        for label, histogram in sorted(_HISTOGRAMS[metric.name].items()):
+            label_value = f'{metric.label}="{_escape_label(label)}"'
+            cumulative_count = 0
+            for bucket, bucket_count in zip(BUCKETS, histogram.bucket_counts):
+                cumulative_count += bucket_count
+                lines.append(f'{metric.name}_bucket{{{label_value},le="{bucket}"}} {cumulative_count}')
+            lines.append(f'{metric.name}_bucket{{{label_value},le="+Inf"}} {histogram.count}')
+            lines.append(f'{metric.name}_sum{{{label_value}}} {histogram.sum}')
+            lines.append(f'{metric.name}_count{{{label_value}}} {histogram.count}')
+    for metric in COUNTER_METRICS:
+        lines.append(f'# HELP {metric.name} {metric.description}')
+        lines.append(f'# TYPE {metric.name} counter')
+        for label, count in sorted(_COUNTERS[metric.name].items()):
+            lines.append(f'{metric.name}{{{metric.label}="{_escape_label(label)}"}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_file(file_name: str, text: str) -> None:
+    """Writes the rendered metrics to a file. The file is replaced at once, so readers never see a partial file."""
+    temp_file_name = f'{file_name}.tmp'
+    with open(temp_file_name, 'w', encoding='utf-8') as metrics_file:
+        metrics_file.write(text)
+    os.replace(temp_file_name, file_name)
@@ -0,0 +1,105 @@
+# scheduler.py
+"""Contains the reminder scheduler that fires all scheduled reminders from one timer"""
+
+import asyncio
+from datetime import datetime
+import heapq
+import itertools
+from typing import Any, Callable, Coroutine, Dict, List, Optional
+
+from resources import logs
+
+
+class ReminderScheduler():
+    """Holds all reminders that are about to fire in a heap ordered by end time.
+    One loop sleeps until the next reminder is due, so there is no task per reminder and no polling.
+    Scheduling and rescheduling are O(log n), cancelling is O(1). Cancelled entries stay in the heap until they
+    reach the top or the heap gets compacted.
+
+    Reminders are identified by their task_name. All reminders that are due at the same time are passed to the
+    callback together.
+    """
+    def __init__(self) -> None:
+        self._heap: List[list] = []
+        self._entries: Dict[str, list] = {}
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._callback: Optional[Callable[[List[Any]], Coroutine]] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, task_name: str) -> bool:
+        return task_name in self._entries
+
+    def schedule(self, reminder) -> None:
+        """Schedules a reminder at its end time. If a reminder with the same task name is already scheduled, it is
+        replaced."""
+        self.cancel(reminder.task_name)
+        entry = [reminder.end_time, next(self._counter), reminder]
+        self._entries[reminder.task_name] = entry
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry and self._wakeup is not None: self._wakeup.set()
+
+    def cancel(self, task_name: str) -> None:
+        """Removes a scheduled reminder. Does nothing if the reminder isn't scheduled."""
+        entry = self._entries.pop(task_name, None)
+        if entry is None: return
+        entry[-1] = None
+        if len(self._heap) > 100 and len(self._heap) > len(self._entries) * 2:
+            self._heap = [heap_entry for heap_entry in self._heap if heap_entry[-1] is not None]
+            heapq.heapify(self._heap)
+
+    def pop_due_reminders(self, current_time: datetime) -> List[Any]:
+        """Removes and returns all reminders with an end time up to current_time"""
+        due_reminders = []
+        while self._heap and self._heap[0][0] <= current_time:
+            end_time, _, reminder = heapq.heappop(self._heap)
+            if reminder is None: continue
+            del self._entries[reminder.task_name]
+            due_reminders.append(reminder)
+        return due_reminders
+
+    def get_next_end_time(self) -> Optional[datetime]:
+        """Returns the end time of the next scheduled reminder or None if nothing is scheduled"""
+        while self._heap and self._heap[0][-1] is None:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def start(self, callback: Callable[[List[Any]], Coroutine]) -> None:
+        """Starts the timer loop. Does nothing if it is already running.
+
+        Arguments
+        ---------
+        callback: Coroutine function that gets called with a list of all reminders that are due
+        """
+        self._callback = callback
+        if self._loop_task is not None and not self._loop_task.done(): return
+        self._wakeup = asyncio.Event()
+        self._loop_task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        """Stops the timer loop. Scheduled reminders are kept."""
+        if self._loop_task is not None: self._loop_task.cancel()
+        self._loop_task = None
+
+    async def _run(self) -> None:
+        """Sleeps until the next reminder is due or a reminder is scheduled earlier, then fires all due reminders"""
+        while True:
+            self._wakeup.clear()
+            due_reminders = self.pop_due_reminders(datetime.utcnow())
+            if due_reminders:
+                try:
+                    await self._callback(due_reminders)
+                except Exception as error:
+                    logs.logger.error(f'Reminder scheduler: Error firing reminders: {error}')
+                continue
+            next_end_time = self.get_next_end_time()
+            timeout = None
+            if next_end_time is not None:
+                timeout = max((next_end_time - datetime.utcnow()).total_seconds(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -8,19 +8,30 @@ from typing import NamedTuple
 
 from dotenv import load_dotenv
 
+from database.connection import NaviConnection
+
 
 ENV_VARIABLE_MISSING = (
     'Required setting {var} in the .env file is missing. Please check your default.env file and update your .env file '
     'accordingly.'
 )
 
-NAVI_DB_VERSION = 17
+NAVI_DB_VERSION = 23
+SQLITE_MIN_VERSION = (3, 35, 0) # Needed for INSERT and DELETE with RETURNING
+
+if sqlite3.sqlite_version_info < SQLITE_MIN_VERSION:
+    print(
+        f'Navi needs SQLite {".".join(str(number) for number in SQLITE_MIN_VERSION)} or higher. Your Python uses '
+        f'SQLite {sqlite3.sqlite_version}. Please update SQLite or use a Python version that includes a newer one.'
+    )
+    sys.exit()
 
 # Files and directories
 BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DB_FILE = os.path.join(BOT_DIR, 'database/navi_db.db')
+DB_FILE = os.getenv('NAVI_DB_FILE', os.path.join(BOT_DIR, 'database/navi_db.db')) # Set by benchmark.replay
 if os.path.isfile(DB_FILE):
-    NAVI_DB = sqlite3.connect(DB_FILE, isolation_level=None, detect_types=sqlite3.PARSE_DECLTYPES)
+    NAVI_DB = sqlite3.connect(DB_FILE, isolation_level=None, detect_types=sqlite3.PARSE_DECLTYPES,
+                              check_same_thread=False, factory=NaviConnection)
 else:
     print(f'Database {DB_FILE} does not exist. Please follow the setup instructions in the README first.')
     sys.exit()
@@ -28,6 +39,7 @@ NAVI_DB.row_factory = sqlite3.Row
 LOG_FILE = os.path.join(BOT_DIR, 'logs/discord.log')
 IMG_NAVI = os.path.join(BOT_DIR, 'images/navi.png')
 VERSION_FILE = os.path.join(BOT_DIR, 'VERSION')
+METRICS_FILE = os.path.join(BOT_DIR, 'logs/metrics.prom')
 
 
 # Load .env variables
@@ -50,6 +62,25 @@ except:
 
 DEBUG_MODE = True if os.getenv('DEBUG_MODE') == 'ON' else False
 
+DB_WRITE_BEHIND = True if os.getenv('DB_WRITE_BEHIND') == 'ON' else False
+DB_WRITE_BEHIND_DELAY = 0.005 # Seconds writes are held back to be committed together
+if DB_WRITE_BEHIND: NAVI_DB.write_behind_delay = DB_WRITE_BEHIND_DELAY
+
+# Database profile. The database runs in WAL mode with these pragmas on both the write and the read connection.
+DB_CACHE_SIZE = 65536 # KiB of page cache per connection
+DB_MMAP_SIZE = 268435456 # Bytes of the database file that are memory mapped
+DB_JOURNAL_SIZE_LIMIT = 67108864 # Bytes the WAL file is truncated to after a checkpoint
+DB_CHECKPOINT_INTERVAL = 300 # Seconds between WAL checkpoints
+DB_VACUUM_STEP_PAGES = 1000 # Pages freed per incremental vacuum step
+DB_PRAGMAS = [
+    'PRAGMA synchronous=NORMAL',
+    f'PRAGMA cache_size=-{DB_CACHE_SIZE}',
+    f'PRAGMA mmap_size={DB_MMAP_SIZE}',
+    'PRAGMA temp_store=MEMORY',
+]
+NAVI_DB.apply_profile(DB_PRAGMAS + [f'PRAGMA journal_size_limit={DB_JOURNAL_SIZE_LIMIT}',])
+NAVI_DB.open_read_connection(DB_FILE, DB_PRAGMAS, detect_types=sqlite3.PARSE_DECLTYPES)
+
 DEV_IDS = os.getenv('DEV_IDS')
 if DEV_IDS is None or DEV_IDS == '':
     DEV_IDS = []
@@ -113,6 +144,28 @@ if SUGGESTION_CHANNEL_ID != '' and SUGGESTION_CHANNEL_ID is not None:
 else:
     SUGGESTION_CHANNEL_ID = None
 
+USER_CACHE_SIZE = os.getenv('USER_CACHE_SIZE')
+if USER_CACHE_SIZE != '' and USER_CACHE_SIZE is not None:
+    try:
+        USER_CACHE_SIZE = int(USER_CACHE_SIZE.strip('" '))
+    except:
+        print(f'User cache size "{USER_CACHE_SIZE}" in the .env variable USER_CACHE_SIZE is not a number.')
+        sys.exit()
+else:
+    USER_CACHE_SIZE = 5000
+
+MESSAGE_CACHE_MAX_SIZE = os.getenv('MESSAGE_CACHE_MAX_SIZE')
+if MESSAGE_CACHE_MAX_SIZE != '' and MESSAGE_CACHE_MAX_SIZE is not None:
+    try:
+        MESSAGE_CACHE_MAX_SIZE = int(MESSAGE_CACHE_MAX_SIZE.strip('" ')) * 1024 * 1024
+    except:
+        print(
+            f'Message cache size "{MESSAGE_CACHE_MAX_SIZE}" in the .env variable MESSAGE_CACHE_MAX_SIZE is not a number.'
+        )
+        sys.exit()
+else:
+    MESSAGE_CACHE_MAX_SIZE = 32 * 1024 * 1024
+
 
 # Read bot version
 _version_file = open(VERSION_FILE, 'r')
@@ -128,6 +181,16 @@ TESTY_ID = 1050765002950332456 # Miriel's test bot to test triggers
 
 DEFAULT_PREFIX = 'navi '
 
+REMINDER_SCHEDULE_HORIZON = 90 # Reminders due within this amount of seconds are held in memory and fired from there
+DELIVERY_COALESCE_WINDOW = 0.5 # Seconds outgoing messages to a channel are collected before they are sent together
+DELIVERY_CHANNEL_INTERVAL = 1 # Minimum seconds between two sends to the same channel
+AUTO_READY_DELAY = 1.5 # Seconds auto ready waits for further commands of a user before sending one ready message
+METRICS_FILE_INTERVAL = 60 # Seconds between two writes of the metrics file
+METRICS_LOOP_LAG_INTERVAL = 1 # Seconds between two event loop lag measurements
+ERROR_RATE_LIMIT = 5 # Errors with the same fingerprint that are logged in full within one rate limit window
+ERROR_RATE_WINDOW = 60 # Seconds of the error rate limit window
+ERROR_FLUSH_DELAY = 5 # Seconds errors are collected before they are written to the database together
+
 TIMEOUT = 20
 TIMEOUT_LONGER = 30
 TIMEOUT_LONGEST = 40